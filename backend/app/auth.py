@@ -0,0 +1,232 @@
+"""
+Authentication.
+
+Access tokens are HS256 JWTs carrying the user id. Resolving a token to a
+``Principal`` normally needs a signature check and a ``users`` read; both are
+skipped for tokens seen recently thanks to a per-process TTL cache, so
+authenticated dashboard polling costs no database round trip. Entries live
+for at most ``AUTH_CACHE_TTL_SECONDS`` and never past the token's own expiry,
+and every entry of a user is dropped once a transaction that changed their
+``role``, ``permissions`` or ``is_active`` through the ORM commits in this
+process (other workers pick the change up within the TTL). Dropping them at
+flush would let a lookup between flush and commit re-cache the old values.
+Changes made with bulk UPDATE statements must call ``invalidate_user``
+themselves.
+
+bcrypt is deliberately slow, so hashing and verification run in the thread
+pool behind a semaphore of ``AUTH_HASH_CONCURRENCY`` slots: a login burst
+queues on the semaphore instead of stalling the event loop or taking every
+thread from other ``run_in_threadpool`` callers.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set, Tuple
+from uuid import UUID
+
+import bcrypt
+from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import object_session
+
+from app.config import settings
+from app.database import after_commit, read_session
+from app.models import User
+
+# Attributes that change what a principal may do
+PRINCIPAL_ATTRIBUTES = ("role", "permissions", "is_active")
+
+# Verified against when the email is unknown, so both paths cost one bcrypt check
+_DUMMY_HASH = b"$2b$12$4FemnpxDny4pIydCgpf11Oa78mNlYBWv4xqj4JeiSqSpt4fiSuF3m"
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: UUID
+    email: str
+    name: str
+    role: str
+    permissions: Tuple[str, ...]
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(user.id, user.email, user.name, user.role or "viewer", tuple(user.permissions or ()))
+
+
+class PrincipalCache:
+    """LRU of token -> (principal, expiry), with a reverse index by user id."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self.tokens_by_user: Dict[UUID, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self.entries.get(token)
+        if entry is None:
+            return None
+        principal, expires = entry
+        if expires <= time.monotonic():
+            self._drop(token)
+            return None
+        self.entries.move_to_end(token)
+        return principal
+
+    def put(self, token: str, principal: Principal, ttl: float):
+        self.entries[token] = (principal, time.monotonic() + ttl)
+        self.entries.move_to_end(token)
+        self.tokens_by_user.setdefault(principal.id, set()).add(token)
+        while len(self.entries) > self.size:
+            self._drop(next(iter(self.entries)))
+
+    def invalidate(self, user_id: UUID):
+        for token in self.tokens_by_user.pop(user_id, ()):
+            self.entries.pop(token, None)
+
+    def _drop(self, token: str):
+        principal, _ = self.entries.pop(token)
+        tokens = self.tokens_by_user.get(principal.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self.tokens_by_user[principal.id]
+
+
+principals = PrincipalCache(settings.AUTH_CACHE_SIZE)
+
+
+def invalidate_user(user_id: UUID):
+    principals.invalidate(user_id)
+
+
+@event.listens_for(User, "after_update")
+def _invalidate_on_change(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in PRINCIPAL_ATTRIBUTES):
+        user_id = target.id
+        after_commit(object_session(target), lambda: invalidate_user(user_id))
+
+
+# Passwords
+
+_hash_slots: Optional[asyncio.Semaphore] = None
+
+
+def _slots() -> asyncio.Semaphore:
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = asyncio.Semaphore(settings.AUTH_HASH_CONCURRENCY)
+    return _hash_slots
+
+
+def _secret(password: str) -> bytes:
+    return password.encode("utf-8")[:72]  # bcrypt ignores anything longer
+
+
+async def hash_password(password: str) -> str:
+    async with _slots():
+        hashed = await run_in_threadpool(bcrypt.hashpw, _secret(password), bcrypt.gensalt(settings.AUTH_BCRYPT_ROUNDS))
+    return hashed.decode("ascii")
+
+
+async def verify_password(password: str, hashed: Optional[str]) -> bool:
+    async with _slots():
+        try:
+            matches = await run_in_threadpool(
+                bcrypt.checkpw, _secret(password), hashed.encode("ascii") if hashed else _DUMMY_HASH
+            )
+        except ValueError:  # malformed stored hash
+            return False
+    return matches and hashed is not None
+
+
+# Tokens
+
+def create_access_token(user: User) -> Tuple[str, int]:
+    """Signed token for a user and its lifetime in seconds."""
+    expires_in = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    now = datetime.now(timezone.utc)
+    claims = {"sub": str(user.id), "iat": now, "exp": now + timedelta(seconds=expires_in)}
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM), expires_in
+
+
+_UNAUTHORIZED = HTTPException(
+    status_code=401,
+    detail="Invalid or expired token",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+def token_user_id(token: str) -> Optional[UUID]:
+    """User a token was issued to, if its signature and expiry check out. Identifies, does not authorize."""
+    principal = principals.get(token)
+    if principal is not None:
+        return principal.id
+    try:
+        return UUID(jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])["sub"])
+    except (JWTError, KeyError, ValueError):
+        return None
+
+
+async def resolve_token(token: str) -> Principal:
+    """Principal for a token, from the cache or by verifying and loading the user."""
+    principal = principals.get(token)
+    if principal is not None:
+        return principal
+
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        user_id = UUID(claims["sub"])
+        expires_at = float(claims["exp"])
+    except (JWTError, KeyError, ValueError):
+        raise _UNAUTHORIZED
+
+    async with read_session() as db:
+        user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+    if user is None or not user.is_active:
+        raise _UNAUTHORIZED
+
+    principal = Principal.from_user(user)
+    ttl = min(settings.AUTH_CACHE_TTL_SECONDS, expires_at - time.time())
+    if ttl > 0:
+        principals.put(token, principal, ttl)
+    return principal
+
+
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+) -> Principal:
+    """Dependency for routes that always need a signed-in user."""
+    if credentials is None:
+        raise _UNAUTHORIZED
+    return await resolve_token(credentials.credentials)
+
+
+async def require_auth(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+) -> Optional[Principal]:
+    """Router-wide dependency: enforced only when AUTH_REQUIRED is set."""
+    if not settings.AUTH_REQUIRED:
+        return None
+    if credentials is None:
+        raise _UNAUTHORIZED
+    return await resolve_token(credentials.credentials)
+
+
+def require_role(*roles: str):
+    """Dependency factory rejecting principals outside ``roles``."""
+
+    async def check(principal: Principal = Depends(get_current_user)) -> Principal:
+        if principal.role not in roles:
+            raise HTTPException(status_code=403, detail="Insufficient role")
+        return principal
+
+    return check
@@ -1,30 +1,106 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from datetime import datetime
+from typing import Callable, Optional, Union
+import structlog
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, declarative_base
 from sqlalchemy.pool import NullPool
 from app.config import settings
 
-# Create async engine
-engine = create_async_engine(
+logger = structlog.get_logger()
+
+
+def _create_engine(url: str, pool_size: int, max_overflow: int):
+    return create_async_engine(
+        url,
+        echo=settings.DEBUG,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+    )
+
+
+def _create_session_factory(bind):
+    return async_sessionmaker(
+        bind,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autocommit=False,
+        autoflush=False,
+    )
+
+
+# Engines are sized independently so a burst on one path cannot starve the others
+# of pool connections.
+
+# API traffic: dashboards and CRUD
+engine = _create_engine(
+    settings.DATABASE_URL,
+    settings.DATABASE_POOL_SIZE,
+    settings.DATABASE_MAX_OVERFLOW,
+)
+
+# Telemetry ingest
+ingest_engine = _create_engine(
+    settings.DATABASE_URL,
+    settings.DATABASE_INGEST_POOL_SIZE,
+    settings.DATABASE_INGEST_MAX_OVERFLOW,
+)
+
+# Compaction, rollups and other background jobs
+background_engine = _create_engine(
     settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    pool_size=settings.DATABASE_POOL_SIZE,
-    max_overflow=settings.DATABASE_MAX_OVERFLOW,
-    pool_pre_ping=True,
+    settings.DATABASE_BACKGROUND_POOL_SIZE,
+    settings.DATABASE_BACKGROUND_MAX_OVERFLOW,
 )
 
-# Create async session factory
-async_session = async_sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False,
+# Read-only traffic, routed to a replica when one is configured
+read_engine = (
+    _create_engine(
+        settings.DATABASE_READ_URL,
+        settings.DATABASE_READ_POOL_SIZE,
+        settings.DATABASE_READ_MAX_OVERFLOW,
+    )
+    if settings.DATABASE_READ_URL
+    else engine
 )
 
+# Create async session factories
+async_session = _create_session_factory(engine)
+read_session = _create_session_factory(read_engine)
+ingest_session = _create_session_factory(ingest_engine)
+background_session = _create_session_factory(background_engine)
+
 # Base class for models
 Base = declarative_base()
 
 
+def after_commit(session: Union[AsyncSession, Session], callback: Callable[[], None]):
+    """Run ``callback`` once the session's current transaction commits.
+
+    Process-local caches of rows written in a transaction are updated this
+    way, so a rollback never leaves them pointing at rows that do not exist.
+    Callbacks are dropped on rollback and run on the event loop, so they must
+    be quick and must not do I/O.
+    """
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session):
+    for callback in session.info.pop("after_commit", ()):
+        try:
+            callback()
+        except Exception:
+            logger.exception("After-commit callback failed")
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session: Session):
+    session.info.pop("after_commit", None)
+
+
 async def get_db() -> AsyncSession:
     """Dependency for getting database sessions."""
     async with async_session() as session:
@@ -38,12 +114,83 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
-async def init_db():
-    """Initialize database tables."""
+async def get_read_db() -> AsyncSession:
+    """Dependency for read-only database sessions.
+
+    The transaction is marked READ ONLY and never committed, and may be served
+    by the replica in DATABASE_READ_URL.
+    """
+    async with read_session() as session:
+        try:
+            await session.execute(text("SET TRANSACTION READ ONLY"))
+            yield session
+        finally:
+            await session.close()
+
+
+async def get_ingest_db() -> AsyncSession:
+    """Dependency for telemetry ingest sessions, backed by the ingest pool."""
+    async with ingest_session() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+
+async def get_schema_version(conn: AsyncConnection) -> Optional[int]:
+    """Read the stored schema version, or None if the database has never been initialized."""
+    try:
+        result = await conn.execute(text("SELECT version FROM schema_version WHERE id = 1"))
+    except DBAPIError:
+        return None
+    return result.scalar()
+
+
+async def init_db() -> Optional[int]:
+    """Bring the schema up to SCHEMA_VERSION.
+
+    Costs a single query when the schema is already current. Returns the
+    version found before migrating (None for an empty database).
+    """
+    from app import models  # noqa: F401 - register every table on Base.metadata
+    from app.migrations import SCHEMA_VERSION, MIGRATIONS, MIGRATION_LOCK_ID
+
+    async with engine.connect() as conn:
+        if await get_schema_version(conn) == SCHEMA_VERSION:
+            return SCHEMA_VERSION
+
     async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+        # Another worker may have migrated while we waited for the lock
+        initialized = await conn.run_sync(
+            lambda sync_conn: sync_conn.dialect.has_table(sync_conn, "schema_version")
+        )
+        current = await get_schema_version(conn) if initialized else None
+        if current == SCHEMA_VERSION:
+            return SCHEMA_VERSION
+
         await conn.run_sync(Base.metadata.create_all)
+        for version in sorted(MIGRATIONS):
+            if current is None or version > current:
+                for statement in MIGRATIONS[version]:
+                    await conn.execute(text(statement))
+
+        await conn.execute(
+            text("""
+                INSERT INTO schema_version (id, version, applied_at) VALUES (1, :version, :applied_at)
+                ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, applied_at = EXCLUDED.applied_at
+            """),
+            {"version": SCHEMA_VERSION, "applied_at": datetime.utcnow()},
+        )
+    return current
 
 
 async def close_db():
-    """Close database connection."""
-    await engine.dispose()
+    """Close database connections."""
+    for pool in {engine, read_engine, ingest_engine, background_engine}:
+        await pool.dispose()
@@ -1,12 +1,26 @@
-from contextlib import asynccontextmanager
+import asyncio
+import time
+
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager, contextmanager, suppress
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import structlog
 
 from app.config import settings
 from app.database import init_db, close_db
+from app.migrations import SCHEMA_VERSION
+from app.ratelimit import RateLimitMiddleware
 from app.routers import api_router
+from app import telemetry
+from app.services import anomaly
+from app.services.catalog import catalog
+from app.services.incidents import run_refresh_loop
+from app.services.log_tail import log_bus
+from app.services.regex_matcher import regex_matcher
+from app.services.span_assembler import assembler, run_flush_loop
 
 # Configure structured logging
 structlog.configure(
@@ -30,22 +44,95 @@ structlog.configure(
 logger = structlog.get_logger()
 
 
+@contextmanager
+def startup_phase(timings: dict, name: str):
+    """Record the wall time of a startup phase in milliseconds."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[f"{name}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def save_anomaly_baselines():
+    """Persist the detector state; the copy is taken on the loop, the write in a thread."""
+    try:
+        state = anomaly.get_detector().snapshot()
+        await asyncio.to_thread(anomaly.save_snapshot, anomaly.worker_snapshot_path(), state)
+    except Exception as e:
+        logger.error("Failed to save anomaly baselines", error=str(e))
+
+
+async def snapshot_anomaly_baselines():
+    while True:
+        await asyncio.sleep(settings.ANOMALY_SNAPSHOT_SECONDS)
+        await save_anomaly_baselines()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan."""
     # Startup
     logger.info("Starting INFRA Observatory API", version=settings.APP_VERSION)
-
-    try:
-        await init_db()
-        logger.info("Database initialized")
-    except Exception as e:
-        logger.error("Failed to initialize database", error=str(e))
+    timings = {"imports_ms": round((_import_finished - _import_started) * 1000, 1)}
+    started = time.perf_counter()
+
+    with startup_phase(timings, "database"):
+        try:
+            previous_version = await init_db()
+            if previous_version == SCHEMA_VERSION:
+                logger.info("Database schema is current", schema_version=SCHEMA_VERSION)
+            else:
+                logger.info(
+                    "Database schema migrated",
+                    from_version=previous_version,
+                    schema_version=SCHEMA_VERSION,
+                )
+        except Exception as e:
+            logger.error("Failed to initialize database", error=str(e))
+
+    snapshots = None
+    if settings.ANOMALY_DETECTION:
+        with startup_phase(timings, "anomaly"):
+            try:
+                state = anomaly.load_snapshot(anomaly.worker_snapshot_path())
+                if state is not None:
+                    anomaly.get_detector().restore(state)
+                    logger.info("Anomaly baselines restored", series=len(anomaly.get_detector()))
+            except Exception as e:
+                logger.error("Failed to restore anomaly baselines", error=str(e))
+        snapshots = asyncio.create_task(snapshot_anomaly_baselines())
+
+    trace_flusher = asyncio.create_task(run_flush_loop())
+    catalog_listener = asyncio.create_task(catalog.listen()) if settings.CATALOG_LISTEN else None
+    incident_refresher = asyncio.create_task(run_refresh_loop()) if settings.INCIDENT_CORRELATION else None
+    tail_dispatcher = asyncio.create_task(log_bus.run())
+
+    timings["total_ms"] = round(timings["imports_ms"] + (time.perf_counter() - started) * 1000, 1)
+    logger.info("Startup complete", **timings)
 
     yield
 
     # Shutdown
     logger.info("Shutting down INFRA Observatory API")
+    if snapshots is not None:
+        snapshots.cancel()
+        with suppress(asyncio.CancelledError):
+            await snapshots
+        await save_anomaly_baselines()
+    for task in (catalog_listener, incident_refresher, tail_dispatcher):
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    regex_matcher.close()
+    trace_flusher.cancel()
+    with suppress(asyncio.CancelledError):
+        await trace_flusher
+    try:
+        await assembler.flush(force=True)
+    except Exception as e:
+        logger.error("Failed to flush buffered traces", error=str(e))
     await close_db()
 
 
@@ -60,6 +147,9 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Rate limiting sits inside CORS, so 429s carry CORS headers and preflights are answered before it
+app.add_middleware(RateLimitMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -84,6 +174,9 @@ async def global_exception_handler(request, exc):
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
 
+_import_finished = time.perf_counter()
+
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -95,6 +188,12 @@ async def root():
     }
 
 
+# Prometheus exposition of the API's own counters
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,74 @@
+"""
+Schema versioning for the Observatory database.
+
+``init_db`` reads the single ``schema_version`` row on boot and does nothing
+else when it matches ``SCHEMA_VERSION``. Otherwise it creates missing tables
+with ``create_all`` and runs the statements registered in ``MIGRATIONS`` for
+every version newer than the stored one.
+
+Bump ``SCHEMA_VERSION`` for every model change, including new tables, which
+are only created when the stored version is behind. When a change alters
+existing tables, also register the DDL under the new version. Statements must
+be idempotent (``IF NOT EXISTS``) because they also run right after
+``create_all`` on a fresh database.
+"""
+
+from typing import Dict, List
+
+SCHEMA_VERSION = 10
+
+MIGRATIONS: Dict[int, List[str]] = {
+    # Log template mining
+    2: [
+        "ALTER TABLE logs ALTER COLUMN message DROP NOT NULL",
+        "ALTER TABLE logs ADD COLUMN IF NOT EXISTS template_id INTEGER REFERENCES log_templates(id)",
+        "ALTER TABLE logs ADD COLUMN IF NOT EXISTS params JSON",
+        "CREATE INDEX IF NOT EXISTS idx_logs_timestamp_template ON logs (timestamp, template_id)",
+    ],
+    # metric_chunks (new table, created by create_all)
+    3: [],
+    # histogram_series, histogram_samples, histogram_rollups (new tables)
+    4: [],
+    # incident_events (new table)
+    5: [],
+    # metric_exemplars (new table)
+    6: [],
+    # Spans packed per trace
+    7: [
+        "ALTER TABLE traces ADD COLUMN IF NOT EXISTS span_data BYTEA",
+    ],
+    # Unique service slugs per platform, for bulk upserts
+    8: [
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_services_platform_slug ON services (platform_id, slug)",
+    ],
+    # Service catalog change notifications
+    9: [
+        """
+        CREATE OR REPLACE FUNCTION observatory_catalog_notify() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('observatory_catalog', TG_TABLE_NAME || ':' || OLD.id);
+            ELSE
+                PERFORM pg_notify('observatory_catalog', TG_TABLE_NAME || ':' || NEW.id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS observatory_catalog_services ON services",
+        "CREATE TRIGGER observatory_catalog_services"
+        " AFTER INSERT OR DELETE OR UPDATE OF platform_id, slug, name, team, service_type, labels, is_active"
+        " ON services FOR EACH ROW EXECUTE FUNCTION observatory_catalog_notify()",
+        "DROP TRIGGER IF EXISTS observatory_catalog_platforms ON platforms",
+        "CREATE TRIGGER observatory_catalog_platforms"
+        " AFTER INSERT OR DELETE OR UPDATE OF code, name, is_active, criticality, settings"
+        " ON platforms FOR EACH ROW EXECUTE FUNCTION observatory_catalog_notify()",
+    ],
+    # Exemplar retention
+    10: [
+        "CREATE INDEX IF NOT EXISTS idx_metric_exemplars_timestamp ON metric_exemplars (timestamp)",
+    ],
+}
+
+# Serialises concurrent workers migrating the same database on boot
+MIGRATION_LOCK_ID = 0x0B5E4A70
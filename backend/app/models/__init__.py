@@ -1,28 +1,41 @@
 from app.models.platform import Platform
 from app.models.service import Service
 from app.models.log_entry import LogEntry
+from app.models.log_template import LogTemplate
 from app.models.metric import Metric
+from app.models.metric_chunk import MetricChunk
+from app.models.histogram import HistogramSeries, HistogramSample, HistogramRollup
+from app.models.exemplar import MetricExemplar
 from app.models.trace import Trace, Span
 from app.models.alert import AlertRule, Alert
-from app.models.incident import Incident
+from app.models.incident import Incident, IncidentEvent
 from app.models.slo import SLO
 from app.models.dashboard import Dashboard, DashboardWidget
 from app.models.integration import Integration
 from app.models.user import User
+from app.models.schema_version import SchemaVersion
 
 __all__ = [
     "Platform",
     "Service",
     "LogEntry",
+    "LogTemplate",
     "Metric",
+    "MetricChunk",
+    "HistogramSeries",
+    "HistogramSample",
+    "HistogramRollup",
+    "MetricExemplar",
     "Trace",
     "Span",
     "AlertRule",
     "Alert",
     "Incident",
+    "IncidentEvent",
     "SLO",
     "Dashboard",
     "DashboardWidget",
     "Integration",
     "User",
+    "SchemaVersion",
 ]
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, String, Float, BigInteger, Index
+from sqlalchemy.dialects.postgresql import TIMESTAMP
+from app.database import Base
+
+
+class MetricExemplar(Base):
+    """A sample's trace, kept for the slowest few observations per series and minute."""
+
+    __tablename__ = "metric_exemplars"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+
+    # metric_store.series_hash for samples, histograms.series_hash for histogram series
+    series_hash = Column(String(40), nullable=False)
+
+    timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
+    value = Column(Float, nullable=False)
+    trace_id = Column(String(64), nullable=False)
+    span_id = Column(String(32))
+
+    __table_args__ = (
+        Index("idx_metric_exemplars_series_timestamp", "series_hash", "timestamp"),
+        Index("idx_metric_exemplars_timestamp", "timestamp"),  # retention
+    )
+
+    def __repr__(self):
+        return f"<MetricExemplar(trace_id={self.trace_id}, value={self.value})>"
@@ -0,0 +1,63 @@
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, BigInteger, Float, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.dialects.postgresql import UUID, TIMESTAMP, ARRAY
+from app.database import Base
+
+
+class HistogramSeries(Base):
+    """Identity and bucket layout of one histogram series."""
+
+    __tablename__ = "histogram_series"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+
+    # Hash of name, origin, labels and bounds: a new bucket layout is a new series
+    series_hash = Column(String(40), unique=True, nullable=False)
+    name = Column(String(255), nullable=False, index=True)  # e.g., http_request_duration_ms
+    platform_id = Column(UUID(as_uuid=True), ForeignKey("platforms.id"), index=True)
+    service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"), index=True)
+    labels = Column(JSON, default=dict)
+    unit = Column(String(50))
+
+    # Bucket upper bounds, ascending; a final +Inf bucket is implied
+    bounds = Column(ARRAY(Float), nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<HistogramSeries(name={self.name}, buckets={len(self.bounds or []) + 1})>"
+
+
+class HistogramSample(Base):
+    """Observations of a series during one reporting interval (delta temporality)."""
+
+    __tablename__ = "histogram_samples"
+
+    series_id = Column(BigInteger, ForeignKey("histogram_series.id", ondelete="CASCADE"), primary_key=True)
+    timestamp = Column(TIMESTAMP(timezone=True), primary_key=True)
+
+    counts = Column(ARRAY(BigInteger), nullable=False)  # per bucket, len(bounds) + 1
+    count = Column(BigInteger, nullable=False)
+    sum = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("idx_histogram_samples_timestamp", "timestamp"),
+    )
+
+
+class HistogramRollup(Base):
+    """Bucket counts of a series summed over an aligned window, kept in step with ingest."""
+
+    __tablename__ = "histogram_rollups"
+
+    series_id = Column(BigInteger, ForeignKey("histogram_series.id", ondelete="CASCADE"), primary_key=True)
+    resolution = Column(Integer, primary_key=True)  # window length in seconds, e.g. 3600, 86400
+    bucket_start = Column(TIMESTAMP(timezone=True), primary_key=True)
+
+    counts = Column(ARRAY(BigInteger), nullable=False)
+    count = Column(BigInteger, nullable=False)
+    sum = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("idx_histogram_rollups_resolution_start", "resolution", "bucket_start"),
+    )
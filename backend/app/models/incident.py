@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, JSON
+from sqlalchemy import Column, String, Text, DateTime, JSON, BigInteger, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -39,7 +39,9 @@ class Incident(Base):
     commander_id = Column(UUID(as_uuid=True))
     assigned_to = Column(ARRAY(String))
 
-    # Timeline
+    # Timeline. New entries are appended to incident_events; these JSON lists
+    # only hold entries written before that table existed and are merged with
+    # the events into a cached projection on read (app.services.incident_timeline).
     timeline = Column(JSON, default=list)  # [{timestamp, action, user, note}]
 
     # Postmortem
@@ -55,3 +57,27 @@ class Incident(Base):
 
     def __repr__(self):
         return f"<Incident(title={self.title}, status={self.status})>"
+
+
+class IncidentEvent(Base):
+    """Append-only timeline entry. Rows are never updated."""
+
+    __tablename__ = "incident_events"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    incident_id = Column(UUID(as_uuid=True), ForeignKey("incidents.id", ondelete="CASCADE"), nullable=False)
+
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
+    kind = Column(String(20), nullable=False, default="timeline")  # timeline, action_item
+    action = Column(String(50), nullable=False)  # opened, alert_attached, note, status_changed, ...
+    user = Column(String(255))
+    note = Column(Text)
+    data = Column(JSON)
+
+    __table_args__ = (
+        Index("idx_incident_events_incident_timestamp", "incident_id", "timestamp", "id"),
+        Index("idx_incident_events_incident_id", "incident_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<IncidentEvent(incident_id={self.incident_id}, action={self.action})>"
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, Index
+from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID, TIMESTAMP
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -18,7 +18,11 @@ class LogEntry(Base):
 
     # Content
     level = Column(String(20), nullable=False, index=True)  # debug, info, warn, error, fatal
-    message = Column(Text, nullable=False)
+    message = Column(Text)  # NULL when stored as template_id + params
+
+    # Template mining: message == template with "<*>" slots filled from params
+    template_id = Column(Integer, ForeignKey("log_templates.id"))
+    params = Column(JSON)
 
     # Context
     trace_id = Column(String(64), index=True)
@@ -44,6 +48,7 @@ class LogEntry(Base):
         Index("idx_logs_platform_timestamp", "platform_id", "timestamp"),
         Index("idx_logs_service_timestamp", "service_id", "timestamp"),
         Index("idx_logs_level_timestamp", "level", "timestamp"),
+        Index("idx_logs_timestamp_template", "timestamp", "template_id"),
     )
 
     def __repr__(self):
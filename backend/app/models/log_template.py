@@ -0,0 +1,20 @@
+from datetime import datetime
+from sqlalchemy import Column, String, Text, Integer, DateTime
+from app.database import Base
+
+
+class LogTemplate(Base):
+    __tablename__ = "log_templates"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Template text, "<*>" marks a parameter slot. Rows are immutable: when a
+    # pattern generalizes, the new template gets a new row.
+    template = Column(Text, nullable=False)
+    template_hash = Column(String(40), unique=True, nullable=False)
+    token_count = Column(Integer, nullable=False)
+
+    first_seen = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<LogTemplate(id={self.id}, template={self.template[:40]})>"
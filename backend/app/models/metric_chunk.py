@@ -0,0 +1,37 @@
+from sqlalchemy import Column, String, Integer, BigInteger, LargeBinary, ForeignKey, JSON, Index
+from sqlalchemy.dialects.postgresql import UUID, TIMESTAMP
+from app.database import Base
+
+
+class MetricChunk(Base):
+    """Gorilla-compressed samples of one series over a fixed time window (cold tier)."""
+
+    __tablename__ = "metric_chunks"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+
+    # Series identity
+    series_hash = Column(String(40), nullable=False)
+    name = Column(String(255), nullable=False)
+    metric_type = Column(String(20), nullable=False)
+    platform_id = Column(UUID(as_uuid=True), ForeignKey("platforms.id"))
+    service_id = Column(UUID(as_uuid=True), ForeignKey("services.id"))
+    labels = Column(JSON, default=dict)
+    unit = Column(String(50))
+
+    # Window covered by the chunk
+    start_time = Column(TIMESTAMP(timezone=True), nullable=False)
+    end_time = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    # Encoded samples, see app.services.gorilla
+    sample_count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index("idx_metric_chunks_name_start", "name", "start_time"),
+        Index("idx_metric_chunks_series_start", "series_hash", "start_time"),
+        Index("idx_metric_chunks_service_start", "service_id", "start_time"),
+    )
+
+    def __repr__(self):
+        return f"<MetricChunk(name={self.name}, samples={self.sample_count})>"
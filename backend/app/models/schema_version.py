@@ -0,0 +1,15 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, DateTime
+from app.database import Base
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    # Single row table, id is always 1
+    id = Column(Integer, primary_key=True, default=1)
+    version = Column(Integer, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SchemaVersion(version={self.version})>"
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, Boolean, DateTime, Numeric, Integer, JSON, ForeignKey
+from sqlalchemy import Column, String, Text, Boolean, DateTime, Numeric, Integer, JSON, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -57,8 +57,8 @@ class Service(Base):
     slos = relationship("SLO", back_populates="service")
 
     __table_args__ = (
-        # Unique constraint on platform + slug
-        {"schema": None},
+        # Unique constraint on platform + slug, the conflict target of bulk upserts
+        Index("uq_services_platform_slug", "platform_id", "slug", unique=True),
     )
 
     def __repr__(self):
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, Boolean, Integer, ForeignKey, JSON, Index
+from sqlalchemy import Column, String, Text, Boolean, Integer, LargeBinary, ForeignKey, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID, TIMESTAMP, ARRAY
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -37,6 +37,10 @@ class Trace(Base):
     http_status_code = Column(Integer)
     user_id = Column(String(255))
 
+    # Every span of the trace, see app.services.span_codec. Traces stored
+    # before it existed keep their spans as rows in ``spans``.
+    span_data = Column(LargeBinary)
+
     created_at = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
 
     # Relationships
@@ -0,0 +1,316 @@
+"""
+Token-bucket rate limiting.
+
+Query traffic costs one token per request from a per-client bucket and, when
+the request names a platform (``platform_id`` query parameter or
+``X-Platform-Id`` header), from that platform's bucket; ``RateLimitMiddleware``
+enforces it before routing. Ingest routes are skipped by the middleware and
+call ``charge_ingest`` once the batch is parsed: one token per sample, log line
+or span, from the client's bucket and from each platform's in the batch. A
+client is the user of a valid bearer token, else the peer address. CORS
+preflights (``OPTIONS``) are never charged.
+
+Buckets live in process memory by default. With ``RATE_LIMIT_REDIS`` they are
+shared by every worker through a Lua script that refills and debits all the
+buckets of a request atomically. Each call leases a slice of extra tokens so
+the following requests are served from memory, without a Redis round trip,
+until the lease runs out or expires. If Redis is unreachable the in-process
+buckets take over.
+
+Rejections answer 429 with ``Retry-After`` and ``X-RateLimit-*`` headers and
+are counted in ``observatory_rate_limited_total``.
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import structlog
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from app import telemetry
+from app.auth import token_user_id
+from app.config import settings
+
+logger = structlog.get_logger()
+
+# Share of a bucket's burst leased by one Redis round trip, and for how long
+LEASE_FRACTION = 0.05
+LEASE_SECONDS = 1.0
+
+# In-process buckets are swept of idle (full) entries past this many keys
+MAX_LOCAL_BUCKETS = 100_000
+
+rejections = telemetry.counter(
+    "observatory_rate_limited_total",
+    "Requests rejected by the rate limiter.",
+    ("budget", "scope"),
+)
+
+
+@dataclass(frozen=True)
+class Budget:
+    name: str  # query, samples, lines, spans
+    rate: float  # tokens per second
+    burst: float  # bucket capacity
+
+
+def budgets() -> Dict[str, Budget]:
+    burst_seconds = settings.RATE_LIMIT_BURST_SECONDS
+    per_second = {
+        "query": settings.RATE_LIMIT_PER_MINUTE / 60,
+        "samples": settings.RATE_LIMIT_INGEST_SAMPLES_PER_SECOND,
+        "lines": settings.RATE_LIMIT_INGEST_LINES_PER_SECOND,
+        "spans": settings.RATE_LIMIT_INGEST_SPANS_PER_SECOND,
+    }
+    return {name: Budget(name, rate, max(1.0, rate * burst_seconds)) for name, rate in per_second.items()}
+
+
+def platform_budget(budget: Budget) -> Budget:
+    """Platforms share one bucket across their clients, so it is wider."""
+    factor = settings.RATE_LIMIT_PLATFORM_MULTIPLIER
+    return Budget(budget.name, budget.rate * factor, budget.burst * factor)
+
+
+# (bucket key, budget, cost)
+Spec = Tuple[str, Budget, float]
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    key: str  # tightest bucket
+    budget: Budget
+    remaining: float
+    retry_after: float = 0.0
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(int(self.budget.burst)),
+            "X-RateLimit-Remaining": str(max(0, int(self.remaining))),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class LocalBuckets:
+    """Token buckets in process memory: key -> [tokens, updated, rate, burst]."""
+
+    def __init__(self):
+        self.buckets: Dict[str, list] = {}
+
+    def take(self, specs: Sequence[Spec]) -> Decision:
+        now = time.monotonic()
+        tokens = []
+        for key, budget, cost in specs:
+            state = self.buckets.get(key)
+            if state is None:
+                tokens.append(budget.burst)
+            else:
+                tokens.append(min(budget.burst, state[0] + (now - state[1]) * budget.rate))
+
+        # A batch larger than the burst passes on a full bucket and leaves it in debt
+        retry_after, blocking = 0.0, None
+        for (key, budget, cost), available in zip(specs, tokens):
+            needed = min(cost, budget.burst)
+            if available < needed and (needed - available) / budget.rate > retry_after:
+                retry_after, blocking = (needed - available) / budget.rate, (key, budget, available)
+        if blocking is not None:
+            key, budget, available = blocking
+            return Decision(False, key, budget, available, retry_after)
+
+        tightest = None
+        for (key, budget, cost), available in zip(specs, tokens):
+            left = available - cost
+            self.buckets[key] = [left, now, budget.rate, budget.burst]
+            if tightest is None or left < tightest[2]:
+                tightest = (key, budget, left)
+        if len(self.buckets) > MAX_LOCAL_BUCKETS:
+            self._sweep(now)
+        return Decision(True, *tightest)
+
+    def _sweep(self, now: float):
+        self.buckets = {
+            key: state for key, state in self.buckets.items()
+            if state[0] + (now - state[1]) * state[2] < state[3]
+        }
+
+
+# Refills and debits every bucket of a request atomically. KEYS are the
+# buckets, ARGV holds rate, burst, cost and wanted tokens for each. Returns
+# {1, grant...} or {0, retry_after, blocking index, available}; numbers are
+# returned as strings because Redis truncates Lua numbers to integers.
+TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tokens = {}
+local retry, blocking = 0, 0
+for i, key in ipairs(KEYS) do
+  local rate, burst, cost = tonumber(ARGV[i * 4 - 3]), tonumber(ARGV[i * 4 - 2]), tonumber(ARGV[i * 4 - 1])
+  local state = redis.call('HMGET', key, 't', 'u')
+  local t = burst
+  if state[1] then
+    t = math.min(burst, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+  end
+  tokens[i] = t
+  local needed = math.min(cost, burst)
+  if t < needed and (needed - t) / rate > retry then
+    retry, blocking = (needed - t) / rate, i
+  end
+end
+if blocking > 0 then
+  return {0, tostring(retry), blocking, tostring(tokens[blocking])}
+end
+local result = {1}
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[i * 4 - 3]), tonumber(ARGV[i * 4 - 2])
+  local cost, wanted = tonumber(ARGV[i * 4 - 1]), tonumber(ARGV[i * 4])
+  local grant = math.max(cost, math.min(wanted, tokens[i]))
+  redis.call('HSET', key, 't', tokens[i] - grant, 'u', now)
+  redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+  result[i + 1] = tostring(grant)
+end
+return result
+"""
+
+
+class SharedBuckets:
+    """Buckets in Redis, debited in leases: key -> [leased tokens, lease expiry]."""
+
+    def __init__(self, url: str, fallback: LocalBuckets):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+        self.fallback = fallback
+        self.leases: Dict[str, list] = {}
+
+    async def take(self, specs: Sequence[Spec]) -> Decision:
+        now = time.monotonic()
+        leases = [self.leases.get(key) for key, _, _ in specs]
+        if all(lease and lease[1] > now and lease[0] >= cost for lease, (_, _, cost) in zip(leases, specs)):
+            tightest = None
+            for lease, (key, budget, cost) in zip(leases, specs):
+                lease[0] -= cost
+                if tightest is None or lease[0] < tightest[2]:
+                    tightest = (key, budget, lease[0])
+            return Decision(True, *tightest)
+
+        held = [lease[0] if lease and lease[1] > now else 0.0 for lease in leases]
+        args: List[float] = []
+        for (key, budget, cost), tokens in zip(specs, held):
+            args += [budget.rate, budget.burst, cost, max(cost, cost + budget.burst * LEASE_FRACTION - tokens)]
+        try:
+            result = await self.script(keys=[f"ratelimit:{key}" for key, _, _ in specs], args=args)
+        except Exception as e:
+            logger.warning("Shared rate limit unavailable, using local buckets", error=str(e))
+            return self.fallback.take(specs)
+
+        if int(result[0]) == 0:
+            key, budget, _ = specs[int(result[2]) - 1]
+            return Decision(False, key, budget, float(result[3]), float(result[1]))
+
+        tightest = None
+        for (key, budget, cost), tokens, grant in zip(specs, held, result[1:]):
+            left = tokens + float(grant) - cost
+            self.leases[key] = [left, now + LEASE_SECONDS]
+            if tightest is None or left < tightest[2]:
+                tightest = (key, budget, left)
+        if len(self.leases) > MAX_LOCAL_BUCKETS:
+            self.leases = {key: lease for key, lease in self.leases.items() if lease[1] > now}
+        return Decision(True, *tightest)
+
+
+class RateLimiter:
+    def __init__(self):
+        self.local = LocalBuckets()
+        self._shared: Optional[SharedBuckets] = None
+
+    async def take(self, specs: Sequence[Spec]) -> Decision:
+        if settings.RATE_LIMIT_REDIS:
+            if self._shared is None:
+                self._shared = SharedBuckets(settings.REDIS_URL, self.local)
+            return await self._shared.take(specs)
+        return self.local.take(specs)
+
+
+rate_limiter = RateLimiter()
+
+
+def client_key(request: Request) -> str:
+    """User of a valid bearer token, else the peer address; unverified credentials never pick the bucket."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        user_id = token_user_id(token)
+        if user_id is not None:
+            return f"user:{user_id}"
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+def _specs(request: Request, budget: Budget, total: float, platforms: Mapping[str, float]) -> List[Spec]:
+    specs = [(f"client:{client_key(request)}:{budget.name}", budget, total)]
+    wide = platform_budget(budget)
+    specs += [(f"platform:{platform}:{budget.name}", wide, cost) for platform, cost in platforms.items()]
+    return specs
+
+
+def _reject(decision: Decision):
+    rejections.inc(budget=decision.budget.name, scope=decision.key.split(":", 1)[0])
+
+
+async def charge_ingest(request: Request, budget_name: str, platforms: Mapping[Optional[object], int]):
+    """Charge an ingest batch, as unit counts per platform, or raise 429."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    budget = budgets()[budget_name]
+    total = sum(platforms.values())
+    named = {str(platform): count for platform, count in platforms.items() if platform is not None}
+    decision = await rate_limiter.take(_specs(request, budget, total, named))
+    if not decision.allowed:
+        _reject(decision)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Ingest rate limit exceeded ({budget_name})",
+            headers=decision.headers(),
+        )
+
+
+class RateLimitMiddleware:
+    """Charges query traffic under the API prefix; ingest and health routes are exempt."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        prefix = settings.API_PREFIX
+        if not path.startswith(prefix) or path.endswith("/ingest") or path.startswith(prefix + "/health"):
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        platform = request.query_params.get("platform_id") or request.headers.get("x-platform-id")
+        decision = await rate_limiter.take(
+            _specs(request, budgets()["query"], 1, {platform: 1} if platform else {})
+        )
+        if not decision.allowed:
+            _reject(decision)
+            response = JSONResponse(
+                status_code=429,
+                content={"message": "Rate limit exceeded", "code": "RATE_LIMITED"},
+                headers=decision.headers(),
+            )
+            return await response(scope, receive, send)
+
+        extra = [(name.lower().encode(), value.encode()) for name, value in decision.headers().items()]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + extra
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
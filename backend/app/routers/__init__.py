@@ -1,16 +1,35 @@
-from fastapi import APIRouter
-from app.routers import health, platforms, services, overview
+from fastapi import APIRouter, Depends
+from app.auth import require_auth
+from app.routers import health, auth, platforms, services, overview, logs, metrics, traces, incidents
 
 api_router = APIRouter()
 
+# Data routes need a bearer token when AUTH_REQUIRED is set
+authenticated = [Depends(require_auth)]
+
 # Health check routes
 api_router.include_router(health.router, tags=["Health"])
 
+# Authentication routes
+api_router.include_router(auth.router, prefix="/auth", tags=["Auth"])
+
 # Overview routes
-api_router.include_router(overview.router, prefix="/overview", tags=["Overview"])
+api_router.include_router(overview.router, prefix="/overview", tags=["Overview"], dependencies=authenticated)
 
 # Platform routes
-api_router.include_router(platforms.router, prefix="/platforms", tags=["Platforms"])
+api_router.include_router(platforms.router, prefix="/platforms", tags=["Platforms"], dependencies=authenticated)
 
 # Service routes
-api_router.include_router(services.router, prefix="/services", tags=["Services"])
+api_router.include_router(services.router, prefix="/services", tags=["Services"], dependencies=authenticated)
+
+# Log routes
+api_router.include_router(logs.router, prefix="/logs", tags=["Logs"], dependencies=authenticated)
+
+# Metric routes
+api_router.include_router(metrics.router, prefix="/metrics", tags=["Metrics"], dependencies=authenticated)
+
+# Trace routes
+api_router.include_router(traces.router, prefix="/traces", tags=["Traces"], dependencies=authenticated)
+
+# Incident routes
+api_router.include_router(incidents.router, prefix="/incidents", tags=["Incidents"], dependencies=authenticated)
@@ -0,0 +1,39 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.auth import Principal, create_access_token, get_current_user, verify_password
+from app.database import get_db
+from app.models import User
+from app.schemas.auth import LoginRequest, TokenResponse, PrincipalResponse
+
+router = APIRouter()
+
+
+@router.post("/login", response_model=TokenResponse)
+async def login(credentials: LoginRequest, db: AsyncSession = Depends(get_db)):
+    """Exchange an email and password for an access token."""
+    result = await db.execute(select(User).where(User.email == credentials.email))
+    user = result.scalar_one_or_none()
+
+    # Verify even for unknown emails so response time does not reveal which exist
+    valid = await verify_password(credentials.password, user.hashed_password if user else None)
+    if not valid or not user.is_active:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    user.last_login = datetime.utcnow()
+    token, expires_in = create_access_token(user)
+    return TokenResponse(access_token=token, expires_in=expires_in)
+
+
+@router.get("/me", response_model=PrincipalResponse)
+async def get_me(principal: Principal = Depends(get_current_user)):
+    """Get the signed-in user."""
+    return PrincipalResponse(
+        id=principal.id,
+        email=principal.email,
+        name=principal.name,
+        role=principal.role,
+        permissions=list(principal.permissions),
+    )
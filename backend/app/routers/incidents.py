@@ -0,0 +1,91 @@
+from typing import List, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.database import get_db, get_read_db
+from app.models import Incident
+from app.responses import FastJSONResponse, rows_to_dicts
+from app.schemas.incident import (
+    IncidentEventCreate,
+    IncidentEventResponse,
+    IncidentTimelinePage,
+    IncidentSummary,
+    IncidentResponse,
+)
+from app.services import incident_timeline
+
+router = APIRouter()
+
+INCIDENT_SUMMARY_COLUMNS = list(IncidentSummary.model_fields)
+
+
+@router.get("", response_model=List[IncidentSummary])
+async def list_incidents(
+    status: Optional[str] = Query(None),
+    severity: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """List incidents, most recent first."""
+    query = select(*(Incident.__table__.c[name] for name in INCIDENT_SUMMARY_COLUMNS))
+    if status:
+        query = query.where(Incident.status == status)
+    if severity:
+        query = query.where(Incident.severity == severity)
+    query = query.order_by(Incident.started_at.desc()).offset(offset).limit(limit)
+
+    incidents = rows_to_dicts(INCIDENT_SUMMARY_COLUMNS, (await db.execute(query)).all())
+    for incident in incidents:
+        incident["affected_platforms"] = incident["affected_platforms"] or []
+        incident["affected_services"] = incident["affected_services"] or []
+    return FastJSONResponse(incidents)
+
+
+@router.get("/{incident_id}", response_model=IncidentResponse)
+async def get_incident(incident_id: UUID, db: AsyncSession = Depends(get_read_db)):
+    """Get an incident with its timeline and action items."""
+    incident = (await db.execute(select(Incident).where(Incident.id == incident_id))).scalar_one_or_none()
+
+    if not incident:
+        raise HTTPException(status_code=404, detail="Incident not found")
+
+    projection = await incident_timeline.projections.get(db, incident)
+    response = {name: getattr(incident, name) for name in IncidentResponse.model_fields}
+    response["affected_platforms"] = incident.affected_platforms or []
+    response["affected_services"] = incident.affected_services or []
+    response["timeline"] = projection.timeline
+    response["action_items"] = projection.action_items
+    return FastJSONResponse(response)
+
+
+@router.get("/{incident_id}/timeline", response_model=IncidentTimelinePage)
+async def get_incident_timeline(
+    incident_id: UUID,
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    kind: Optional[str] = Query(None, pattern="^(timeline|action_item)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Page through an incident's timeline in time order."""
+    try:
+        events, next_cursor = await incident_timeline.page(db, incident_id, cursor=cursor, limit=limit, kind=kind)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return FastJSONResponse({"events": events, "next_cursor": next_cursor})
+
+
+@router.post("/{incident_id}/timeline", response_model=IncidentEventResponse, status_code=201)
+async def append_incident_event(
+    incident_id: UUID,
+    event: IncidentEventCreate,
+    db: AsyncSession = Depends(get_db),
+):
+    """Append an entry to an incident's timeline or action items."""
+    exists = (await db.execute(select(Incident.id).where(Incident.id == incident_id))).scalar_one_or_none()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Incident not found")
+
+    return await incident_timeline.append_one(db, {"incident_id": incident_id, **event.model_dump(exclude_none=True)})
@@ -0,0 +1,205 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, func
+
+from app.config import settings
+from app.database import after_commit, get_ingest_db, get_read_db
+from app.models import LogEntry, LogTemplate
+from app.ratelimit import charge_ingest
+from app.schemas.log import LogIngestRequest, LogIngestResponse, LogPattern, LogRecord
+from app.services.log_archive import search_archive
+from app.services.catalog import catalog
+from app.services.log_tail import compile_filter, log_bus, stream
+from app.services.log_templates import rendered_message, template_store, render
+
+router = APIRouter()
+
+
+@router.post("/ingest", response_model=LogIngestResponse, status_code=202)
+async def ingest_logs(
+    payload: LogIngestRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_ingest_db),
+):
+    """Ingest a batch of log entries."""
+    await charge_ingest(request, "lines", Counter(entry.platform_id for entry in payload.entries))
+    rows = [entry.model_dump() for entry in payload.entries]
+    await catalog.resolve_rows(db, rows)
+    # Mining below blanks the stored message, so tail subscribers get copies
+    tailed = [dict(row) for row in rows] if log_bus.subscribers else None
+
+    new_templates = 0
+    if settings.LOG_TEMPLATE_MINING:
+        mined, new_templates = await template_store.mine(db, [row["message"] for row in rows])
+        for row, (template_id, params) in zip(rows, mined):
+            row["message"] = None
+            row["template_id"] = template_id
+            row["params"] = params
+
+    await db.execute(insert(LogEntry), rows)
+    if tailed:
+        after_commit(db, lambda: log_bus.publish(tailed))
+
+    return LogIngestResponse(accepted=len(rows), new_templates=new_templates)
+
+
+@router.get("/tail")
+async def tail_logs(
+    request: Request,
+    platform_id: Optional[UUID] = Query(None),
+    service_id: Optional[UUID] = Query(None),
+    level: List[str] = Query([], description="Repeat to accept several levels"),
+    q: Optional[str] = Query(None, min_length=1, description="Case-insensitive substring"),
+    regex: Optional[str] = Query(None, min_length=1),
+    attr: List[str] = Query([], description="Attribute match as name=value, repeatable"),
+):
+    """Stream newly ingested log lines matching a filter, as server-sent events."""
+    attributes = {}
+    for item in attr:
+        name, sep, value = item.partition("=")
+        if not sep or not name:
+            raise HTTPException(status_code=400, detail=f"Invalid attribute filter: {item}")
+        attributes[name] = value
+    try:
+        tail_filter = compile_filter(
+            service_id=str(service_id) if service_id else None,
+            platform_id=str(platform_id) if platform_id else None,
+            levels=level,
+            q=q,
+            pattern=regex,
+            attributes=attributes,
+        )
+        subscriber = log_bus.subscribe(tail_filter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return StreamingResponse(
+        stream(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/patterns", response_model=List[LogPattern])
+async def get_log_patterns(
+    minutes: int = Query(60, ge=1, le=10080),
+    platform_id: Optional[UUID] = Query(None),
+    service_id: Optional[UUID] = Query(None),
+    level: Optional[str] = Query(None),
+    new_only: bool = Query(False, description="Only templates first seen inside the window"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Group recent log lines by template."""
+    since = datetime.utcnow() - timedelta(minutes=minutes)
+
+    counts = select(
+        LogEntry.template_id,
+        func.count().label("count"),
+    ).where(
+        LogEntry.timestamp >= since.replace(tzinfo=timezone.utc),
+        LogEntry.template_id.isnot(None),
+    )
+    if platform_id:
+        counts = counts.where(LogEntry.platform_id == platform_id)
+    if service_id:
+        counts = counts.where(LogEntry.service_id == service_id)
+    if level:
+        counts = counts.where(LogEntry.level == level)
+    counts = counts.group_by(LogEntry.template_id).subquery()
+
+    query = (
+        select(LogTemplate.id, LogTemplate.template, LogTemplate.first_seen, counts.c.count)
+        .join(counts, counts.c.template_id == LogTemplate.id)
+        .order_by(counts.c.count.desc())
+        .limit(limit)
+    )
+    if new_only:
+        query = query.where(LogTemplate.first_seen >= since)
+
+    result = await db.execute(query)
+
+    return [
+        LogPattern(
+            template_id=template_id,
+            template=template,
+            count=count,
+            first_seen=first_seen,
+            is_new=first_seen >= since,
+        )
+        for template_id, template, first_seen, count in result.all()
+    ]
+
+
+@router.get("/search", response_model=List[LogRecord])
+async def search_logs(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    platform_id: Optional[UUID] = Query(None),
+    service_id: Optional[UUID] = Query(None),
+    level: Optional[str] = Query(None),
+    trace_id: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, min_length=1, description="Case-insensitive substring"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Search logs, newest first, across Postgres and the cold archive."""
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=1)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+
+    query = select(*LogEntry.__table__.c).where(
+        LogEntry.timestamp >= start,
+        LogEntry.timestamp < end,
+    )
+    if platform_id:
+        query = query.where(LogEntry.platform_id == platform_id)
+    if service_id:
+        query = query.where(LogEntry.service_id == service_id)
+    if level:
+        query = query.where(LogEntry.level == level)
+    if trace_id:
+        query = query.where(LogEntry.trace_id == trace_id)
+    if q:
+        # Same match as the archive: a substring of the rendered line
+        query = query.where(rendered_message().icontains(q, autoescape=True))
+    query = query.order_by(LogEntry.timestamp.desc()).limit(limit)
+
+    result = await db.execute(query)
+    rows = [dict(row._mapping) for row in result]
+
+    templates = await template_store.get_templates(
+        db, {row["template_id"] for row in rows if row["template_id"] is not None}
+    )
+    for row in rows:
+        if row["message"] is None and row["template_id"] is not None:
+            row["message"] = render(templates.get(row["template_id"], ""), row["params"])
+
+    # Compaction may have archived any range; chunks outside it are pruned by file name
+    rows += await run_in_threadpool(
+        search_archive,
+        Path(settings.LOGS_ARCHIVE_DIR),
+        start,
+        end,
+        limit,
+        platform_id=str(platform_id) if platform_id else None,
+        service_id=str(service_id) if service_id else None,
+        level=level,
+        trace_id=trace_id,
+        q=q,
+    )
+    rows.sort(key=lambda row: row["timestamp"], reverse=True)
+
+    return rows[:limit]
@@ -0,0 +1,254 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import get_ingest_db, get_read_db
+from app.models import Metric
+from app.ratelimit import charge_ingest
+from app.responses import FastJSONResponse
+from app.schemas.metric import (
+    CardinalityReport,
+    ExpressionQueryResponse,
+    MetricQueryResponse,
+    MetricIngestRequest,
+    MetricIngestResponse,
+    HistogramQuantile,
+)
+from app.services import cardinality, exemplars, histograms, metric_engine, promql, query_engine
+from app.services.anomaly import detect_anomalies
+from app.services.catalog import catalog
+from app.services.metric_store import load_series, series_hash, to_millis
+
+router = APIRouter()
+
+# Same per-series resolution limit as Prometheus
+MAX_POINTS = 11_000
+
+# How far back an instant selector looks for the latest sample
+LOOKBACK = timedelta(minutes=5)
+
+
+def _time_range(start: Optional[datetime], end: Optional[datetime], default: timedelta):
+    end = end or datetime.now(timezone.utc)
+    start = start or end - default
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start, end
+
+
+def _evaluate(series, function, window, aggregation, by, quantile, start_ms, end_ms, step_ms):
+    data = metric_engine.SeriesSet.from_series(series)
+    steps = metric_engine.step_times(start_ms, end_ms, step_ms)
+    if function:
+        matrix = metric_engine.RANGE_FUNCTIONS[function](data, steps, window * 1000)
+    else:
+        matrix = metric_engine.instant(data, steps, LOOKBACK // timedelta(milliseconds=1))
+    if aggregation:
+        matrix = metric_engine.aggregate(matrix, aggregation, by=by or [], param=quantile)
+    return matrix.to_dicts()
+
+
+def _admit(items: list, rows: List[dict]):
+    """Apply cardinality limits; the items and rows kept, and how many were rejected."""
+    kept, merged = cardinality.tracker.admit(rows)
+    return [items[i] for i in kept], [rows[i] for i in kept], len(rows) - len(kept) - merged
+
+
+@router.post("/ingest", response_model=MetricIngestResponse, status_code=202)
+async def ingest_metrics(
+    payload: MetricIngestRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_ingest_db),
+):
+    """Ingest a batch of metric samples and histogram samples."""
+    await charge_ingest(
+        request, "samples", Counter(s.platform_id for s in [*payload.samples, *payload.histograms])
+    )
+    sample_exemplars = []
+    samples, rows = [], []
+    rejected = 0
+    if payload.samples:
+        rows = [sample.model_dump(exclude={"exemplar"}) for sample in payload.samples]
+        await catalog.resolve_rows(db, rows)
+        samples, rows, rejected = _admit(payload.samples, rows)
+    if rows:
+        await db.execute(insert(Metric), rows)
+        if settings.ANOMALY_DETECTION:
+            await detect_anomalies(db, rows)
+        sample_exemplars += [
+            exemplars.from_sample(
+                series_hash(r["name"], r["platform_id"], r["service_id"], r["labels"]),
+                s.timestamp,
+                s.exemplar.model_dump(),
+            )
+            for s, r in zip(samples, rows)
+            if s.exemplar
+        ]
+
+    accepted_histograms = 0
+    histogram_samples, histogram_rows = [], []
+    if payload.histograms:
+        histogram_rows = [h.model_dump(exclude={"exemplars"}) for h in payload.histograms]
+        await catalog.resolve_rows(db, histogram_rows)
+        histogram_samples, histogram_rows, rejected_histograms = _admit(payload.histograms, histogram_rows)
+        rejected += rejected_histograms
+    if histogram_rows:
+        accepted_histograms = await histograms.ingest(db, histogram_rows)
+        for h, r in zip(histogram_samples, histogram_rows):
+            if h.exemplars:
+                key = histograms.series_hash(r["name"], r["platform_id"], r["service_id"], r["labels"], h.bounds)
+                sample_exemplars += [exemplars.from_sample(key, h.timestamp, e.model_dump()) for e in h.exemplars]
+
+    if sample_exemplars:
+        await exemplars.store(db, sample_exemplars)
+
+    return MetricIngestResponse(
+        accepted_samples=len(rows),
+        accepted_histograms=accepted_histograms,
+        rejected=rejected,
+    )
+
+
+@router.get("/histogram_quantile", response_model=List[HistogramQuantile])
+async def histogram_quantile(
+    name: str = Query(..., min_length=1, max_length=255),
+    quantile: float = Query(0.99, ge=0, le=1),
+    by: Optional[List[str]] = Query(None, description="Labels to group by before estimating"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    platform_id: Optional[UUID] = Query(None),
+    service_id: Optional[UUID] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Estimate a quantile of a histogram over a time range, per label group."""
+    start, end = _time_range(start, end, timedelta(hours=1))
+    results = await histograms.histogram_quantiles(
+        db, name, quantile, start, end, by=by, platform_id=platform_id, service_id=service_id,
+    )
+    found = await exemplars.load(
+        db, [(key, histogram.labels) for histogram, _ in results for key in histogram.series_hashes], start, end,
+    )
+    by_group = {}
+    for exemplar in found:
+        by_group.setdefault(tuple(sorted(exemplar["labels"].items())), []).append(exemplar)
+    return [
+        HistogramQuantile(
+            labels=histogram.labels,
+            quantile=quantile,
+            value=value,
+            count=histogram.count,
+            sum=histogram.sum,
+            exemplars=by_group.get(tuple(sorted(histogram.labels.items())), []),
+        )
+        for histogram, value in results
+    ]
+
+
+@router.get("/query", response_model=ExpressionQueryResponse)
+async def query_expression(
+    query: str = Query(..., min_length=1, max_length=4000, description="PromQL expression"),
+    start: Optional[datetime] = Query(None, description="Omit for an instant query at end"),
+    end: Optional[datetime] = Query(None),
+    step: int = Query(60, ge=1, le=86400, description="Resolution in seconds"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Evaluate a PromQL expression at ``end``, or every ``step`` over [start, end]."""
+    try:
+        expr = promql.parse(query)
+    except promql.QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    end = end or datetime.now(timezone.utc)
+    start, end = _time_range(start or end, end, timedelta(0))
+    if (end - start).total_seconds() / step > MAX_POINTS:
+        raise HTTPException(status_code=400, detail="Too many points per series; increase step")
+
+    start_ms, end_ms = to_millis(start), to_millis(end)
+    data = await query_engine.load(db, expr, start_ms, end_ms)
+    try:
+        result_type, series = await run_in_threadpool(
+            query_engine.evaluate, expr, data, start_ms, end_ms, step * 1000
+        )
+    except promql.QueryError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return FastJSONResponse({
+        "query": query,
+        "result_type": result_type,
+        "start": start,
+        "end": end,
+        "step": step,
+        "series": series,
+    })
+
+
+@router.get("/cardinality", response_model=CardinalityReport)
+async def get_cardinality(
+    platform_id: Optional[UUID] = Query(None),
+    limit: int = Query(20, ge=1, le=1000),
+):
+    """Top metrics and label keys by active series, and the label keys with the most values."""
+    return FastJSONResponse(cardinality.tracker.explore(platform_id, limit))
+
+
+@router.get("/query_range", response_model=MetricQueryResponse)
+async def query_range(
+    name: str = Query(..., min_length=1, max_length=255),
+    function: Optional[str] = Query(None, description="rate, increase, avg_over_time, ..."),
+    window: int = Query(300, ge=1, le=86400, description="Range function window in seconds"),
+    aggregation: Optional[str] = Query(None, description="sum, avg, min, max, count or quantile"),
+    by: Optional[List[str]] = Query(None, description="Labels to group the aggregation by"),
+    quantile: float = Query(0.99, ge=0, le=1),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    step: int = Query(60, ge=1, le=86400, description="Resolution in seconds"),
+    platform_id: Optional[UUID] = Query(None),
+    service_id: Optional[UUID] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Evaluate a metric over a time range, optionally through a range function and aggregation."""
+    if function and function not in metric_engine.RANGE_FUNCTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown function: {function}")
+    if aggregation and aggregation not in metric_engine.AGGREGATIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown aggregation: {aggregation}")
+
+    start, end = _time_range(start, end, timedelta(hours=1))
+    if (end - start).total_seconds() / step > MAX_POINTS:
+        raise HTTPException(status_code=400, detail="Too many points per series; increase step")
+
+    lookback = timedelta(seconds=window) if function else LOOKBACK
+    series = await load_series(
+        db, name, start - lookback, end + timedelta(milliseconds=1),
+        platform_id=platform_id, service_id=service_id,
+    )
+    result = await run_in_threadpool(
+        _evaluate, series, function, window, aggregation, by, quantile,
+        to_millis(start), to_millis(end), step * 1000,
+    )
+    found = await exemplars.load(
+        db,
+        [(series_hash(s.name, s.platform_id, s.service_id, s.labels), metric_engine.series_labels(s)) for s in series],
+        start,
+        end + timedelta(milliseconds=1),
+    )
+
+    return FastJSONResponse({
+        "name": name,
+        "function": function,
+        "aggregation": aggregation,
+        "start": start,
+        "end": end,
+        "step": step,
+        "series": result,
+        "exemplars": found,
+    })
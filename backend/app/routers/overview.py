@@ -1,18 +1,22 @@
+from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from typing import List
 
-from app.database import get_db
-from app.models import Platform, Service, Alert
+from app.config import settings
+from app.database import get_read_db
+from app.models import Platform, Service, Alert, Incident
 from app.schemas.common import SystemOverview
 from app.schemas.platform import PlatformOverview
+from app.services.histograms import histogram_quantiles
+from app.services.incidents import OPEN_STATUSES
 
 router = APIRouter()
 
 
 @router.get("", response_model=SystemOverview)
-async def get_system_overview(db: AsyncSession = Depends(get_db)):
+async def get_system_overview(db: AsyncSession = Depends(get_read_db)):
     """Get system-wide overview statistics."""
 
     # Count platforms
@@ -41,6 +45,18 @@ async def get_system_overview(db: AsyncSession = Depends(get_db)):
     )
     critical_alerts = critical_alerts_result.scalar() or 0
 
+    open_incidents_result = await db.execute(
+        select(func.count(Incident.id)).where(Incident.status.in_(OPEN_STATUSES))
+    )
+    open_incidents = open_incidents_result.scalar() or 0
+
+    # p99 latency across every service
+    now = datetime.now(timezone.utc)
+    latency = await histogram_quantiles(
+        db, settings.LATENCY_HISTOGRAM, 0.99, now - timedelta(minutes=settings.OVERVIEW_WINDOW_MINUTES), now
+    )
+    p99_latency = latency[0][1] if latency else 0.0
+
     # Calculate health score
     if total_services > 0:
         health_score = (healthy_services / total_services) * 100
@@ -56,15 +72,15 @@ async def get_system_overview(db: AsyncSession = Depends(get_db)):
         critical_services=critical_services,
         active_alerts=active_alerts,
         critical_alerts=critical_alerts,
-        open_incidents=0,  # TODO: Count from incidents table
+        open_incidents=open_incidents,
         requests_per_second=45230.0,  # TODO: Get from metrics
         error_rate=0.34,  # TODO: Get from metrics
-        p99_latency=156.0,  # TODO: Get from metrics
+        p99_latency=round(p99_latency, 2),
     )
 
 
 @router.get("/health-score")
-async def get_health_score(db: AsyncSession = Depends(get_db)):
+async def get_health_score(db: AsyncSession = Depends(get_read_db)):
     """Get global health score."""
     services_result = await db.execute(select(Service))
     services = services_result.scalars().all()
@@ -79,7 +95,7 @@ async def get_health_score(db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/stats")
-async def get_global_stats(db: AsyncSession = Depends(get_db)):
+async def get_global_stats(db: AsyncSession = Depends(get_read_db)):
     """Get global statistics."""
     # Platforms count
     platforms_result = await db.execute(select(func.count(Platform.id)))
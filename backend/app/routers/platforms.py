@@ -1,30 +1,119 @@
-from typing import List, Optional
-from uuid import UUID
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 
-from app.database import get_db
+from app.config import settings
+from app.database import get_db, get_read_db
 from app.models import Platform, Service, Alert
+from app.responses import FastJSONResponse
+from app.schemas.bulk import BulkUpsertResponse
 from app.schemas.platform import (
     PlatformCreate,
+    PlatformBulkUpsert,
     PlatformUpdate,
     PlatformResponse,
     PlatformOverview,
 )
+from app.services import inventory
+from app.services.histograms import histogram_quantiles
 
 router = APIRouter()
 
 
+# Columns of PlatformOverview that come straight from the platforms table
+PLATFORM_OVERVIEW_COLUMNS = [
+    name for name in PlatformOverview.model_fields if name in Platform.__table__.c
+]
+
+
+def _platform_overview_query():
+    """Platforms joined with service and firing-alert counts in a single statement."""
+    service_stats = (
+        select(
+            Service.platform_id,
+            func.count(Service.id).label("service_count"),
+            func.count(Service.id).filter(Service.status == "healthy").label("healthy_service_count"),
+        )
+        .group_by(Service.platform_id)
+        .subquery()
+    )
+    alert_stats = (
+        select(Alert.platform_id, func.count(Alert.id).label("alert_count"))
+        .where(Alert.status == "firing")
+        .group_by(Alert.platform_id)
+        .subquery()
+    )
+    return (
+        select(
+            *(Platform.__table__.c[name] for name in PLATFORM_OVERVIEW_COLUMNS),
+            func.coalesce(service_stats.c.service_count, 0),
+            func.coalesce(service_stats.c.healthy_service_count, 0),
+            func.coalesce(alert_stats.c.alert_count, 0),
+        )
+        .outerjoin(service_stats, service_stats.c.platform_id == Platform.id)
+        .outerjoin(alert_stats, alert_stats.c.platform_id == Platform.id)
+    )
+
+
+def _platform_overview_row(row) -> dict:
+    """Build a PlatformOverview-shaped dict from a _platform_overview_query row."""
+    overview = dict(zip(PLATFORM_OVERVIEW_COLUMNS, row))
+    overview["service_count"], overview["healthy_service_count"], overview["alert_count"] = row[-3:]
+    overview["default_availability_target"] = float(overview["default_availability_target"] or 0.999)
+    overview["default_latency_target_ms"] = int(overview["default_latency_target_ms"] or 500)
+    overview["health_score"] = float(overview["health_score"] or 100)
+    overview["settings"] = overview["settings"] or {}
+    return overview
+
+
+class LatencyCache:
+    """p99 of the latency histogram by platform id, recomputed every OVERVIEW_LATENCY_CACHE_SECONDS."""
+
+    def __init__(self):
+        self.p99: Dict[str, float] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _due(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= settings.OVERVIEW_LATENCY_CACHE_SECONDS
+
+    async def get(self, db: AsyncSession) -> Dict[str, float]:
+        if self._due():
+            async with self._lock:  # one request merges the histograms, the others wait for it
+                if self._due():
+                    await self._load(db)
+        return self.p99
+
+    async def _load(self, db: AsyncSession):
+        now = datetime.now(timezone.utc)
+        results = await histogram_quantiles(
+            db,
+            settings.LATENCY_HISTOGRAM,
+            0.99,
+            now - timedelta(minutes=settings.OVERVIEW_WINDOW_MINUTES),
+            now,
+            by=["platform_id"],
+        )
+        self.p99 = {histogram.labels.get("platform_id"): round(value, 2) for histogram, value in results}
+        self._loaded_at = time.monotonic()
+
+
+latency_cache = LatencyCache()
+
+
 @router.get("", response_model=List[PlatformOverview])
 async def list_platforms(
     is_active: Optional[bool] = Query(None),
     criticality: Optional[str] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """List all platforms with their overview stats."""
-    query = select(Platform)
+    query = _platform_overview_query()
 
     if is_active is not None:
         query = query.where(Platform.is_active == is_active)
@@ -32,117 +121,38 @@ async def list_platforms(
         query = query.where(Platform.criticality == criticality)
 
     result = await db.execute(query)
-    platforms = result.scalars().all()
+    p99_latency = await latency_cache.get(db)
 
-    # Build overview for each platform
     overviews = []
-    for platform in platforms:
-        # Get service counts
-        services_result = await db.execute(
-            select(Service).where(Service.platform_id == platform.id)
-        )
-        services = services_result.scalars().all()
-        service_count = len(services)
-        healthy_service_count = len([s for s in services if s.status == "healthy"])
-
-        # Get alert count
-        alerts_result = await db.execute(
-            select(func.count(Alert.id)).where(
-                Alert.platform_id == platform.id,
-                Alert.status == "firing"
-            )
-        )
-        alert_count = alerts_result.scalar() or 0
-
-        overview = PlatformOverview(
-            id=platform.id,
-            code=platform.code,
-            name=platform.name,
-            description=platform.description,
-            color=platform.color,
-            icon=platform.icon,
-            base_url=platform.base_url,
-            metrics_endpoint=platform.metrics_endpoint,
-            logs_endpoint=platform.logs_endpoint,
-            traces_endpoint=platform.traces_endpoint,
-            criticality=platform.criticality,
-            default_availability_target=float(platform.default_availability_target or 0.999),
-            default_latency_target_ms=int(platform.default_latency_target_ms or 500),
-            settings=platform.settings or {},
-            status=platform.status,
-            health_score=float(platform.health_score or 100),
-            last_health_check=platform.last_health_check,
-            is_active=platform.is_active,
-            created_at=platform.created_at,
-            updated_at=platform.updated_at,
-            service_count=service_count,
-            healthy_service_count=healthy_service_count,
-            alert_count=alert_count,
-            requests_per_second=1500.0 + (hash(platform.code) % 3000),  # TODO: Get from metrics
-            error_rate=0.1 + (hash(platform.code) % 10) / 100,  # TODO: Get from metrics
-            p99_latency=100.0 + (hash(platform.code) % 150),  # TODO: Get from metrics
-        )
+    for row in result.all():
+        overview = _platform_overview_row(row)
+        code = overview["code"]
+        overview["requests_per_second"] = 1500.0 + (hash(code) % 3000)  # TODO: Get from metrics
+        overview["error_rate"] = 0.1 + (hash(code) % 10) / 100  # TODO: Get from metrics
+        overview["p99_latency"] = p99_latency.get(str(overview["id"]), 0.0)
         overviews.append(overview)
 
-    return overviews
+    return FastJSONResponse(overviews)
 
 
 @router.get("/{code}", response_model=PlatformOverview)
-async def get_platform(code: str, db: AsyncSession = Depends(get_db)):
+async def get_platform(code: str, db: AsyncSession = Depends(get_read_db)):
     """Get a specific platform by code."""
     result = await db.execute(
-        select(Platform).where(Platform.code == code)
+        _platform_overview_query().where(Platform.code == code)
     )
-    platform = result.scalar_one_or_none()
+    row = result.first()
 
-    if not platform:
+    if not row:
         raise HTTPException(status_code=404, detail="Platform not found")
 
-    # Get service counts
-    services_result = await db.execute(
-        select(Service).where(Service.platform_id == platform.id)
-    )
-    services = services_result.scalars().all()
-    service_count = len(services)
-    healthy_service_count = len([s for s in services if s.status == "healthy"])
-
-    # Get alert count
-    alerts_result = await db.execute(
-        select(func.count(Alert.id)).where(
-            Alert.platform_id == platform.id,
-            Alert.status == "firing"
-        )
-    )
-    alert_count = alerts_result.scalar() or 0
-
-    return PlatformOverview(
-        id=platform.id,
-        code=platform.code,
-        name=platform.name,
-        description=platform.description,
-        color=platform.color,
-        icon=platform.icon,
-        base_url=platform.base_url,
-        metrics_endpoint=platform.metrics_endpoint,
-        logs_endpoint=platform.logs_endpoint,
-        traces_endpoint=platform.traces_endpoint,
-        criticality=platform.criticality,
-        default_availability_target=float(platform.default_availability_target or 0.999),
-        default_latency_target_ms=int(platform.default_latency_target_ms or 500),
-        settings=platform.settings or {},
-        status=platform.status,
-        health_score=float(platform.health_score or 100),
-        last_health_check=platform.last_health_check,
-        is_active=platform.is_active,
-        created_at=platform.created_at,
-        updated_at=platform.updated_at,
-        service_count=service_count,
-        healthy_service_count=healthy_service_count,
-        alert_count=alert_count,
-        requests_per_second=1500.0,
-        error_rate=0.15,
-        p99_latency=120.0,
-    )
+    overview = _platform_overview_row(row)
+    overview["requests_per_second"] = 1500.0
+    overview["error_rate"] = 0.15
+    p99_latency = await latency_cache.get(db)
+    overview["p99_latency"] = p99_latency.get(str(overview["id"]), 0.0)
+
+    return FastJSONResponse(overview)
 
 
 @router.post("", response_model=PlatformResponse, status_code=201)
@@ -166,6 +176,31 @@ async def create_platform(
     return platform
 
 
+@router.post("/bulk", response_model=BulkUpsertResponse)
+async def bulk_upsert_platforms(
+    payload: PlatformBulkUpsert,
+    db: AsyncSession = Depends(get_db),
+):
+    """Create or update platforms by code, optionally deactivating the ones not listed."""
+    # A code listed twice keeps its last definition
+    latest = {item.code: index for index, item in enumerate(payload.items)}
+    rows = [item.model_dump() for index, item in enumerate(payload.items) if latest[item.code] == index]
+    written = await inventory.upsert(db, Platform, ["code"], rows)
+
+    deactivated = 0
+    if payload.deactivate_missing:
+        deactivated = await inventory.deactivate_missing(db, Platform, ["code"], list(written))
+
+    items = []
+    for index, item in enumerate(payload.items):
+        if latest[item.code] != index:
+            items.append({"index": index, "key": item.code, "status": "skipped", "detail": "Superseded by a later item"})
+            continue
+        platform_id, status = written[(item.code,)]
+        items.append({"index": index, "key": item.code, "id": platform_id, "status": status})
+    return FastJSONResponse(inventory.summarize(items, deactivated))
+
+
 @router.put("/{code}", response_model=PlatformResponse)
 async def update_platform(
     code: str,
@@ -207,7 +242,7 @@ async def delete_platform(code: str, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/{code}/health")
-async def get_platform_health(code: str, db: AsyncSession = Depends(get_db)):
+async def get_platform_health(code: str, db: AsyncSession = Depends(get_read_db)):
     """Get health status for a platform."""
     result = await db.execute(
         select(Platform).where(Platform.code == code)
@@ -225,7 +260,7 @@ async def get_platform_health(code: str, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/{code}/services", response_model=List[dict])
-async def get_platform_services(code: str, db: AsyncSession = Depends(get_db)):
+async def get_platform_services(code: str, db: AsyncSession = Depends(get_read_db)):
     """Get all services for a platform."""
     result = await db.execute(
         select(Platform).where(Platform.code == code)
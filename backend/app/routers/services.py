@@ -2,18 +2,27 @@ from typing import List, Optional
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import Service, Platform
+from app.responses import FastJSONResponse, rows_to_dicts
+from app.schemas.bulk import BulkUpsertResponse
 from app.schemas.service import (
     ServiceCreate,
+    ServiceBulkUpsert,
     ServiceUpdate,
     ServiceResponse,
 )
+from app.services import inventory
+from app.services.catalog import catalog, parse_selector
 
 router = APIRouter()
 
+# ServiceResponse fields map one-to-one onto services columns
+SERVICE_RESPONSE_COLUMNS = list(ServiceResponse.model_fields)
+
 
 @router.get("", response_model=List[ServiceResponse])
 async def list_services(
@@ -21,12 +30,25 @@ async def list_services(
     service_type: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     is_active: Optional[bool] = Query(None),
+    team: Optional[str] = Query(None),
+    selector: Optional[str] = Query(None, description='Label selector, e.g. tier=~"api|web",env!=staging'),
     limit: int = Query(100, ge=1, le=500),
     offset: int = Query(0, ge=0),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """List all services with optional filters."""
-    query = select(Service)
+    query = select(*(Service.__table__.c[name] for name in SERVICE_RESPONSE_COLUMNS))
+
+    if team or selector:
+        await catalog.ready(db)
+        try:
+            ids = await catalog.select(parse_selector(selector or ""))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if team:
+            ids &= catalog.services_of_team(team)
+        # One array parameter: a broad selector can match more services than a statement takes parameters
+        query = query.where(Service.id == any_(bindparam("service_ids", list(ids), type_=ARRAY(Service.id.type))))
 
     if platform_id:
         query = query.where(Service.platform_id == platform_id)
@@ -40,13 +62,55 @@ async def list_services(
     query = query.offset(offset).limit(limit)
 
     result = await db.execute(query)
-    services = result.scalars().all()
+    services = rows_to_dicts(SERVICE_RESPONSE_COLUMNS, result.all())
+    for service in services:
+        service["health_score"] = float(service["health_score"] or 100)
+        service["settings"] = service["settings"] or {}
+        service["labels"] = service["labels"] or {}
+
+    return FastJSONResponse(services)
+
+
+@router.post("/bulk", response_model=BulkUpsertResponse)
+async def bulk_upsert_services(
+    payload: ServiceBulkUpsert,
+    db: AsyncSession = Depends(get_db),
+):
+    """Create or update services by platform and slug, optionally deactivating the ones not listed."""
+    platform_ids = {item.platform_id for item in payload.items}
+    known = set((await db.execute(select(Platform.id).where(Platform.id.in_(platform_ids)))).scalars().all())
+
+    # A slug listed twice for a platform keeps its last definition
+    latest = {(item.platform_id, item.slug): index for index, item in enumerate(payload.items)}
+    rows = [
+        item.model_dump()
+        for index, item in enumerate(payload.items)
+        if item.platform_id in known and latest[(item.platform_id, item.slug)] == index
+    ]
+    written = await inventory.upsert(db, Service, ["platform_id", "slug"], rows)
+
+    deactivated = 0
+    if payload.deactivate_missing and known:
+        deactivated = await inventory.deactivate_missing(
+            db, Service, ["platform_id", "slug"], list(written), scope=Service.platform_id.in_(known)
+        )
 
-    return services
+    items = []
+    for index, item in enumerate(payload.items):
+        key = (item.platform_id, item.slug)
+        result = {"index": index, "key": f"{item.platform_id}/{item.slug}"}
+        if item.platform_id not in known:
+            result.update(status="failed", detail="Platform not found")
+        elif latest[key] != index:
+            result.update(status="skipped", detail="Superseded by a later item")
+        else:
+            result["id"], result["status"] = written[key]
+        items.append(result)
+    return FastJSONResponse(inventory.summarize(items, deactivated))
 
 
 @router.get("/{service_id}", response_model=ServiceResponse)
-async def get_service(service_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_service(service_id: UUID, db: AsyncSession = Depends(get_read_db)):
     """Get a specific service by ID."""
     result = await db.execute(
         select(Service).where(Service.id == service_id)
@@ -131,7 +195,7 @@ async def delete_service(service_id: UUID, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/{service_id}/health")
-async def get_service_health(service_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_service_health(service_id: UUID, db: AsyncSession = Depends(get_read_db)):
     """Get health status for a service."""
     result = await db.execute(
         select(Service).where(Service.id == service_id)
@@ -150,7 +214,7 @@ async def get_service_health(service_id: UUID, db: AsyncSession = Depends(get_db
 
 
 @router.get("/{service_id}/dependencies")
-async def get_service_dependencies(service_id: UUID, db: AsyncSession = Depends(get_db)):
+async def get_service_dependencies(service_id: UUID, db: AsyncSession = Depends(get_read_db)):
     """Get dependencies for a service."""
     result = await db.execute(
         select(Service).where(Service.id == service_id)
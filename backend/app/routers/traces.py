@@ -0,0 +1,104 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_
+
+from app.database import get_read_db
+from app.models import Trace
+from app.ratelimit import charge_ingest
+from app.responses import FastJSONResponse
+from app.schemas.trace import (
+    TraceIngestRequest,
+    TraceIngestResponse,
+    TraceResponse,
+    TraceWithLogs,
+    TraceAnalysis,
+    TraceAggregateAnalysis,
+)
+from app.services import span_codec, trace_analysis, trace_logs
+from app.services.span_assembler import assembler
+
+router = APIRouter()
+
+TRACE_COLUMNS = [name for name in TraceResponse.model_fields if name != "spans"]
+
+
+@router.post("/ingest", response_model=TraceIngestResponse, status_code=202)
+async def ingest_spans(payload: TraceIngestRequest, request: Request):
+    """Buffer a batch of spans; traces are sampled and stored once complete."""
+    await charge_ingest(request, "spans", Counter(span.platform_id for span in payload.spans))
+    accepted = assembler.add(span.model_dump() for span in payload.spans)
+    return TraceIngestResponse(accepted=accepted)
+
+
+@router.get("/analysis", response_model=TraceAggregateAnalysis)
+async def analyze_endpoint(
+    endpoint: str = Query(..., min_length=1, description="Root span name or HTTP route"),
+    platform_id: Optional[UUID] = Query(None),
+    minutes: int = Query(60, ge=1, le=10080),
+    samples: int = Query(100, ge=1, le=1000, description="Most recent traces merged"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Merge the critical path breakdowns of an endpoint's recent traces."""
+    since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+    query = select(Trace.trace_id).where(
+        or_(Trace.root_span_name == endpoint, Trace.http_path == endpoint),
+        Trace.start_time >= since,
+    )
+    if platform_id:
+        query = query.where(Trace.platform_id == platform_id)
+    trace_ids = (await db.execute(query.order_by(Trace.start_time.desc()).limit(samples))).scalars().all()
+
+    merged = trace_analysis.merge(await trace_analysis.analyses_for(db, list(trace_ids)))
+    return FastJSONResponse({"endpoint": endpoint, **merged})
+
+
+@router.get("/{trace_id}", response_model=TraceResponse)
+async def get_trace(trace_id: str, db: AsyncSession = Depends(get_read_db)):
+    """Get a trace with its span tree."""
+    row = (await db.execute(
+        select(*(Trace.__table__.c[name] for name in TRACE_COLUMNS), Trace.span_data)
+        .where(Trace.trace_id == trace_id)
+    )).one_or_none()
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+
+    trace = dict(zip(TRACE_COLUMNS, row))
+    trace["services_involved"] = trace["services_involved"] or []
+    trace["spans"] = span_codec.build_tree(await span_codec.load_spans(db, trace_id, row.span_data))
+    return FastJSONResponse(trace)
+
+
+@router.get("/{trace_id}/logs", response_model=TraceWithLogs)
+async def get_trace_with_logs(trace_id: str, db: AsyncSession = Depends(get_read_db)):
+    """Get a trace with the log lines it wrote attached to their spans."""
+    row = (await db.execute(
+        select(*(Trace.__table__.c[name] for name in TRACE_COLUMNS)).where(Trace.trace_id == trace_id)
+    )).one_or_none()
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+
+    trace = dict(zip(TRACE_COLUMNS, row))
+    trace["services_involved"] = trace["services_involved"] or []
+    trace["spans"], trace["unattached_logs"] = await trace_logs.correlate(
+        trace_id, trace["start_time"], trace["end_time"]
+    )
+    return FastJSONResponse(trace)
+
+
+@router.get("/{trace_id}/analysis", response_model=TraceAnalysis)
+async def analyze_trace(
+    trace_id: str,
+    top: int = Query(20, ge=0, le=trace_analysis.TOP_SPANS, description="Spans with the most self time"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Critical path, self time and per-service breakdown of a trace."""
+    analysis = await trace_analysis.analysis_for(db, trace_id)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return FastJSONResponse({"trace_id": trace_id, **analysis, "top_spans": analysis["top_spans"][:top]})
@@ -1,6 +1,7 @@
 from app.schemas.platform import (
     PlatformBase,
     PlatformCreate,
+    PlatformBulkUpsert,
     PlatformUpdate,
     PlatformResponse,
     PlatformOverview,
@@ -8,9 +9,63 @@ from app.schemas.platform import (
 from app.schemas.service import (
     ServiceBase,
     ServiceCreate,
+    ServiceBulkUpsert,
     ServiceUpdate,
     ServiceResponse,
 )
+from app.schemas.bulk import (
+    BulkItemResult,
+    BulkUpsertResponse,
+)
+from app.schemas.log import (
+    LogIngestEntry,
+    LogIngestRequest,
+    LogIngestResponse,
+    LogPattern,
+    LogRecord,
+)
+from app.schemas.metric import (
+    Exemplar,
+    ExemplarIngest,
+    MetricSeries,
+    MetricQueryResponse,
+    ExpressionQueryResponse,
+    MetricIngestSample,
+    HistogramIngestSample,
+    MetricIngestRequest,
+    MetricIngestResponse,
+    HistogramQuantile,
+    CardinalityReport,
+)
+from app.schemas.trace import (
+    SpanIngest,
+    TraceIngestRequest,
+    TraceIngestResponse,
+    TraceSpan,
+    TraceResponse,
+    TraceLogSpan,
+    TraceWithLogs,
+    CriticalPathSegment,
+    ServiceTime,
+    OperationTime,
+    SpanTime,
+    TraceAnalysis,
+    AggregateServiceTime,
+    AggregateOperationTime,
+    TraceAggregateAnalysis,
+)
+from app.schemas.incident import (
+    IncidentEventCreate,
+    IncidentEventResponse,
+    IncidentTimelinePage,
+    IncidentSummary,
+    IncidentResponse,
+)
+from app.schemas.auth import (
+    LoginRequest,
+    TokenResponse,
+    PrincipalResponse,
+)
 from app.schemas.common import (
     HealthCheck,
     SystemOverview,
@@ -21,13 +76,56 @@ from app.schemas.common import (
 __all__ = [
     "PlatformBase",
     "PlatformCreate",
+    "PlatformBulkUpsert",
     "PlatformUpdate",
     "PlatformResponse",
     "PlatformOverview",
     "ServiceBase",
     "ServiceCreate",
+    "ServiceBulkUpsert",
     "ServiceUpdate",
     "ServiceResponse",
+    "BulkItemResult",
+    "BulkUpsertResponse",
+    "LogIngestEntry",
+    "LogIngestRequest",
+    "LogIngestResponse",
+    "LogPattern",
+    "LogRecord",
+    "Exemplar",
+    "ExemplarIngest",
+    "MetricSeries",
+    "MetricQueryResponse",
+    "ExpressionQueryResponse",
+    "MetricIngestSample",
+    "HistogramIngestSample",
+    "MetricIngestRequest",
+    "MetricIngestResponse",
+    "HistogramQuantile",
+    "CardinalityReport",
+    "SpanIngest",
+    "TraceIngestRequest",
+    "TraceIngestResponse",
+    "TraceSpan",
+    "TraceResponse",
+    "TraceLogSpan",
+    "TraceWithLogs",
+    "CriticalPathSegment",
+    "ServiceTime",
+    "OperationTime",
+    "SpanTime",
+    "TraceAnalysis",
+    "AggregateServiceTime",
+    "AggregateOperationTime",
+    "TraceAggregateAnalysis",
+    "IncidentEventCreate",
+    "IncidentEventResponse",
+    "IncidentTimelinePage",
+    "IncidentSummary",
+    "IncidentResponse",
+    "LoginRequest",
+    "TokenResponse",
+    "PrincipalResponse",
     "HealthCheck",
     "SystemOverview",
     "TimeRange",
@@ -0,0 +1,22 @@
+from typing import List
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+class LoginRequest(BaseModel):
+    email: str = Field(..., min_length=3, max_length=255)
+    password: str = Field(..., min_length=1, max_length=1024)
+
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int  # seconds
+
+
+class PrincipalResponse(BaseModel):
+    id: UUID
+    email: str
+    name: str
+    role: str
+    permissions: List[str]
@@ -0,0 +1,20 @@
+from typing import List, Optional
+from uuid import UUID
+from pydantic import BaseModel
+
+
+class BulkItemResult(BaseModel):
+    index: int  # position in the request
+    key: str  # platform code, or "platform_id/slug" for services
+    id: Optional[UUID] = None
+    status: str  # created, updated, unchanged, skipped, failed
+    detail: Optional[str] = None
+
+
+class BulkUpsertResponse(BaseModel):
+    created: int
+    updated: int
+    unchanged: int
+    failed: int
+    deactivated: int
+    items: List[BulkItemResult]
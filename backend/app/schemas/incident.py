@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+class IncidentEventCreate(BaseModel):
+    action: str = Field(..., min_length=1, max_length=50)
+    kind: str = Field(default="timeline", pattern="^(timeline|action_item)$")
+    timestamp: Optional[datetime] = None
+    user: Optional[str] = Field(None, max_length=255)
+    note: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+
+
+class IncidentEventResponse(BaseModel):
+    id: int
+    incident_id: UUID
+    timestamp: datetime
+    kind: str
+    action: str
+    user: Optional[str] = None
+    note: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+
+
+class IncidentTimelinePage(BaseModel):
+    events: List[IncidentEventResponse]
+    next_cursor: Optional[str] = None
+
+
+class IncidentSummary(BaseModel):
+    id: UUID
+    title: str
+    severity: str
+    status: str
+    started_at: datetime
+    resolved_at: Optional[datetime] = None
+    affected_platforms: List[str] = Field(default_factory=list)
+    affected_services: List[str] = Field(default_factory=list)
+
+
+class IncidentResponse(IncidentSummary):
+    description: Optional[str] = None
+    detected_at: Optional[datetime] = None
+    acknowledged_at: Optional[datetime] = None
+    closed_at: Optional[datetime] = None
+    customer_impact: Optional[str] = None
+    root_cause: Optional[str] = None
+    resolution: Optional[str] = None
+    postmortem_url: Optional[str] = None
+    timeline: List[Dict[str, Any]] = Field(default_factory=list)
+    action_items: List[Dict[str, Any]] = Field(default_factory=list)
+    created_at: datetime
+    updated_at: datetime
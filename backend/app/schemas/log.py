@@ -0,0 +1,58 @@
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+class LogIngestEntry(BaseModel):
+    timestamp: datetime
+    platform_id: Optional[UUID] = None
+    service_id: Optional[UUID] = None
+    level: str = Field(..., pattern="^(debug|info|warn|error|fatal)$")
+    message: str
+    trace_id: Optional[str] = Field(None, max_length=64)
+    span_id: Optional[str] = Field(None, max_length=32)
+    request_id: Optional[str] = Field(None, max_length=64)
+    user_id: Optional[str] = Field(None, max_length=255)
+    source: Optional[str] = Field(None, max_length=255)
+    environment: Optional[str] = Field(None, max_length=20)
+    host: Optional[str] = Field(None, max_length=255)
+    container_id: Optional[str] = Field(None, max_length=100)
+    pod_name: Optional[str] = Field(None, max_length=255)
+    attributes: Dict[str, Any] = Field(default_factory=dict)
+
+
+class LogIngestRequest(BaseModel):
+    entries: List[LogIngestEntry] = Field(..., min_length=1, max_length=10000)
+
+
+class LogIngestResponse(BaseModel):
+    accepted: int
+    new_templates: int = 0
+
+
+class LogPattern(BaseModel):
+    template_id: int
+    template: str
+    count: int
+    first_seen: datetime
+    is_new: bool = False
+
+
+class LogRecord(BaseModel):
+    id: UUID
+    timestamp: datetime
+    platform_id: Optional[UUID] = None
+    service_id: Optional[UUID] = None
+    level: str
+    message: str
+    trace_id: Optional[str] = None
+    span_id: Optional[str] = None
+    request_id: Optional[str] = None
+    user_id: Optional[str] = None
+    source: Optional[str] = None
+    environment: Optional[str] = None
+    host: Optional[str] = None
+    container_id: Optional[str] = None
+    pod_name: Optional[str] = None
+    attributes: Optional[Dict[str, Any]] = Field(default_factory=dict)
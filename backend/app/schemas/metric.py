@@ -0,0 +1,130 @@
+from datetime import datetime
+from typing import Optional, Dict, List
+from uuid import UUID
+from pydantic import BaseModel, Field, model_validator
+
+
+class Exemplar(BaseModel):
+    labels: Dict[str, str]
+    timestamp: int  # unix milliseconds
+    value: float
+    trace_id: str
+    span_id: Optional[str] = None
+
+
+class MetricSeries(BaseModel):
+    labels: Dict[str, str]
+    timestamps: List[int]  # unix milliseconds
+    values: List[float]
+
+
+class MetricQueryResponse(BaseModel):
+    name: str
+    function: Optional[str] = None
+    aggregation: Optional[str] = None
+    start: datetime
+    end: datetime
+    step: int  # seconds
+    series: List[MetricSeries]
+    exemplars: List[Exemplar] = Field(default_factory=list)
+
+
+class ExpressionQueryResponse(BaseModel):
+    query: str
+    result_type: str  # vector or scalar
+    start: datetime
+    end: datetime
+    step: int  # seconds
+    series: List[MetricSeries]
+
+
+class MetricCardinality(BaseModel):
+    name: str
+    series: int
+
+
+class LabelKeyCardinality(BaseModel):
+    key: str
+    series: int
+
+
+class LabelValueCardinality(BaseModel):
+    name: str
+    key: str
+    values: int
+
+
+class OffendingLabel(BaseModel):
+    platform_id: Optional[UUID]
+    name: str
+    key: str
+
+
+class CardinalityReport(BaseModel):
+    window_seconds: int
+    metrics: List[MetricCardinality]
+    label_keys: List[LabelKeyCardinality]
+    label_values: List[LabelValueCardinality]
+    offending: List[OffendingLabel]
+
+
+class ExemplarIngest(BaseModel):
+    trace_id: str = Field(..., min_length=1, max_length=64)
+    span_id: Optional[str] = Field(None, max_length=32)
+    value: float  # the observation the trace produced, e.g. its latency
+    timestamp: Optional[datetime] = None  # defaults to the sample's
+
+
+class MetricIngestSample(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+    metric_type: str = Field("gauge", pattern="^(counter|gauge)$")
+    timestamp: datetime
+    value: float
+    platform_id: Optional[UUID] = None
+    service_id: Optional[UUID] = None
+    labels: Dict[str, str] = Field(default_factory=dict)
+    unit: Optional[str] = Field(None, max_length=50)
+    exemplar: Optional[ExemplarIngest] = None
+
+
+class HistogramIngestSample(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+    timestamp: datetime
+    platform_id: Optional[UUID] = None
+    service_id: Optional[UUID] = None
+    labels: Dict[str, str] = Field(default_factory=dict)
+    unit: Optional[str] = Field(None, max_length=50)
+    bounds: List[float] = Field(..., min_length=1, max_length=256)  # bucket upper bounds, +Inf implied
+    counts: List[int] = Field(..., min_length=2, max_length=257)  # observations per bucket since the last sample
+    sum: float = 0.0
+    exemplars: List[ExemplarIngest] = Field(default_factory=list, max_length=16)
+
+    @model_validator(mode="after")
+    def check_buckets(self):
+        if any(b <= a for a, b in zip(self.bounds, self.bounds[1:])):
+            raise ValueError("bounds must be strictly increasing")
+        if len(self.counts) != len(self.bounds) + 1:
+            raise ValueError("counts needs one entry per bound plus one for +Inf")
+        if any(c < 0 for c in self.counts):
+            raise ValueError("counts must not be negative")
+        return self
+
+
+class MetricIngestRequest(BaseModel):
+    samples: List[MetricIngestSample] = Field(default_factory=list, max_length=10000)
+    histograms: List[HistogramIngestSample] = Field(default_factory=list, max_length=10000)
+
+
+class MetricIngestResponse(BaseModel):
+    accepted_samples: int
+    accepted_histograms: int
+    rejected: int = 0  # samples dropped by cardinality limits; merged ones are not counted
+
+
+class HistogramQuantile(BaseModel):
+    labels: Dict[str, str]
+    quantile: float
+    value: float
+    count: float
+    sum: float
+    exemplars: List[Exemplar] = Field(default_factory=list)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from uuid import UUID
 from pydantic import BaseModel, Field
 
@@ -24,6 +24,12 @@ class PlatformCreate(PlatformBase):
     pass
 
 
+class PlatformBulkUpsert(BaseModel):
+    items: List[PlatformCreate] = Field(..., min_length=1, max_length=5000)
+    # Deactivate every active platform not in items
+    deactivate_missing: bool = False
+
+
 class PlatformUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
     description: Optional[str] = None
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from uuid import UUID
 from pydantic import BaseModel, Field
 
@@ -25,6 +25,12 @@ class ServiceCreate(ServiceBase):
     platform_id: UUID
 
 
+class ServiceBulkUpsert(BaseModel):
+    items: List[ServiceCreate] = Field(..., min_length=1, max_length=5000)
+    # Deactivate active services of the platforms in items that items omit
+    deactivate_missing: bool = False
+
+
 class ServiceUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
     description: Optional[str] = None
@@ -0,0 +1,143 @@
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+from app.schemas.log import LogRecord
+
+
+class SpanIngest(BaseModel):
+    trace_id: str = Field(..., min_length=1, max_length=64)
+    span_id: str = Field(..., min_length=1, max_length=32)
+    parent_span_id: Optional[str] = Field(None, max_length=32)
+    platform_id: Optional[UUID] = None
+    service_id: Optional[UUID] = None
+    start_time: datetime
+    end_time: datetime
+    name: str = Field(..., min_length=1, max_length=255)
+    kind: Optional[str] = Field(None, pattern="^(server|client|producer|consumer|internal)$")
+    status: str = Field("ok", pattern="^(ok|error|timeout|unset)$")
+    status_message: Optional[str] = None
+    attributes: Dict[str, Any] = Field(default_factory=dict)
+    events: List[Dict[str, Any]] = Field(default_factory=list)
+    links: List[Dict[str, Any]] = Field(default_factory=list)
+
+
+class TraceIngestRequest(BaseModel):
+    spans: List[SpanIngest] = Field(..., min_length=1, max_length=10000)
+
+
+class TraceIngestResponse(BaseModel):
+    accepted: int
+
+
+class TraceSpan(BaseModel):
+    span_id: str
+    parent_span_id: Optional[str] = None
+    depth: int
+    child_count: int
+    service_id: Optional[UUID] = None
+    start_time: datetime
+    end_time: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+    name: str
+    kind: Optional[str] = None
+    status: Optional[str] = None
+    status_message: Optional[str] = None
+    attributes: Dict[str, Any] = Field(default_factory=dict)
+    events: List[Dict[str, Any]] = Field(default_factory=list)
+    links: List[Dict[str, Any]] = Field(default_factory=list)
+
+
+class TraceResponse(BaseModel):
+    trace_id: str
+    platform_id: Optional[UUID] = None
+    root_service_id: Optional[UUID] = None
+    start_time: datetime
+    end_time: Optional[datetime] = None
+    duration_ms: Optional[int] = None
+    root_span_name: Optional[str] = None
+    services_involved: List[str] = Field(default_factory=list)
+    span_count: int
+    status: str
+    has_error: bool
+    error_message: Optional[str] = None
+    http_method: Optional[str] = None
+    http_path: Optional[str] = None
+    http_status_code: Optional[int] = None
+    user_id: Optional[str] = None
+    # Depth-first, children in start-time order
+    spans: List[TraceSpan] = Field(default_factory=list)
+
+
+class TraceLogSpan(TraceSpan):
+    # Log lines written under this span, oldest first
+    logs: List[LogRecord] = Field(default_factory=list)
+
+
+class TraceWithLogs(TraceResponse):
+    spans: List[TraceLogSpan] = Field(default_factory=list)
+    # Lines carrying the trace id but no span of it
+    unattached_logs: List[LogRecord] = Field(default_factory=list)
+
+
+class CriticalPathSegment(BaseModel):
+    span_id: str
+    name: str
+    service_id: Optional[UUID] = None
+    start_offset_ms: float  # from the start of the trace
+    duration_ms: float
+
+
+class ServiceTime(BaseModel):
+    service_id: Optional[UUID] = None
+    span_count: float
+    self_time_ms: float
+    critical_time_ms: float
+
+
+class OperationTime(ServiceTime):
+    name: str
+
+
+class SpanTime(BaseModel):
+    span_id: str
+    name: str
+    service_id: Optional[UUID] = None
+    duration_ms: float
+    self_time_ms: float
+    critical_time_ms: float
+    overlap_ms: float  # child time that ran in parallel
+
+
+class TraceAnalysis(BaseModel):
+    trace_id: str
+    span_count: int
+    duration_ms: float
+    critical_path_ms: float
+    overlap_ms: float
+    average_concurrency: float  # total self time over wall time
+    critical_path: List[CriticalPathSegment]
+    services: List[ServiceTime]
+    operations: List[OperationTime]
+    top_spans: List[SpanTime]
+
+
+class AggregateServiceTime(ServiceTime):
+    # Means per trace, except the share of all critical path time and the
+    # number of traces where it was on the critical path
+    critical_path_share: float
+    traces_on_critical_path: int
+
+
+class AggregateOperationTime(AggregateServiceTime):
+    name: str
+
+
+class TraceAggregateAnalysis(BaseModel):
+    endpoint: str
+    traces: int
+    mean_duration_ms: float
+    mean_critical_path_ms: float
+    services: List[AggregateServiceTime]
+    operations: List[AggregateOperationTime]
@@ -0,0 +1,403 @@
+"""
+Streaming anomaly detection for metric series.
+
+Every series owns a slot in preallocated NumPy arrays holding an EWMA baseline
+(mean and variance), an optional hour-of-week seasonal profile and a few
+bookkeeping fields, so memory is fixed by ``capacity`` and each sample costs
+O(1) with no history reads. Series are keyed by a 63-bit hash kept in a
+sorted key/slot index: batches are looked up with one ``searchsorted`` and new
+series are merged in with ``np.insert``. When the arrays are full, the least
+recently seen series are evicted in bulk.
+
+Counters are scored on their per-second rate, derived from the previous
+sample kept in the slot. A sample is anomalous when it deviates from the
+(seasonal) baseline by more than ``threshold`` standard deviations after
+``warmup`` samples; anomalous samples move the baseline with reduced weight so
+a single spike does not poison it, while a lasting level shift is absorbed.
+
+State is snapshotted to an ``.npz`` file so restarts resume with warm
+baselines.
+
+The detector is per worker process: each worker holds baselines for the
+series whose samples it happens to ingest, in its own ``capacity`` slots, and
+snapshots them to its own file (see ``worker_snapshot_path``). A series whose
+samples are spread across workers is scored by each of them on its share.
+"""
+
+import fcntl
+import itertools
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import sha1
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import structlog
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.lazy import lazy_import
+from app.models import Alert
+from app.services.catalog import catalog
+from app.services.incidents import correlator
+from app.services.metric_store import canonical_labels, to_millis
+
+np = lazy_import("numpy")
+
+logger = structlog.get_logger()
+
+HOURS_PER_WEEK = 168
+HOUR_MS = 3_600_000
+EPOCH_WEEKDAY_OFFSET = 72  # 1970-01-01 was a Thursday; shift so slot 0 is Monday 00:00
+
+# Share of the usual EWMA weight given to samples flagged as anomalous
+OUTLIER_WEIGHT = 0.25
+# Standard deviation floor, relative to the expected value, so flat series do not flag on noise
+MIN_RELATIVE_STD = 0.01
+# Share of the capacity reclaimed by one eviction pass
+EVICTION_FRACTION = 0.01
+
+SNAPSHOT_FIELDS = ("mean", "var", "count", "last_seen", "last_value", "last_alert")
+
+
+def series_key(name: str, platform_id, service_id, labels: Optional[dict]) -> int:
+    """63-bit identity of a series, stable across processes and restarts."""
+    key = f"{name}|{platform_id or ''}|{service_id or ''}|{canonical_labels(labels)}"
+    return int.from_bytes(sha1(key.encode("utf-8")).digest()[:8], "big") >> 1
+
+
+@dataclass
+class Detections:
+    positions: "np.ndarray"  # indexes into the observed batch
+    observed: "np.ndarray"  # scored value: the sample, or the rate for counters
+    expected: "np.ndarray"
+    scores: "np.ndarray"
+
+
+class AnomalyDetector:
+    """Per-series EWMA baselines in fixed-size arrays."""
+
+    def __init__(
+        self,
+        capacity: int,
+        alpha: float = 0.05,
+        threshold: float = 4.0,
+        warmup: int = 30,
+        seasonality: bool = False,
+        seasonal_alpha: float = 0.1,
+        cooldown_seconds: int = 900,
+    ):
+        self.capacity = capacity
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.seasonal_alpha = seasonal_alpha
+        self.cooldown_ms = cooldown_seconds * 1000
+
+        self.mean = np.zeros(capacity, dtype=np.float64)
+        self.var = np.zeros(capacity, dtype=np.float64)
+        self.count = np.zeros(capacity, dtype=np.uint32)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+        self.last_value = np.full(capacity, np.nan, dtype=np.float64)
+        self.last_alert = np.zeros(capacity, dtype=np.int64)
+        self.seasonal = np.zeros((capacity, HOURS_PER_WEEK), dtype=np.float32) if seasonality else None
+
+        # Sorted key -> slot index and a stack of free slots
+        self._keys = np.empty(0, dtype=np.int64)
+        self._slots = np.empty(0, dtype=np.int64)
+        self._free = np.arange(capacity - 1, -1, -1, dtype=np.int64)
+        self._free_top = capacity
+
+    @classmethod
+    def from_settings(cls) -> "AnomalyDetector":
+        return cls(
+            capacity=settings.ANOMALY_MAX_SERIES,
+            alpha=settings.ANOMALY_ALPHA,
+            threshold=settings.ANOMALY_THRESHOLD,
+            warmup=settings.ANOMALY_WARMUP_SAMPLES,
+            seasonality=settings.ANOMALY_SEASONALITY,
+            cooldown_seconds=settings.ANOMALY_ALERT_COOLDOWN_SECONDS,
+        )
+
+    def __len__(self) -> int:
+        return self._keys.size
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.mean, self.var, self.count, self.last_seen, self.last_value, self.last_alert,
+                  self._keys, self._slots, self._free]
+        if self.seasonal is not None:
+            arrays.append(self.seasonal)
+        return sum(array.nbytes for array in arrays)
+
+    # Slot management
+
+    def _lookup(self, keys: "np.ndarray") -> "np.ndarray":
+        """Slot of each key, -1 when unknown."""
+        if not self._keys.size:
+            return np.full(keys.size, -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._keys, keys), self._keys.size - 1)
+        return np.where(self._keys[positions] == keys, self._slots[positions], -1)
+
+    def _evict(self, needed: int):
+        """Release the least recently seen slots, at least ``needed`` of them."""
+        victims_count = min(self._keys.size, max(needed, int(self.capacity * EVICTION_FRACTION)))
+        seen = self.last_seen[self._slots]
+        order = np.argpartition(seen, victims_count - 1)[:victims_count]
+        keep = np.ones(self._keys.size, dtype=bool)
+        keep[order] = False
+        victims = self._slots[order]
+        self._reset(victims)
+        self._keys, self._slots = self._keys[keep], self._slots[keep]
+        self._free[self._free_top:self._free_top + victims.size] = victims
+        self._free_top += victims.size
+
+    def _reset(self, slots: "np.ndarray"):
+        self.mean[slots] = 0.0
+        self.var[slots] = 0.0
+        self.count[slots] = 0
+        self.last_seen[slots] = 0
+        self.last_value[slots] = np.nan
+        self.last_alert[slots] = 0
+        if self.seasonal is not None:
+            self.seasonal[slots] = 0.0
+
+    def _assign(self, keys: "np.ndarray") -> "np.ndarray":
+        """Slots for a batch of keys, allocating (and evicting) for new ones."""
+        slots = self._lookup(keys)
+        missing = slots < 0
+        if missing.any():
+            new_keys = np.unique(keys[missing])
+            if new_keys.size > self._free_top:
+                self._evict(new_keys.size - self._free_top)
+            new_keys = new_keys[-self.capacity:]  # a batch larger than capacity keeps its last keys
+            new_slots = self._free[self._free_top - new_keys.size:self._free_top][::-1].copy()
+            self._free_top -= new_keys.size
+            positions = np.searchsorted(self._keys, new_keys)
+            self._keys = np.insert(self._keys, positions, new_keys)
+            self._slots = np.insert(self._slots, positions, new_slots)
+            slots = self._lookup(keys)
+        return slots
+
+    # Scoring
+
+    def observe(
+        self,
+        keys: Sequence[int],
+        timestamps_ms: Sequence[int],
+        values: Sequence[float],
+        is_counter: Optional[Sequence[bool]] = None,
+    ) -> Detections:
+        """Score a batch of samples against their baselines, then fold them in."""
+        keys = np.asarray(keys, dtype=np.int64)
+        timestamps = np.asarray(timestamps_ms, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        counters = np.zeros(keys.size, dtype=bool) if is_counter is None else np.asarray(is_counter, dtype=bool)
+        empty = Detections(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0))
+        if not keys.size:
+            return empty
+
+        slots = self._assign(keys)
+        valid = slots >= 0
+
+        # Samples of the same series are applied in time order, one round per repeat
+        order = np.lexsort((timestamps, slots))
+        order = order[valid[order]]
+        sorted_slots = slots[order]
+        group_start = np.r_[True, sorted_slots[1:] != sorted_slots[:-1]]
+        first_index = np.maximum.accumulate(np.where(group_start, np.arange(order.size), 0))
+        rank = np.arange(order.size) - first_index
+
+        found = []
+        for round_index in range(int(rank.max()) + 1 if rank.size else 0):
+            batch = order[rank == round_index]
+            detected = self._update(slots[batch], timestamps[batch], values[batch], counters[batch])
+            if detected is not None:
+                positions, *scored = detected
+                found.append((batch[positions], *scored))
+
+        if not found:
+            return empty
+        return Detections(*(np.concatenate(parts) for parts in zip(*found)))
+
+    def _update(self, slots, timestamps, values, counters):
+        """Apply one sample to each of ``slots`` (all distinct)."""
+        # Counters are scored on their rate since the previous sample
+        if counters.any():
+            previous = self.last_value[slots]
+            elapsed = (timestamps - self.last_seen[slots]) / 1000.0
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rates = (values - previous) / elapsed
+            # The first sample and the one after a reset only prime the slot
+            primed = counters & (values >= previous) & (elapsed > 0)
+            self.last_value[slots] = np.where(counters, values, np.nan)
+            self.last_seen[slots] = np.maximum(self.last_seen[slots], timestamps)
+            index = np.flatnonzero(~counters | primed)
+            slots, timestamps = slots[index], timestamps[index]
+            values = np.where(counters, rates, values)[index]
+        else:
+            self.last_seen[slots] = np.maximum(self.last_seen[slots], timestamps)
+            index = np.arange(slots.size)
+        if not slots.size:
+            return None
+
+        mean, var, count = self.mean[slots], self.var[slots], self.count[slots]
+        if self.seasonal is not None:
+            hour = (timestamps // HOUR_MS + EPOCH_WEEKDAY_OFFSET) % HOURS_PER_WEEK
+            season = self.seasonal[slots, hour].astype(np.float64)
+        else:
+            season = 0.0
+
+        fresh = count == 0
+        expected = np.where(fresh, values, mean + season)
+        deviation = values - expected
+        # The variance starts at zero; undo that bias like Adam's moment estimates
+        with np.errstate(divide="ignore", invalid="ignore"):
+            unbiased = var / (1 - (1 - self.alpha) ** (count.astype(np.float64) - 1))
+        std = np.maximum(np.sqrt(unbiased), np.maximum(np.abs(expected) * MIN_RELATIVE_STD, 1e-9))
+        scores = deviation / std
+        anomalous = (count >= self.warmup) & (np.abs(scores) >= self.threshold)
+
+        alpha = np.where(anomalous, self.alpha * OUTLIER_WEIGHT, self.alpha)
+        level = values - season
+        self.mean[slots] = np.where(fresh, level, mean + alpha * (level - mean))
+        self.var[slots] = np.where(fresh, 0.0, (1 - alpha) * (var + alpha * deviation * deviation))
+        self.count[slots] = np.minimum(count.astype(np.int64) + 1, np.iinfo(np.uint32).max)
+        if self.seasonal is not None:
+            residual = values - self.mean[slots] - season
+            self.seasonal[slots, hour] += (self.seasonal_alpha * residual).astype(np.float32)
+
+        # Only the first anomaly of a series within the cooldown is reported
+        last_alert = self.last_alert[slots]
+        report = anomalous & ((last_alert == 0) | (timestamps - last_alert >= self.cooldown_ms))
+        self.last_alert[slots[report]] = timestamps[report]
+        if not report.any():
+            return None
+        return index[report], values[report], expected[report], scores[report]
+
+    # Persistence
+
+    def snapshot(self) -> Dict[str, "np.ndarray"]:
+        """Copy of the live state, compacted to the active series."""
+        slots = self._slots
+        state = {"keys": self._keys.copy()}
+        for field in SNAPSHOT_FIELDS:
+            state[field] = getattr(self, field)[slots]
+        if self.seasonal is not None:
+            state["seasonal"] = self.seasonal[slots]
+        return state
+
+    def restore(self, state: Dict[str, "np.ndarray"]):
+        keys = state["keys"][-self.capacity:]
+        n = keys.size
+        for field in SNAPSHOT_FIELDS:
+            getattr(self, field)[:n] = state[field][-n:] if n else []
+        if self.seasonal is not None and "seasonal" in state:
+            self.seasonal[:n] = state["seasonal"][-n:] if n else 0.0
+        self._keys = keys.astype(np.int64)
+        self._slots = np.arange(n, dtype=np.int64)
+        self._free = np.arange(self.capacity - 1, -1, -1, dtype=np.int64)
+        self._free_top = self.capacity - n
+
+
+def save_snapshot(path: Path, state: Dict[str, "np.ndarray"]):
+    """Write a snapshot atomically. Blocking; run in a thread."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **state)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+_snapshot_slot: Optional[tuple] = None  # (held lock file, snapshot path)
+
+
+def worker_snapshot_path() -> Path:
+    """This worker's snapshot file, ``<stem>.<n>.npz`` for the lowest ``n`` no live worker holds.
+
+    The slot is held with an exclusive lock for the life of the process, so a
+    restarted worker takes over the snapshot of a slot that was freed.
+    """
+    global _snapshot_slot
+    if _snapshot_slot is None:
+        base = Path(settings.ANOMALY_SNAPSHOT_PATH)
+        base.parent.mkdir(parents=True, exist_ok=True)
+        for n in itertools.count():
+            path = base.with_name(f"{base.stem}.{n}{base.suffix}")
+            lock = open(path.with_suffix(".lock"), "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                continue
+            _snapshot_slot = (lock, path)
+            break
+    return _snapshot_slot[1]
+
+
+def load_snapshot(path: Path) -> Optional[Dict[str, "np.ndarray"]]:
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+_detector: Optional[AnomalyDetector] = None
+
+
+def get_detector() -> AnomalyDetector:
+    """Process-wide detector, allocated on first use."""
+    global _detector
+    if _detector is None:
+        _detector = AnomalyDetector.from_settings()
+    return _detector
+
+
+async def detect_anomalies(db: AsyncSession, samples: List[dict]) -> int:
+    """Feed ingested samples to the detector and raise an alert per anomaly. Returns the alert count."""
+    detector = get_detector()
+    detections = detector.observe(
+        [series_key(s["name"], s.get("platform_id"), s.get("service_id"), s.get("labels")) for s in samples],
+        [to_millis(s["timestamp"]) for s in samples],
+        [s["value"] for s in samples],
+        [s.get("metric_type") == "counter" for s in samples],
+    )
+    if not detections.positions.size:
+        return 0
+
+    alerts = []
+    for position, value, expected, score in zip(
+        detections.positions.tolist(),
+        detections.observed.tolist(),
+        detections.expected.tolist(),
+        detections.scores.tolist(),
+    ):
+        sample = samples[position]
+        observed = "rate" if sample.get("metric_type") == "counter" else "value"
+        severity = "high" if abs(score) >= 2 * detector.threshold else "medium"
+        fired_at = datetime.utcfromtimestamp(to_millis(sample["timestamp"]) / 1000)
+        alerts.append({
+            "platform_id": sample.get("platform_id"),
+            "service_id": sample.get("service_id"),
+            "name": f"Anomalous {sample['name']}",
+            "description": f"{sample['name']} {observed} deviates {score:+.1f} standard deviations from its baseline",
+            "severity": severity,
+            "current_value": value,
+            "threshold": expected,
+            "status": "firing",
+            "fired_at": fired_at,
+            "labels": {"alertname": "MetricAnomaly", "metric": sample["name"], **(sample.get("labels") or {})},
+            "annotations": {"expected": expected, "score": round(score, 2), "observed": observed},
+        })
+    await catalog.ready(db)
+    for alert in alerts:
+        catalog.scope_alert(alert)
+    if settings.INCIDENT_CORRELATION:
+        await correlator.correlate(db, alerts)
+    await db.execute(insert(Alert), alerts)
+    logger.info("Anomalies detected", alerts=len(alerts))
+    return len(alerts)
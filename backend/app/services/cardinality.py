@@ -0,0 +1,370 @@
+"""
+Series cardinality tracking and limits for metric ingest.
+
+Every admitted sample updates HyperLogLog sketches of:
+
+- the series of each metric name, per platform;
+- the series carrying each label key, per platform;
+- the distinct values of each label key of each metric, per platform.
+
+A sketch stays an exact set of hashes until it holds ``SPARSE_LIMIT`` of
+them and only then becomes ``2**PRECISION`` one-byte registers (about 1.6%
+error), so the many low-cardinality labels (methods, status codes) cost
+almost nothing. Sketches cover two windows of ``CARDINALITY_WINDOW_SECONDS``:
+the current one and the one before, so counts are of series active in the
+last one to two windows and an explosion shows up as soon as it happens.
+
+Limits come from ``Platform.settings["cardinality"]``, for example::
+
+    {"max_series": 50000, "max_label_values": 2000, "action": "reject"}
+
+with the ``CARDINALITY_*`` settings as defaults. A label key of a metric
+whose distinct values exceed ``max_label_values`` is offending: with the
+``aggregate`` action it is dropped from the samples, merging their series;
+with ``reject`` those samples are dropped. Aggregated samples of a batch that
+land on the same series, bucket layout and timestamp are combined into one:
+histogram buckets are summed, gauges reduced by ``gauge_aggregation``
+(``mean``, ``sum``, ``max`` or ``min``). Counters are cumulative and series
+report at different instants, so their sum would go backwards between
+scrapes: counters over a limit are always rejected. A platform's new series are
+admitted until it has ``max_series`` active series (an exact bounded set,
+since a sketch cannot tell a new series from a known one); past that,
+``aggregate`` drops the new series' labels, highest cardinality first,
+until it matches a known series, and ``reject`` drops it. Estimates used for
+limits are those from before the current batch.
+
+All of this is per process. Each series reports every scrape interval and
+ingest is spread across workers, so each process sees nearly every active
+series and the estimates match the global ones closely.
+"""
+
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import structlog
+
+from app import telemetry
+from app.config import settings
+from app.lazy import lazy_import
+from app.services.catalog import catalog
+
+np = lazy_import("numpy")
+
+logger = structlog.get_logger()
+
+# log2 of the register count of a dense sketch
+PRECISION = 12
+
+# Hashes kept exactly before a sketch switches to registers
+SPARSE_LIMIT = 64
+
+_M = 1 << PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / _M)
+_MASK = 0xFFFFFFFFFFFFFFFF
+
+limited_samples = telemetry.counter(
+    "observatory_cardinality_limited_samples_total",
+    "Metric samples whose labels were aggregated away or that were rejected by a cardinality limit.",
+    ("action", "reason"),
+)
+
+
+def _mix(hashes: Iterable[int]) -> "np.ndarray":
+    """splitmix64 finalizer over Python hashes, so every bit is usable."""
+    z = np.fromiter((h & _MASK for h in hashes), dtype=np.uint64)
+    z ^= z >> np.uint64(30)
+    z *= np.uint64(0xBF58476D1CE4E5B9)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return z
+
+
+def _set_registers(registers: "np.ndarray", hashes: "np.ndarray"):
+    index = (hashes >> np.uint64(64 - PRECISION)).astype(np.int64)
+    rest = ((hashes >> np.uint64(32 - PRECISION)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    rank = (33 - np.frexp(rest)[1]).astype(np.uint8)  # leading zeros of the next 32 bits, plus one
+    np.maximum.at(registers, index, rank)
+
+
+class HyperLogLog:
+    __slots__ = ("sparse", "registers")
+
+    def __init__(self):
+        self.sparse: Optional[Set[int]] = set()
+        self.registers: Optional["np.ndarray"] = None
+
+    def add(self, hashes: "np.ndarray"):
+        """Add mixed 64-bit hashes."""
+        if self.sparse is not None:
+            self.sparse.update(hashes.tolist())
+            if len(self.sparse) <= SPARSE_LIMIT:
+                return
+            hashes = np.fromiter(self.sparse, dtype=np.uint64, count=len(self.sparse))
+            self.sparse = None
+            self.registers = np.zeros(_M, dtype=np.uint8)
+        _set_registers(self.registers, hashes)
+
+    def merged(self, other: Optional["HyperLogLog"]) -> "HyperLogLog":
+        if other is None:
+            return self
+        result = HyperLogLog()
+        if self.sparse is not None and other.sparse is not None:
+            result.sparse = self.sparse | other.sparse
+            if len(result.sparse) <= SPARSE_LIMIT:
+                return result
+        result.sparse, result.registers = None, np.zeros(_M, dtype=np.uint8)
+        for sketch in (self, other):
+            if sketch.sparse is not None:
+                _set_registers(result.registers, np.fromiter(sketch.sparse, dtype=np.uint64, count=len(sketch.sparse)))
+            else:
+                np.maximum(result.registers, sketch.registers, out=result.registers)
+        return result
+
+    def count(self) -> int:
+        if self.sparse is not None:
+            return len(self.sparse)
+        estimate = _ALPHA * _M * _M / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * _M and zeros:
+            estimate = _M * np.log(_M / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+
+GAUGE_REDUCTIONS = {
+    "mean": lambda values: sum(values) / len(values),
+    "sum": sum,
+    "max": max,
+    "min": min,
+}
+
+
+@dataclass(frozen=True)
+class CardinalityLimits:
+    max_series: int
+    max_label_values: int
+    action: str  # aggregate or reject
+    gauge_aggregation: str  # mean, sum, max or min
+
+    @classmethod
+    def for_platform(cls, platform_settings: Optional[dict]) -> "CardinalityLimits":
+        overrides = (platform_settings or {}).get("cardinality") or {}
+        action = overrides.get("action", settings.CARDINALITY_LIMIT_ACTION)
+        gauge_aggregation = overrides.get("gauge_aggregation", settings.CARDINALITY_GAUGE_AGGREGATION)
+        return cls(
+            max_series=int(overrides.get("max_series", settings.CARDINALITY_MAX_SERIES)),
+            max_label_values=int(overrides.get("max_label_values", settings.CARDINALITY_MAX_LABEL_VALUES)),
+            action=action if action in ("aggregate", "reject") else "aggregate",
+            gauge_aggregation=gauge_aggregation if gauge_aggregation in GAUGE_REDUCTIONS else "mean",
+        )
+
+
+def _aggregatable(row: dict) -> bool:
+    """Histograms (delta bucket counts) and gauges; cumulative counters cannot be merged."""
+    return "counts" in row or row.get("metric_type") != "counter"
+
+
+def _merge(rows: List[dict], limits: CardinalityLimits) -> dict:
+    """Combine samples of one series, bucket layout and timestamp into the first of them."""
+    merged = rows[0]
+    if "counts" in merged:  # histogram: delta bucket counts add up
+        merged["counts"] = [sum(counts) for counts in zip(*(row["counts"] for row in rows))]
+        merged["sum"] = sum(row.get("sum") or 0.0 for row in rows)
+    else:
+        merged["value"] = GAUGE_REDUCTIONS[limits.gauge_aggregation]([row["value"] for row in rows])
+    return merged
+
+
+def limits_for(platform_id) -> CardinalityLimits:
+    platform = catalog.platform(platform_id) if platform_id is not None else None
+    return CardinalityLimits.for_platform(platform.settings if platform else None)
+
+
+class _Window:
+    def __init__(self):
+        self.metrics: Dict[Tuple, HyperLogLog] = {}  # (platform, name) -> series
+        self.label_keys: Dict[Tuple, HyperLogLog] = {}  # (platform, key) -> series
+        self.label_values: Dict[Tuple, HyperLogLog] = {}  # (platform, name, key) -> values
+        self.series: Dict[object, Set[int]] = {}  # platform -> series hashes, for max_series
+
+
+class CardinalityTracker:
+    def __init__(self):
+        self.current = _Window()
+        self.previous = _Window()
+        self._rotated_at = time.monotonic()
+        self.offending: Set[Tuple] = set()  # (platform, name, key) past max_label_values
+
+    def _rotate(self):
+        if time.monotonic() - self._rotated_at < settings.CARDINALITY_WINDOW_SECONDS:
+            return
+        self.previous, self.current = self.current, _Window()
+        self._rotated_at = time.monotonic()
+        self.offending.clear()
+
+    def estimate(self, kind: str, key: Tuple) -> int:
+        """Distinct items of one sketch over the current and previous windows."""
+        current = getattr(self.current, kind).get(key)
+        previous = getattr(self.previous, kind).get(key)
+        if current is None:
+            return previous.count() if previous is not None else 0
+        return current.merged(previous).count()
+
+    def _is_offending(self, key: Tuple, limits: CardinalityLimits, checked: Dict[Tuple, bool]) -> bool:
+        offending = checked.get(key)
+        if offending is None:
+            offending = checked[key] = self.estimate("label_values", key) > limits.max_label_values
+            if offending and key not in self.offending:
+                self.offending.add(key)
+                logger.warning(
+                    "Label cardinality limit exceeded",
+                    platform_id=str(key[0]) if key[0] else None,
+                    metric=key[1],
+                    label=key[2],
+                    limit=limits.max_label_values,
+                )
+        return offending
+
+    def _admit_series(self, platform, series: int, limit: int) -> bool:
+        current = self.current.series.setdefault(platform, set())
+        if series in current:
+            return True
+        if series in self.previous.series.get(platform, ()) or len(current) < limit:
+            current.add(series)
+            return True
+        return False
+
+    def admit(self, rows: List[dict]) -> Tuple[List[int], int]:
+        """Apply limits to ingest rows and track them. Returns the kept indices and how many rows were merged.
+
+        Aggregated rows have their labels rewritten, and those sharing a series
+        and timestamp are merged into the first of them, so only its index is kept.
+        """
+        self._rotate()
+        limits: Dict[object, CardinalityLimits] = {}
+        checked: Dict[Tuple, bool] = {}
+        estimates: Dict[Tuple, int] = {}
+        values: Dict[Tuple, list] = defaultdict(list)
+        series_by_metric: Dict[Tuple, list] = defaultdict(list)
+        series_by_key: Dict[Tuple, list] = defaultdict(list)
+        kept = []
+        aggregated: Set[int] = set()
+
+        for i, row in enumerate(rows):
+            platform, name = row.get("platform_id"), row["name"]
+            limit = limits.get(platform)
+            if limit is None:
+                limit = limits[platform] = limits_for(platform)
+            labels = row.get("labels") or {}
+            for key, value in labels.items():
+                values[(platform, name, key)].append(hash(value))
+
+            offending = [key for key in labels if self._is_offending((platform, name, key), limit, checked)]
+            if offending:
+                action = limit.action if _aggregatable(row) else "reject"
+                limited_samples.inc(action=action, reason="label_values")
+                if action == "reject":
+                    continue
+                labels = {k: v for k, v in labels.items() if k not in offending}
+                aggregated.add(i)
+
+            series = hash((name, platform, row.get("service_id"), tuple(sorted(labels.items()))))
+            if limit.max_series and not self._admit_series(platform, series, limit.max_series):
+                action = limit.action if _aggregatable(row) else "reject"
+                limited_samples.inc(action=action, reason="series_limit")
+                if action == "reject":
+                    continue
+                aggregated.add(i)
+                # Drop labels, highest cardinality first, until the series is a known one
+                for key in labels:
+                    if (platform, name, key) not in estimates:
+                        estimates[(platform, name, key)] = self.estimate("label_values", (platform, name, key))
+                ranked = sorted(labels, key=lambda k: estimates[(platform, name, k)])
+                while ranked:
+                    labels = {k: v for k, v in labels.items() if k != ranked[-1]}
+                    ranked.pop()
+                    series = hash((name, platform, row.get("service_id"), tuple(sorted(labels.items()))))
+                    if self._admit_series(platform, series, limit.max_series):
+                        break
+                else:
+                    self.current.series[platform].add(series)  # one series per metric is always allowed
+
+            row["labels"] = labels
+            series_by_metric[(platform, name)].append(series)
+            for key in labels:
+                series_by_key[(platform, key)].append(series)
+            kept.append(i)
+
+        for kind, hashes in (
+            ("label_values", values), ("metrics", series_by_metric), ("label_keys", series_by_key)
+        ):
+            sketches = getattr(self.current, kind)
+            for key, items in hashes.items():
+                sketch = sketches.get(key)
+                if sketch is None:
+                    sketch = sketches[key] = HyperLogLog()
+                sketch.add(_mix(items))
+        if not aggregated:
+            return kept, 0
+        merged = self._merge_aggregated(rows, kept, aggregated, limits)
+        return merged, len(kept) - len(merged)
+
+    @staticmethod
+    def _merge_aggregated(
+        rows: List[dict], kept: List[int], aggregated: Set[int], limits: Dict[object, CardinalityLimits]
+    ) -> List[int]:
+        """Fold kept rows sharing a series, bucket layout and timestamp, where one was aggregated, into the first."""
+        groups: Dict[Tuple, List[int]] = defaultdict(list)
+        for i in kept:
+            row = rows[i]
+            bounds = row.get("bounds")  # histograms of different layouts are different series
+            key = (
+                row["name"], row.get("platform_id"), row.get("service_id"),
+                tuple(sorted(row["labels"].items())), row["timestamp"],
+                tuple(bounds) if bounds is not None else None,
+            )
+            groups[key].append(i)
+        merged_away: Set[int] = set()
+        for members in groups.values():
+            if len(members) > 1 and not aggregated.isdisjoint(members):
+                _merge([rows[i] for i in members], limits[rows[members[0]].get("platform_id")])
+                merged_away.update(members[1:])
+        return [i for i in kept if i not in merged_away]
+
+    def _top(self, kind: str, platform_id, group) -> Dict[Tuple, HyperLogLog]:
+        """Sketches of one kind merged over both windows and grouped by ``group(key)``."""
+        merged: Dict[Tuple, HyperLogLog] = {}
+        for window in (self.current, self.previous):
+            for key, sketch in getattr(window, kind).items():
+                if platform_id is not None and key[0] != platform_id:
+                    continue
+                group_key = group(key)
+                merged[group_key] = sketch.merged(merged.get(group_key))
+        return merged
+
+    def explore(self, platform_id=None, limit: int = 20) -> dict:
+        """Top metrics and label keys by active series, and the labels with the most values."""
+        def top(kind, group):
+            counts = [(key, sketch.count()) for key, sketch in self._top(kind, platform_id, group).items()]
+            counts.sort(key=lambda item: item[1], reverse=True)
+            return counts[:limit]
+
+        return {
+            "window_seconds": settings.CARDINALITY_WINDOW_SECONDS,
+            "metrics": [{"name": name, "series": count} for (name,), count in top("metrics", lambda k: (k[1],))],
+            "label_keys": [{"key": key, "series": count} for (key,), count in top("label_keys", lambda k: (k[1],))],
+            "label_values": [
+                {"name": name, "key": key, "values": count}
+                for (name, key), count in top("label_values", lambda k: (k[1], k[2]))
+            ],
+            "offending": [
+                {"platform_id": platform, "name": name, "key": key}
+                for platform, name, key in sorted(self.offending, key=str)
+                if platform_id is None or platform == platform_id
+            ],
+        }
+
+
+tracker = CardinalityTracker()
@@ -0,0 +1,420 @@
+"""
+Process-local catalog of services and platforms.
+
+Services are indexed in memory by id, by (platform, slug), by platform and by
+team. An inverted index maps each label key and value to service ids and
+answers Prometheus-style selectors such as
+``team=payments,tier=~"api|web",env!=staging``. Platforms are indexed by id
+and code. Selector regexes are user input, so they run in the
+``regex_matcher`` process with a ``CATALOG_REGEX_TIMEOUT_SECONDS`` limit.
+
+The catalog is loaded once and then kept fresh through Postgres
+``LISTEN/NOTIFY``. Triggers on ``services`` and ``platforms`` (schema
+version 9) notify ``CATALOG_CHANNEL`` with the table and row id whenever a
+catalog column changes, and the listener reloads only those rows in one
+query. Notifications sent while the listening connection is down are lost, so
+the catalog reloads in full every time it reconnects.
+
+Ingest rows naming an id the catalog does not know trigger one lookup; ids
+still not found are remembered for ``CATALOG_MISSING_TTL_SECONDS`` (or until a
+notification names them), so a client sending a stale id does not cost a
+query per batch.
+"""
+
+import asyncio
+import math
+import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+import structlog
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import background_session
+from app.models import Platform, Service
+from app.services.regex_matcher import regex_matcher
+
+logger = structlog.get_logger()
+
+CATALOG_CHANNEL = "observatory_catalog"
+
+# Notifications arriving within this window are reloaded together
+DEBOUNCE_SECONDS = 0.05
+
+# Wait before reconnecting a lost listener
+RETRY_SECONDS = 5.0
+
+# Missing ids remembered per table; the oldest are forgotten beyond this
+MISSING_CACHE_SIZE = 10_000
+
+
+@dataclass(frozen=True, eq=False)
+class ServiceEntry:
+    id: UUID
+    platform_id: UUID
+    slug: str
+    name: str
+    team: Optional[str]
+    service_type: Optional[str]
+    is_active: bool
+    labels: Dict[str, str]
+
+
+@dataclass(frozen=True, eq=False)
+class PlatformEntry:
+    id: UUID
+    code: str
+    name: str
+    criticality: Optional[str]
+    is_active: bool
+    settings: dict
+
+
+SERVICE_COLUMNS = ["id", "platform_id", "slug", "name", "team", "service_type", "is_active", "labels"]
+PLATFORM_COLUMNS = ["id", "code", "name", "criticality", "is_active", "settings"]
+
+
+# Selectors
+
+Selector = Tuple[str, str, str]  # label, operator, value
+
+# Bare values stop at operator characters and quotes, so ``a==b`` and an unclosed ``a="b`` do not parse
+_SELECTOR = re.compile(
+    r'\s*([A-Za-z_][\w.\-/]*)\s*(=~|!~|!=|=)\s*(?:"((?:[^"\\]|\\.)*)"|([^,"=!~]*?))\s*(?:,|$)'
+)
+
+
+def parse_selector(text: str) -> List[Selector]:
+    """Parse ``name<op>value`` terms separated by commas; values with ``= ! ~ , "`` must be double-quoted."""
+    selectors = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _SELECTOR.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Invalid label selector at position {position}")
+        name, operator, quoted, bare = match.groups()
+        value = re.sub(r"\\(.)", r"\1", quoted) if quoted is not None else bare
+        if operator in ("=~", "!~"):
+            _pattern(value)
+        selectors.append((name, operator, value))
+        position = match.end()
+    return selectors
+
+
+@lru_cache(maxsize=256)
+def _pattern(value: str):
+    try:
+        return re.compile(value)
+    except re.error as e:
+        raise ValueError(f"Invalid regex {value!r}: {e}")
+
+
+class Catalog:
+    def __init__(self):
+        self.loaded = False
+        self.services: Dict[UUID, ServiceEntry] = {}
+        self.by_slug: Dict[Tuple[UUID, str], UUID] = {}
+        self.by_platform: Dict[UUID, Set[UUID]] = {}
+        self.by_team: Dict[str, Set[UUID]] = {}
+        self.by_label: Dict[str, Dict[str, Set[UUID]]] = {}
+        self.platforms: Dict[UUID, PlatformEntry] = {}
+        self.by_code: Dict[str, UUID] = {}
+        self._pending: Dict[str, Set[UUID]] = {"services": set(), "platforms": set()}
+        self._changed: Optional[asyncio.Event] = None
+        self._lost = False
+        # Ids looked up and not found: table -> id -> monotonic time of the lookup
+        self._missing: Dict[str, Dict[UUID, float]] = {"services": {}, "platforms": {}}
+
+    # Index maintenance
+
+    def _add_service(self, entry: ServiceEntry):
+        self._remove_service(entry.id)
+        self.services[entry.id] = entry
+        self.by_slug[(entry.platform_id, entry.slug)] = entry.id
+        self.by_platform.setdefault(entry.platform_id, set()).add(entry.id)
+        if entry.team:
+            self.by_team.setdefault(entry.team, set()).add(entry.id)
+        for name, value in entry.labels.items():
+            self.by_label.setdefault(name, {}).setdefault(value, set()).add(entry.id)
+
+    def _remove_service(self, service_id: UUID):
+        entry = self.services.pop(service_id, None)
+        if entry is None:
+            return
+        self.by_slug.pop((entry.platform_id, entry.slug), None)
+        _discard(self.by_platform, entry.platform_id, entry.id)
+        if entry.team:
+            _discard(self.by_team, entry.team, entry.id)
+        for name, value in entry.labels.items():
+            values = self.by_label.get(name)
+            if values is not None:
+                _discard(values, value, entry.id)
+                if not values:
+                    del self.by_label[name]
+
+    def _add_platform(self, entry: PlatformEntry):
+        self._remove_platform(entry.id)
+        self.platforms[entry.id] = entry
+        self.by_code[entry.code] = entry.id
+
+    def _remove_platform(self, platform_id: UUID):
+        entry = self.platforms.pop(platform_id, None)
+        if entry is not None:
+            self.by_code.pop(entry.code, None)
+
+    @staticmethod
+    def _service_entry(row) -> ServiceEntry:
+        values = dict(zip(SERVICE_COLUMNS, row))
+        values["is_active"] = values["is_active"] is not False
+        values["labels"] = {str(k): str(v) for k, v in (values["labels"] or {}).items()}
+        return ServiceEntry(**values)
+
+    @staticmethod
+    def _platform_entry(row) -> PlatformEntry:
+        values = dict(zip(PLATFORM_COLUMNS, row))
+        values["is_active"] = values["is_active"] is not False
+        values["settings"] = values["settings"] or {}
+        return PlatformEntry(**values)
+
+    async def load(self, db: AsyncSession):
+        """Replace the whole catalog with the current tables."""
+        services = (await db.execute(select(*(Service.__table__.c[n] for n in SERVICE_COLUMNS)))).all()
+        platforms = (await db.execute(select(*(Platform.__table__.c[n] for n in PLATFORM_COLUMNS)))).all()
+        fresh = Catalog()
+        for row in services:
+            fresh._add_service(self._service_entry(row))
+        for row in platforms:
+            fresh._add_platform(self._platform_entry(row))
+        for name in ("services", "by_slug", "by_platform", "by_team", "by_label", "platforms", "by_code"):
+            setattr(self, name, getattr(fresh, name))
+        self._missing = {"services": {}, "platforms": {}}
+        self.loaded = True
+        logger.info("Service catalog loaded", services=len(self.services), platforms=len(self.platforms))
+
+    async def apply(self, db: AsyncSession, changed: Dict[str, Set[UUID]]):
+        """Reload the given service and platform ids; ids no longer found are dropped."""
+        if changed["services"]:
+            ids = set(changed["services"])
+            rows = (await db.execute(
+                select(*(Service.__table__.c[n] for n in SERVICE_COLUMNS)).where(Service.id.in_(ids))
+            )).all()
+            for row in rows:
+                ids.discard(row[0])
+                self._add_service(self._service_entry(row))
+            for service_id in ids:
+                self._remove_service(service_id)
+        if changed["platforms"]:
+            ids = set(changed["platforms"])
+            rows = (await db.execute(
+                select(*(Platform.__table__.c[n] for n in PLATFORM_COLUMNS)).where(Platform.id.in_(ids))
+            )).all()
+            for row in rows:
+                ids.discard(row[0])
+                self._add_platform(self._platform_entry(row))
+            for platform_id in ids:
+                self._remove_platform(platform_id)
+
+    async def ready(self, db: AsyncSession):
+        """Load on first use when the listener has not done it yet."""
+        if not self.loaded:
+            await self.load(db)
+
+    # Lookups
+
+    def service(self, service_id) -> Optional[ServiceEntry]:
+        return self.services.get(service_id)
+
+    def service_by_slug(self, platform_id: UUID, slug: str) -> Optional[ServiceEntry]:
+        service_id = self.by_slug.get((platform_id, slug))
+        return self.services.get(service_id) if service_id else None
+
+    def platform(self, platform_id) -> Optional[PlatformEntry]:
+        return self.platforms.get(platform_id)
+
+    def platform_by_code(self, code: str) -> Optional[PlatformEntry]:
+        platform_id = self.by_code.get(code)
+        return self.platforms.get(platform_id) if platform_id else None
+
+    def services_of_platform(self, platform_id: UUID) -> Set[UUID]:
+        return self.by_platform.get(platform_id, set())
+
+    def services_of_team(self, team: str) -> Set[UUID]:
+        return self.by_team.get(team, set())
+
+    def _matching(self, name: str, value: str, matched: Optional[Set[str]] = None) -> Set[UUID]:
+        """Services whose label equals ``value``, or, for a regex, takes one of the ``matched`` values."""
+        values = self.by_label.get(name, {})
+        if matched is None:
+            if value == "":  # an empty value selects services without the label
+                return set(self.services).difference(*values.values())
+            return set(values.get(value, ()))
+        result = set().union(*(ids for v, ids in values.items() if v in matched))
+        if "" in matched:
+            result |= set(self.services).difference(*values.values())
+        return result
+
+    async def _regex_matches(self, selectors: List[Selector]) -> Dict[int, Set[str]]:
+        """Label values, and "" for an absent label, each regex selector fully matches, by selector index."""
+        strings: List[str] = [""]
+        jobs: List[Tuple[str, List[int]]] = []
+        positions = []
+        for position, (name, operator, value) in enumerate(selectors):
+            if operator not in ("=~", "!~"):
+                continue
+            start = len(strings)
+            strings.extend(self.by_label.get(name, {}))
+            jobs.append((rf"\A(?:{value})\Z", [0, *range(start, len(strings))]))
+            positions.append(position)
+        if not jobs:
+            return {}
+        results = await asyncio.to_thread(regex_matcher.match, strings, jobs, settings.CATALOG_REGEX_TIMEOUT_SECONDS)
+        matches = {}
+        for position, indexes in zip(positions, results):
+            if indexes is None:
+                raise ValueError(f"Regex {selectors[position][2]!r} took too long to match")
+            matches[position] = {strings[i] for i in indexes}
+        return matches
+
+    async def select(self, selectors: Iterable[Selector]) -> Set[UUID]:
+        """Ids of the services matching every selector. Raises ValueError on a regex that times out."""
+        selectors = list(selectors)
+        regex_matches = await self._regex_matches(selectors)
+        positive, negative = [], []
+        for position, (name, operator, value) in enumerate(selectors):
+            matched = self._matching(name, value, regex_matches.get(position))
+            (positive if operator in ("=", "=~") else negative).append(matched)
+        if positive:
+            positive.sort(key=len)
+            result = positive[0].intersection(*positive[1:])
+        else:
+            result = set(self.services)
+        return result.difference(*negative)
+
+    async def resolve_rows(self, db: AsyncSession, rows: List[dict], service_key: str = "service_id"):
+        """
+        Check the platform and service ids of ingest rows against the catalog.
+
+        Ids the catalog does not know are looked up once more, in case their
+        notification has not arrived yet, and then cleared so the batch does
+        not fail on a foreign key. Ids the lookup does not find are not looked
+        up again for ``CATALOG_MISSING_TTL_SECONDS``. A row with a service but
+        no platform gets the service's platform.
+        """
+        await self.ready(db)
+        services, platforms = self.services, self.platforms
+        unknown = {"services": set(), "platforms": set()}
+        for row in rows:
+            if row.get(service_key) is not None and row[service_key] not in services:
+                unknown["services"].add(row[service_key])
+            if row.get("platform_id") is not None and row["platform_id"] not in platforms:
+                unknown["platforms"].add(row["platform_id"])
+        now = time.monotonic()
+        ttl = settings.CATALOG_MISSING_TTL_SECONDS
+        for table, ids in unknown.items():
+            missing = self._missing[table]
+            ids.difference_update([i for i in ids if now - missing.get(i, -math.inf) < ttl])
+        if unknown["services"] or unknown["platforms"]:
+            await self.apply(db, unknown)
+            services, platforms = self.services, self.platforms
+            self._remember_missing("services", unknown["services"] - services.keys(), now)
+            self._remember_missing("platforms", unknown["platforms"] - platforms.keys(), now)
+
+        for row in rows:
+            service_id = row.get(service_key)
+            if service_id is not None:
+                service = services.get(service_id)
+                if service is None:
+                    row[service_key] = None
+                elif row.get("platform_id") is None:
+                    row["platform_id"] = service.platform_id
+            if row.get("platform_id") is not None and row["platform_id"] not in platforms:
+                row["platform_id"] = None
+
+    def _remember_missing(self, table: str, ids: Set[UUID], now: float):
+        missing = self._missing[table]
+        for missing_id in ids:
+            missing.pop(missing_id, None)
+            missing[missing_id] = now  # dicts keep insertion order: oldest lookups first
+        while len(missing) > MISSING_CACHE_SIZE:
+            del missing[next(iter(missing))]
+
+    def scope_alert(self, alert: dict):
+        """Fill an alert's platform and labels from its service's catalog entry."""
+        service = self.services.get(alert.get("service_id")) if self.loaded else None
+        if service is None:
+            return
+        if alert.get("platform_id") is None:
+            alert["platform_id"] = service.platform_id
+        labels = alert.setdefault("labels", {})
+        labels.setdefault("service", service.slug)
+        if service.team:
+            labels.setdefault("team", service.team)
+        for name, value in service.labels.items():
+            labels.setdefault(name, value)
+
+    # LISTEN/NOTIFY
+
+    def _notified(self, connection, pid, channel, payload: str):
+        table, _, row_id = payload.partition(":")
+        try:
+            row_id = UUID(row_id)
+            self._pending[table].add(row_id)
+        except (KeyError, ValueError):
+            return
+        self._missing[table].pop(row_id, None)
+        self._changed.set()
+
+    def _terminated(self, connection):
+        self._lost = True
+        self._changed.set()
+
+    async def listen(self):
+        """Hold a LISTEN connection and apply changes until cancelled, reconnecting on failure."""
+        import asyncpg
+
+        dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        self._changed = asyncio.Event()
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                self._lost = False
+                connection.add_termination_listener(self._terminated)
+                await connection.add_listener(CATALOG_CHANNEL, self._notified)
+                async with background_session() as db:
+                    await self.load(db)
+                while True:
+                    await self._changed.wait()
+                    if self._lost:
+                        raise ConnectionError("Catalog listener connection lost")
+                    await asyncio.sleep(DEBOUNCE_SECONDS)
+                    self._changed.clear()
+                    changed, self._pending = self._pending, {"services": set(), "platforms": set()}
+                    async with background_session() as db:
+                        await self.apply(db, changed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Service catalog listener failed, reconnecting", error=str(e))
+                await asyncio.sleep(RETRY_SECONDS)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+
+def _discard(index: dict, key, member):
+    members = index.get(key)
+    if members is not None:
+        members.discard(member)
+        if not members:
+            del index[key]
+
+
+catalog = Catalog()
@@ -0,0 +1,155 @@
+"""
+Exemplars: trace ids attached to metric and histogram samples.
+
+Ingest offers every exemplar to a per-process reservoir that keeps the
+``EXEMPLARS_PER_MINUTE`` largest values per series and minute as a min-heap;
+only exemplars entering the reservoir are stored, so a busy series writes a
+few rows per minute rather than one per sample. Exemplars that a later, larger
+one pushes out of the reservoir are not deleted, so the query side picks the
+top values per series and minute again.
+
+Each row carries its ``trace_id``, so going from a point on a chart to the
+trace is a lookup on ``traces.trace_id``. Tail sampling drops most traces, so
+``load`` only returns exemplars whose trace was stored. Rows older than
+``EXEMPLARS_RETENTION_DAYS`` are deleted by ``prune``, which metric compaction
+runs.
+"""
+
+import heapq
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import any_, bindparam, delete, exists, select, insert
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import MetricExemplar, Trace
+from app.services.metric_store import to_millis
+
+MINUTE_MS = 60_000
+
+# Minutes behind the newest one still tracked by the reservoir
+RESERVOIR_MINUTES = 5
+
+# Rows deleted per statement by prune
+PRUNE_BATCH = 10_000
+
+
+class Reservoir:
+    """Top-k values per (series, minute), for the last few minutes."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.minutes: Dict[int, Dict[str, List[float]]] = {}
+        self.newest = 0
+
+    def offer(self, series_hash: str, timestamp_ms: int, value: float) -> bool:
+        minute = timestamp_ms // MINUTE_MS
+        if minute > self.newest:
+            self.newest = minute
+            for stale in [m for m in self.minutes if m < minute - RESERVOIR_MINUTES]:
+                del self.minutes[stale]
+        heap = self.minutes.setdefault(minute, {}).setdefault(series_hash, [])
+        if len(heap) < self.size:
+            heapq.heappush(heap, value)
+            return True
+        if value > heap[0]:
+            heapq.heapreplace(heap, value)
+            return True
+        return False
+
+
+reservoir = Reservoir(settings.EXEMPLARS_PER_MINUTE)
+
+
+async def store(db: AsyncSession, exemplars: Iterable[dict]) -> int:
+    """Store the exemplars (series_hash, timestamp, value, trace_id, span_id) that enter the reservoir."""
+    # Largest first, so a batch fills the reservoir with its own top values
+    kept = [
+        exemplar
+        for exemplar in sorted(exemplars, key=lambda e: e["value"], reverse=True)
+        if reservoir.offer(exemplar["series_hash"], to_millis(exemplar["timestamp"]), exemplar["value"])
+    ]
+    if kept:
+        await db.execute(insert(MetricExemplar), kept)
+    return len(kept)
+
+
+def from_sample(series_hash: str, timestamp: datetime, exemplar: dict) -> dict:
+    timestamp = exemplar.get("timestamp") or timestamp
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return {
+        "series_hash": series_hash,
+        "timestamp": timestamp,
+        "value": exemplar["value"],
+        "trace_id": exemplar["trace_id"],
+        "span_id": exemplar.get("span_id"),
+    }
+
+
+async def load(
+    db: AsyncSession,
+    series: Sequence[Tuple[str, Dict[str, str]]],
+    start: datetime,
+    end: datetime,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    """Top exemplars per series and minute in [start, end), largest values first.
+
+    ``series`` pairs each series hash with the labels reported for it.
+    """
+    labels_by_hash = dict(series)
+    if not labels_by_hash:
+        return []
+    rows = (await db.execute(
+        select(
+            MetricExemplar.series_hash,
+            MetricExemplar.timestamp,
+            MetricExemplar.value,
+            MetricExemplar.trace_id,
+            MetricExemplar.span_id,
+        ).where(
+            # One array parameter: a query can match more series than a statement takes parameters
+            MetricExemplar.series_hash == any_(
+                bindparam("series_hashes", list(labels_by_hash), type_=ARRAY(MetricExemplar.series_hash.type))
+            ),
+            MetricExemplar.timestamp >= start,
+            MetricExemplar.timestamp < end,
+            # The sampler may have dropped the trace, or retention removed it
+            exists().where(Trace.trace_id == MetricExemplar.trace_id),
+        )
+    )).all()
+
+    per_minute: Dict[Tuple[str, int], List[tuple]] = {}
+    for row in rows:
+        timestamp = to_millis(row.timestamp)
+        per_minute.setdefault((row.series_hash, timestamp // MINUTE_MS), []).append((row.value, timestamp, row))
+    top = []
+    for candidates in per_minute.values():
+        top.extend(heapq.nlargest(reservoir.size, candidates, key=lambda c: c[0]))
+    top.sort(key=lambda c: c[0], reverse=True)
+
+    return [
+        {
+            "labels": labels_by_hash[row.series_hash],
+            "timestamp": timestamp,
+            "value": value,
+            "trace_id": row.trace_id,
+            "span_id": row.span_id,
+        }
+        for value, timestamp, row in top[:limit or settings.EXEMPLARS_QUERY_LIMIT]
+    ]
+
+
+async def prune(db: AsyncSession, before: datetime) -> int:
+    """Delete exemplars older than ``before``, in batches of PRUNE_BATCH. Returns the number deleted."""
+    deleted = 0
+    while True:
+        batch = select(MetricExemplar.id).where(MetricExemplar.timestamp < before).limit(PRUNE_BATCH)
+        result = await db.execute(delete(MetricExemplar).where(MetricExemplar.id.in_(batch.scalar_subquery())))
+        await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < PRUNE_BATCH:
+            return deleted
@@ -0,0 +1,152 @@
+"""
+Gorilla time series compression (Pelkonen et al., VLDB 2015).
+
+Timestamps (int64 milliseconds) are stored as delta-of-deltas in variable
+width buckets and values (float64) as the XOR with the previous value, storing
+only the meaningful bits. Regularly scraped series compress to 1-2 bytes per
+sample.
+"""
+
+import struct
+from typing import Sequence, Tuple
+
+from app.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# (prefix, prefix bits, value bits) for delta-of-delta buckets
+_DOD_BUCKETS = [
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12),
+]
+
+
+def _float_bits(value: float) -> int:
+    return struct.unpack(">Q", struct.pack(">d", value))[0]
+
+
+class BitWriter:
+    def __init__(self):
+        self.buffer = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value: int, bits: int):
+        self._acc = (self._acc << bits) | (value & ((1 << bits) - 1))
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self.buffer.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self._bits:
+            return bytes(self.buffer) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+        return bytes(self.buffer)
+
+
+class BitReader:
+    def __init__(self, data: bytes):
+        self._value = int.from_bytes(data, "big")
+        self._total = len(data) * 8
+        self._pos = 0
+
+    def read(self, bits: int) -> int:
+        self._pos += bits
+        return (self._value >> (self._total - self._pos)) & ((1 << bits) - 1)
+
+    def read_bit(self) -> int:
+        return self.read(1)
+
+
+def encode(timestamps: Sequence[int], values: Sequence[float]) -> bytes:
+    """Encode a series of (ms timestamp, value) samples sorted by time."""
+    writer = BitWriter()
+    if not len(timestamps):
+        return b""
+
+    writer.write(int(timestamps[0]), 64)
+    writer.write(_float_bits(float(values[0])), 64)
+
+    prev_ts, prev_delta = int(timestamps[0]), 0
+    prev_bits, prev_leading, prev_trailing = _float_bits(float(values[0])), -1, -1
+
+    for ts, value in zip(timestamps[1:], values[1:]):
+        ts = int(ts)
+        delta = ts - prev_ts
+        dod = delta - prev_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                if -(1 << (value_bits - 1)) <= dod < (1 << (value_bits - 1)):
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod, value_bits)
+                    break
+            else:
+                writer.write(0b1111, 4)
+                writer.write(dod, 64)
+        prev_ts, prev_delta = ts, delta
+
+        bits = _float_bits(float(value))
+        xor = bits ^ prev_bits
+        if xor == 0:
+            writer.write(0, 1)
+        else:
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if prev_leading >= 0 and leading >= prev_leading and trailing >= prev_trailing:
+                writer.write(0b10, 2)
+                writer.write(xor >> prev_trailing, 64 - prev_leading - prev_trailing)
+            else:
+                meaningful = 64 - leading - trailing
+                writer.write(0b11, 2)
+                writer.write(leading, 5)
+                writer.write(meaningful & 0x3F, 6)  # 64 is stored as 0
+                writer.write(xor >> trailing, meaningful)
+                prev_leading, prev_trailing = leading, trailing
+        prev_bits = bits
+
+    return writer.getvalue()
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >= (1 << (bits - 1)) else value
+
+
+def decode(data: bytes, count: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Decode ``count`` samples into (int64 ms timestamps, float64 values) arrays."""
+    timestamps = np.empty(count, dtype=np.int64)
+    raw_values = np.empty(count, dtype=np.uint64)
+    if count == 0:
+        return timestamps, raw_values.view(np.float64)
+
+    reader = BitReader(data)
+    ts = reader.read(64)
+    bits = reader.read(64)
+    timestamps[0], raw_values[0] = _signed(ts, 64), bits
+    ts = int(timestamps[0])
+
+    delta = 0
+    leading = trailing = 0
+    for i in range(1, count):
+        if reader.read_bit():
+            for _, _, value_bits in _DOD_BUCKETS:
+                if not reader.read_bit():
+                    delta += _signed(reader.read(value_bits), value_bits)
+                    break
+            else:
+                delta += _signed(reader.read(64), 64)
+        ts += delta
+        timestamps[i] = ts
+
+        if reader.read_bit():
+            if reader.read_bit():
+                leading = reader.read(5)
+                meaningful = reader.read(6) or 64
+                trailing = 64 - leading - meaningful
+            bits ^= reader.read(64 - leading - trailing) << trailing
+        raw_values[i] = bits
+
+    return timestamps, raw_values.view(np.float64)
@@ -0,0 +1,377 @@
+"""
+Native histogram storage and querying.
+
+Each series has fixed bucket upper bounds (``histogram_series.bounds``) and
+every sample carries the per-bucket counts observed since the previous one
+(delta temporality), so combining histograms over time or across series is a
+vector addition. Ingest keeps hourly and daily rollups in step with the raw
+samples, which lets a query cover long windows by reading one row per series
+per day: ``plan_segments`` splits [start, end) into the coarsest aligned
+pieces and only the sub-hour edges touch raw samples.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from hashlib import sha1
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, or_, and_, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import after_commit
+from app.lazy import lazy_import
+from app.models import HistogramSeries, HistogramSample, HistogramRollup
+from app.services import metric_engine
+from app.services.metric_store import EPOCH, apply_filters, canonical_labels, to_millis
+
+np = lazy_import("numpy")
+
+# Rollup window lengths in seconds, coarsest first
+ROLLUP_RESOLUTIONS = (86400, 3600)
+
+# Element-wise addition of the stored and incoming bucket counts
+_ADD_COUNTS = literal_column(
+    "(SELECT array_agg(a + b ORDER BY i) "
+    "FROM unnest(histogram_rollups.counts, excluded.counts) WITH ORDINALITY AS t(a, b, i))"
+)
+
+
+def series_hash(name: str, platform_id, service_id, labels: Optional[dict], bounds: Sequence[float]) -> str:
+    key = f"{name}|{platform_id or ''}|{service_id or ''}|{canonical_labels(labels)}|{list(map(float, bounds))}"
+    return sha1(key.encode("utf-8")).hexdigest()
+
+
+def _align(value: datetime, seconds: int, up: bool = False) -> datetime:
+    """Round down (or up) to a multiple of ``seconds`` since the epoch."""
+    micros = (value - EPOCH) // timedelta(microseconds=1)
+    unit = seconds * 1_000_000
+    aligned = micros - micros % unit
+    if up and aligned < micros:
+        aligned += unit
+    return EPOCH + timedelta(microseconds=aligned)
+
+
+def plan_segments(start: datetime, end: datetime, resolutions: Sequence[int] = ROLLUP_RESOLUTIONS):
+    """Split [start, end) into (resolution, start, end) pieces, resolution None meaning raw samples."""
+    if start >= end:
+        return []
+    if not resolutions:
+        return [(None, start, end)]
+    resolution, finer = resolutions[0], resolutions[1:]
+    inner_start, inner_end = _align(start, resolution, up=True), _align(end, resolution)
+    if inner_start >= inner_end:
+        return plan_segments(start, end, finer)
+    return (
+        plan_segments(start, inner_start, finer)
+        + [(resolution, inner_start, inner_end)]
+        + plan_segments(inner_end, end, finer)
+    )
+
+
+class SeriesRegistry:
+    """Process-local cache of ``histogram_series`` ids by series hash.
+
+    Newly registered ids are cached once the registering transaction commits.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    async def resolve(self, db: AsyncSession, entries: Iterable[dict]) -> List[int]:
+        """Series id for each entry, registering unknown series in one round trip."""
+        entries = list(entries)
+        hashes = [
+            series_hash(e["name"], e.get("platform_id"), e.get("service_id"), e.get("labels"), e["bounds"])
+            for e in entries
+        ]
+        missing = {}
+        for key, entry in zip(hashes, entries):
+            if key not in self.ids and key not in missing:
+                missing[key] = {
+                    "series_hash": key,
+                    "name": entry["name"],
+                    "platform_id": entry.get("platform_id"),
+                    "service_id": entry.get("service_id"),
+                    "labels": entry.get("labels") or {},
+                    "unit": entry.get("unit"),
+                    "bounds": [float(b) for b in entry["bounds"]],
+                }
+        if missing:
+            statement = insert(HistogramSeries).values(list(missing.values()))
+            statement = statement.on_conflict_do_update(
+                index_elements=[HistogramSeries.series_hash],
+                set_={"series_hash": statement.excluded.series_hash},
+            ).returning(HistogramSeries.series_hash, HistogramSeries.id)
+            registered = dict((await db.execute(statement)).all())
+            after_commit(db, lambda: self.ids.update(registered))
+            return [registered.get(key) or self.ids[key] for key in hashes]
+        return [self.ids[key] for key in hashes]
+
+
+series_registry = SeriesRegistry()
+
+
+async def ingest(db: AsyncSession, samples: Sequence[dict]) -> int:
+    """Store histogram samples and fold them into the rollups. Returns the number of new samples.
+
+    Samples already stored for the same series and timestamp are skipped, so
+    retried batches are not counted twice in the rollups.
+    """
+    series_ids = await series_registry.resolve(db, samples)
+    rows = {}
+    for series_id, sample in zip(series_ids, samples):
+        timestamp = sample["timestamp"]
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        rows[(series_id, timestamp)] = {
+            "series_id": series_id,
+            "timestamp": timestamp,
+            "counts": list(sample["counts"]),
+            "count": sum(sample["counts"]),
+            "sum": sample.get("sum") or 0.0,
+        }
+
+    statement = insert(HistogramSample).on_conflict_do_nothing().returning(
+        HistogramSample.series_id, HistogramSample.timestamp
+    )
+    inserted = (await db.execute(statement, list(rows.values()))).all()
+    if not inserted:
+        return 0
+
+    rollups: Dict[Tuple, dict] = {}
+    for key in inserted:
+        row = rows[tuple(key)]
+        for resolution in ROLLUP_RESOLUTIONS:
+            rollup_key = (row["series_id"], resolution, _align(row["timestamp"], resolution))
+            rollup = rollups.get(rollup_key)
+            if rollup is None:
+                rollups[rollup_key] = {
+                    "series_id": rollup_key[0],
+                    "resolution": resolution,
+                    "bucket_start": rollup_key[2],
+                    "counts": list(row["counts"]),
+                    "count": row["count"],
+                    "sum": row["sum"],
+                }
+            else:
+                rollup["counts"] = [a + b for a, b in zip(rollup["counts"], row["counts"])]
+                rollup["count"] += row["count"]
+                rollup["sum"] += row["sum"]
+
+    # Upsert in key order so concurrent batches lock rows in the same order
+    statement = insert(HistogramRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=[HistogramRollup.series_id, HistogramRollup.resolution, HistogramRollup.bucket_start],
+        set_={
+            "counts": _ADD_COUNTS,
+            "count": HistogramRollup.count + statement.excluded.count,
+            "sum": HistogramRollup.sum + statement.excluded.sum,
+        },
+    )
+    await db.execute(statement, [rollups[key] for key in sorted(rollups)])
+    return len(inserted)
+
+
+@dataclass
+class Histogram:
+    labels: Dict[str, str]
+    bounds: "np.ndarray"
+    counts: "np.ndarray"  # float64, len(bounds) + 1
+    sum: float
+    series_hashes: List[str] = field(default_factory=list)  # member series, to find their exemplars
+
+    @property
+    def count(self) -> float:
+        return float(self.counts.sum())
+
+
+def _series_labels(name: str, platform, service, labels: Optional[dict]) -> Dict[str, str]:
+    series_labels = {"__name__": name, **(labels or {})}
+    if platform:
+        series_labels["platform_id"] = str(platform)
+    if service:
+        series_labels["service_id"] = str(service)
+    return series_labels
+
+
+def _series_query(name: str, platform_id, service_id, labels):
+    series_query = select(
+        HistogramSeries.id,
+        HistogramSeries.series_hash,
+        HistogramSeries.platform_id,
+        HistogramSeries.service_id,
+        HistogramSeries.labels,
+        HistogramSeries.bounds,
+    ).where(HistogramSeries.name == name)
+    return apply_filters(series_query, HistogramSeries, platform_id, service_id, labels)
+
+
+async def load_histograms(
+    db: AsyncSession,
+    name: str,
+    start: datetime,
+    end: datetime,
+    platform_id: Optional[UUID] = None,
+    service_id: Optional[UUID] = None,
+    labels: Optional[dict] = None,
+) -> List[Histogram]:
+    """Every series of a histogram, summed over [start, end)."""
+    series_query = _series_query(name, platform_id, service_id, labels)
+    series_rows = (await db.execute(series_query)).all()
+    if not series_rows:
+        return []
+
+    totals = {}
+    for series_id, key, platform, service, series_labels, bounds in series_rows:
+        totals[series_id] = Histogram(
+            _series_labels(name, platform, service, series_labels),
+            np.asarray(bounds, dtype=np.float64),
+            np.zeros(len(bounds) + 1),
+            0.0,
+            [key],
+        )
+
+    # Sample queries repeat the series filter rather than binding every id: a
+    # metric can have more series than a statement can take parameters
+    ids = series_query.with_only_columns(HistogramSeries.id).scalar_subquery()
+    raw, rolled = [], []
+    for resolution, segment_start, segment_end in plan_segments(start, end):
+        if resolution is None:
+            raw.append(and_(HistogramSample.timestamp >= segment_start, HistogramSample.timestamp < segment_end))
+        else:
+            rolled.append(and_(
+                HistogramRollup.resolution == resolution,
+                HistogramRollup.bucket_start >= segment_start,
+                HistogramRollup.bucket_start < segment_end,
+            ))
+
+    queries = []
+    if raw:
+        queries.append(
+            select(HistogramSample.series_id, HistogramSample.counts, HistogramSample.sum)
+            .where(HistogramSample.series_id.in_(ids), or_(*raw))
+        )
+    if rolled:
+        queries.append(
+            select(HistogramRollup.series_id, HistogramRollup.counts, HistogramRollup.sum)
+            .where(HistogramRollup.series_id.in_(ids), or_(*rolled))
+        )
+    for query in queries:
+        for series_id, counts, total in (await db.execute(query)).all():
+            histogram = totals.get(series_id)
+            if histogram is None:  # registered since the series were read
+                continue
+            histogram.counts += counts
+            histogram.sum += total
+
+    return [histogram for histogram in totals.values() if histogram.count > 0]
+
+
+async def histogram_names(db: AsyncSession, names: Iterable[str]) -> Set[str]:
+    """The given metric names that are stored as native histograms."""
+    names = set(names)
+    if not names:
+        return set()
+    rows = await db.execute(select(HistogramSeries.name).where(HistogramSeries.name.in_(names)).distinct())
+    return set(rows.scalars().all())
+
+
+@dataclass
+class HistogramSamples:
+    labels: Dict[str, str]
+    bounds: "np.ndarray"
+    timestamps: "np.ndarray"  # int64 ms, ascending
+    counts: "np.ndarray"  # float64, one row per sample, len(bounds) + 1 columns
+
+
+async def load_histogram_samples(
+    db: AsyncSession,
+    name: str,
+    start: datetime,
+    end: datetime,
+    platform_id: Optional[UUID] = None,
+    service_id: Optional[UUID] = None,
+    labels: Optional[dict] = None,
+) -> List[HistogramSamples]:
+    """Raw samples of every series of a histogram in [start, end), for windows finer than the rollups."""
+    series_query = _series_query(name, platform_id, service_id, labels)
+    series_rows = (await db.execute(series_query)).all()
+    if not series_rows:
+        return []
+    rows = await db.execute(
+        select(HistogramSample.series_id, HistogramSample.timestamp, HistogramSample.counts)
+        .where(
+            HistogramSample.series_id.in_(series_query.with_only_columns(HistogramSeries.id).scalar_subquery()),
+            HistogramSample.timestamp >= start,
+            HistogramSample.timestamp < end,
+        )
+        .order_by(HistogramSample.series_id, HistogramSample.timestamp)
+    )
+    samples: Dict[int, Tuple[list, list]] = {}
+    for series_id, timestamp, counts in rows.all():
+        timestamps, all_counts = samples.setdefault(series_id, ([], []))
+        timestamps.append(to_millis(timestamp))
+        all_counts.append(counts)
+
+    result = []
+    for series_id, _, platform, service, series_labels, bounds in series_rows:
+        if series_id not in samples:
+            continue
+        timestamps, counts = samples[series_id]
+        result.append(HistogramSamples(
+            _series_labels(name, platform, service, series_labels),
+            np.asarray(bounds, dtype=np.float64),
+            np.array(timestamps, dtype=np.int64),
+            np.array(counts, dtype=np.float64).reshape(len(timestamps), len(bounds) + 1),
+        ))
+    return result
+
+
+def merge(histograms: Sequence[Histogram], by: Optional[Sequence[str]] = None) -> List[Histogram]:
+    """Add histograms sharing the values of the ``by`` labels (all of them when empty).
+
+    Series with the same bucket layout are summed directly; differing layouts
+    are first re-bucketed onto the union of their bounds.
+    """
+    groups: Dict[tuple, List[Histogram]] = {}
+    for histogram in histograms:
+        key = tuple(histogram.labels.get(name) for name in by or ())
+        groups.setdefault(key, []).append(histogram)
+
+    merged = []
+    for key, members in groups.items():
+        labels = {name: value for name, value in zip(by or (), key) if value is not None}
+        layouts = {tuple(h.bounds) for h in members}
+        if len(layouts) == 1:
+            bounds = members[0].bounds
+            counts = np.sum([h.counts for h in members], axis=0)
+        else:
+            bounds = np.unique(np.concatenate([h.bounds for h in members]))
+            counts = np.zeros(bounds.size + 1)
+            for h in members:
+                counts += h.counts if tuple(h.bounds) == tuple(bounds) else metric_engine.rebucket(h.bounds, h.counts, bounds)[0]
+        merged.append(Histogram(
+            labels, bounds, counts, sum(h.sum for h in members), [key for h in members for key in h.series_hashes]
+        ))
+    return merged
+
+
+def quantile(q: float, histogram: Histogram) -> float:
+    return float(metric_engine.histogram_quantile(q, histogram.bounds, histogram.counts)[0])
+
+
+async def histogram_quantiles(
+    db: AsyncSession,
+    name: str,
+    q: float,
+    start: datetime,
+    end: datetime,
+    by: Optional[Sequence[str]] = None,
+    platform_id: Optional[UUID] = None,
+    service_id: Optional[UUID] = None,
+) -> List[Tuple[Histogram, float]]:
+    """``histogram_quantile(q, sum by (...) (histogram[start:end]))`` for each group."""
+    histograms = await load_histograms(db, name, start, end, platform_id=platform_id, service_id=service_id)
+    return [(histogram, quantile(q, histogram)) for histogram in merge(histograms, by)]
@@ -0,0 +1,169 @@
+"""
+Incident timelines.
+
+Timeline entries and action items are rows of the append-only
+``incident_events`` table. An append is one INSERT that never touches the
+incident row, so automated entries from the correlator neither rewrite a
+growing JSON document nor contend on the incident's row lock. Pages are read
+by keyset on (timestamp, id).
+
+``Incident.timeline`` and ``action_items`` are served as a projection: the
+entries stored in the JSON columns before the events table existed, followed
+by the events in id order. Projections are cached per process and extended
+with only the events not folded in yet. Ids are assigned before commit, so
+with concurrent appends a lower id can become visible after a higher one was
+read: events stay in a re-read window until they have been seen for
+``SETTLE_SECONDS``, and late ones are slotted in at their id.
+"""
+
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, insert, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Incident, IncidentEvent
+
+# Incidents whose projection is kept in memory
+PROJECTION_CACHE_SIZE = 1024
+
+# How long an append may stay uncommitted after a higher id became visible
+SETTLE_SECONDS = 300
+
+EVENT_COLUMNS = ("id", "incident_id", "timestamp", "kind", "action", "user", "note", "data")
+
+
+def encode_cursor(timestamp: datetime, event_id: int) -> str:
+    return f"{timestamp.isoformat()}_{event_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of ``encode_cursor``. Raises ValueError on malformed input."""
+    timestamp, _, event_id = cursor.rpartition("_")
+    return datetime.fromisoformat(timestamp), int(event_id)
+
+
+async def append(db: AsyncSession, events: Sequence[dict]):
+    """Append events (incident_id, action and optionally timestamp, kind, user, note, data)."""
+    if events:
+        await db.execute(insert(IncidentEvent), [{"timestamp": datetime.utcnow(), **event} for event in events])
+
+
+async def append_one(db: AsyncSession, event: dict) -> dict:
+    """Append a single event and return the stored row."""
+    statement = insert(IncidentEvent).values({"timestamp": datetime.utcnow(), **event}).returning(
+        *(IncidentEvent.__table__.c[name] for name in EVENT_COLUMNS)
+    )
+    return dict(zip(EVENT_COLUMNS, (await db.execute(statement)).one()))
+
+
+async def page(
+    db: AsyncSession,
+    incident_id: UUID,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    kind: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of events in (timestamp, id) order and the cursor of the next page."""
+    query = select(*(IncidentEvent.__table__.c[name] for name in EVENT_COLUMNS)).where(
+        IncidentEvent.incident_id == incident_id
+    )
+    if kind:
+        query = query.where(IncidentEvent.kind == kind)
+    if cursor:
+        timestamp, event_id = decode_cursor(cursor)
+        query = query.where(tuple_(IncidentEvent.timestamp, IncidentEvent.id) > tuple_(timestamp, event_id))
+    query = query.order_by(IncidentEvent.timestamp, IncidentEvent.id).limit(limit + 1)
+
+    rows = [dict(zip(EVENT_COLUMNS, row)) for row in (await db.execute(query)).all()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    return rows, next_cursor
+
+
+@dataclass
+class Projection:
+    settled_id: int = 0  # every event up to this id is folded in
+    timeline: List[dict] = field(default_factory=list)
+    action_items: List[dict] = field(default_factory=list)
+    # Event id of each entry, 0 for entries from the JSON columns, to slot late events in
+    timeline_ids: List[int] = field(default_factory=list)
+    action_item_ids: List[int] = field(default_factory=list)
+    unsettled: Dict[int, float] = field(default_factory=dict)  # folded ids above settled_id -> first seen
+
+    @classmethod
+    def from_incident(cls, incident: Incident) -> "Projection":
+        timeline, action_items = list(incident.timeline or []), list(incident.action_items or [])
+        return cls(0, timeline, action_items, [0] * len(timeline), [0] * len(action_items))
+
+    def fold(self, event: dict, now: float):
+        if event["id"] <= self.settled_id or event["id"] in self.unsettled:
+            return
+        if event["kind"] == "action_item":
+            entries, ids = self.action_items, self.action_item_ids
+        else:
+            entries, ids = self.timeline, self.timeline_ids
+        position = bisect_right(ids, event["id"])
+        ids.insert(position, event["id"])
+        entries.insert(position, _entry(event))
+        self.unsettled[event["id"]] = now
+
+    def settle(self, now: float):
+        """Stop re-reading below the lowest id seen for less than SETTLE_SECONDS."""
+        for event_id in sorted(self.unsettled):
+            if now - self.unsettled[event_id] < SETTLE_SECONDS:
+                break
+            self.settled_id = event_id
+            del self.unsettled[event_id]
+
+
+def _entry(event: dict) -> dict:
+    entry = {
+        "timestamp": event["timestamp"].isoformat(),
+        "action": event["action"],
+        "user": event["user"],
+        "note": event["note"],
+    }
+    if event["data"]:
+        entry["data"] = event["data"]
+    return entry
+
+
+class ProjectionCache:
+    """LRU of incident timeline projections."""
+
+    def __init__(self, size: int = PROJECTION_CACHE_SIZE):
+        self.size = size
+        self.projections: "OrderedDict[UUID, Projection]" = OrderedDict()
+
+    async def get(self, db: AsyncSession, incident: Incident) -> Projection:
+        projection = self.projections.get(incident.id)
+        if projection is None:
+            projection = Projection.from_incident(incident)
+
+        result = await db.execute(
+            select(*(IncidentEvent.__table__.c[name] for name in EVENT_COLUMNS))
+            .where(IncidentEvent.incident_id == incident.id, IncidentEvent.id > projection.settled_id)
+            .order_by(IncidentEvent.id)
+        )
+        now = time.monotonic()
+        # A concurrent reader may have folded the same events in meanwhile; fold skips them
+        for row in result.all():
+            projection.fold(dict(zip(EVENT_COLUMNS, row)), now)
+        projection.settle(now)
+
+        self.projections[incident.id] = projection
+        self.projections.move_to_end(incident.id)
+        while len(self.projections) > self.size:
+            self.projections.popitem(last=False)
+        return projection
+
+
+projections = ProjectionCache()
@@ -0,0 +1,311 @@
+"""
+Alert-to-incident correlation.
+
+Firing alerts are grouped into incidents as they are raised. Each open
+incident registers correlation keys in a process-local dictionary:
+
+* ``("service", service_id)``: alerts on a service already involved;
+* ``("platform", platform_id, alertname)``: the same alert across a platform;
+* ``("label", name, value)``: shared values of ``INCIDENT_CORRELATION_LABELS``.
+
+A new alert looks up its own keys, then the service keys of its dependency
+neighbours, so matching costs a handful of dictionary probes rather than a
+query. Dependencies are read from ``traces.services_involved``: services that
+appear in the same recent trace are adjacent. An incident absorbs alerts until
+it has been quiet for ``INCIDENT_GROUP_WINDOW_SECONDS``; later alerts open a
+new one.
+
+Incidents created or widened by a batch are written with one bulk INSERT and
+one bulk UPDATE, every alert is appended to the incident timeline, and the
+caller stores the alerts with ``incident_id`` set. A batch works on copies of
+the incidents it touches, merged into the index only once the caller's
+transaction commits, so a rolled-back batch never leaves alerts attaching to
+incidents that were not written.
+
+The dependency graph and the pruning of closed or quiet incidents are
+refreshed by ``run_refresh_loop`` in the background, never inside ingest.
+"""
+
+import asyncio
+import uuid
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+import structlog
+from sqlalchemy import select, insert, update, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import after_commit, background_session
+from app.models import Alert, Incident
+from app.services import incident_timeline
+
+logger = structlog.get_logger()
+
+SEVERITY_RANK = {"info": 0, "low": 1, "medium": 2, "high": 3, "critical": 4}
+
+# Incident statuses that still accept alerts
+OPEN_STATUSES = ("open", "acknowledged", "investigating")
+
+_DEPENDENCY_QUERY = text(
+    "SELECT DISTINCT a.service, b.service "
+    "FROM traces, unnest(services_involved) AS a(service), unnest(services_involved) AS b(service) "
+    "WHERE start_time >= :since AND a.service < b.service"
+)
+
+
+def _naive(value: datetime) -> datetime:
+    """Alerts and incidents store naive UTC timestamps."""
+    return value.replace(tzinfo=None) - value.utcoffset() if value.tzinfo else value
+
+
+@dataclass
+class OpenIncident:
+    id: uuid.UUID
+    severity: str
+    started_at: datetime
+    last_alert_at: datetime
+    platforms: Set[str] = field(default_factory=set)
+    services: Set[str] = field(default_factory=set)
+    keys: Set[tuple] = field(default_factory=set)
+
+    def copy(self) -> "OpenIncident":
+        return replace(self, platforms=set(self.platforms), services=set(self.services), keys=set(self.keys))
+
+    def absorb(self, other: "OpenIncident"):
+        """Fold in changes another batch made to its copy of this incident."""
+        if SEVERITY_RANK.get(other.severity, 0) > SEVERITY_RANK.get(self.severity, 0):
+            self.severity = other.severity
+        self.last_alert_at = max(self.last_alert_at, other.last_alert_at)
+        self.platforms |= other.platforms
+        self.services |= other.services
+        self.keys |= other.keys
+
+
+class _Batch:
+    """Incidents touched by one ``correlate`` call, applied to the correlator after commit."""
+
+    def __init__(self):
+        self.incidents: Dict[uuid.UUID, OpenIncident] = {}
+        self.index: Dict[tuple, uuid.UUID] = {}
+
+
+class IncidentCorrelator:
+    """Process-local index of open incidents plus the service dependency graph."""
+
+    def __init__(self):
+        self.incidents: Dict[uuid.UUID, OpenIncident] = {}
+        self.index: Dict[tuple, uuid.UUID] = {}
+        self.neighbours: Dict[str, Set[str]] = {}
+        self._loaded = False
+
+    @property
+    def window(self) -> timedelta:
+        return timedelta(seconds=settings.INCIDENT_GROUP_WINDOW_SECONDS)
+
+    @staticmethod
+    def keys_for(alert: dict) -> List[tuple]:
+        labels = alert.get("labels") or {}
+        keys = []
+        if alert.get("service_id"):
+            keys.append(("service", str(alert["service_id"])))
+        if alert.get("platform_id"):
+            keys.append(("platform", str(alert["platform_id"]), labels.get("alertname", alert["name"])))
+        for name in settings.INCIDENT_CORRELATION_LABELS:
+            if labels.get(name) is not None:
+                keys.append(("label", name, str(labels[name])))
+        return keys
+
+    # State
+
+    async def load(self, db: AsyncSession):
+        """Warm start: incidents still open and the alerts that joined them recently."""
+        rows = (await db.execute(
+            select(Incident.id, Incident.severity, Incident.started_at, Incident.affected_platforms,
+                   Incident.affected_services)
+            .where(Incident.status.in_(OPEN_STATUSES))
+        )).all()
+        incidents = {
+            incident_id: OpenIncident(
+                incident_id, severity, started_at, started_at, set(platforms or ()), set(services or ()),
+            )
+            for incident_id, severity, started_at, platforms, services in rows
+        }
+        index: Dict[tuple, uuid.UUID] = {}
+        if incidents:
+            alerts = (await db.execute(
+                select(Alert.incident_id, Alert.name, Alert.platform_id, Alert.service_id, Alert.labels,
+                       Alert.fired_at)
+                .where(Alert.incident_id.in_(list(incidents)), Alert.fired_at >= datetime.utcnow() - self.window)
+                .order_by(Alert.fired_at)
+            )).all()
+            for incident_id, name, platform_id, service_id, labels, fired_at in alerts:
+                alert = {"name": name, "platform_id": platform_id, "service_id": service_id, "labels": labels}
+                self._attach(incidents[incident_id], alert, self.keys_for(alert), fired_at, index)
+        if not self._loaded:  # a concurrent load may have finished first
+            self.incidents, self.index, self._loaded = incidents, index, True
+
+    async def refresh(self, db: AsyncSession):
+        """Reload the dependency graph and forget incidents closed or gone quiet."""
+        since = datetime.utcnow() - timedelta(minutes=settings.INCIDENT_DEPENDENCY_LOOKBACK_MINUTES)
+        neighbours: Dict[str, Set[str]] = {}
+        for a, b in (await db.execute(_DEPENDENCY_QUERY, {"since": since})).all():
+            neighbours.setdefault(a, set()).add(b)
+            neighbours.setdefault(b, set()).add(a)
+        self.neighbours = neighbours
+
+        if not self._loaded:
+            await self.load(db)
+        elif self.incidents:
+            # Incidents opened while the query runs are not in it, so only the queried ones are pruned
+            queried = list(self.incidents)
+            still_open = set((await db.execute(
+                select(Incident.id).where(Incident.id.in_(queried), Incident.status.in_(OPEN_STATUSES))
+            )).scalars())
+            for incident_id in queried:
+                if incident_id not in still_open and incident_id in self.incidents:
+                    self._forget(incident_id)
+
+        quiet_since = datetime.utcnow() - self.window
+        for incident in list(self.incidents.values()):
+            if incident.last_alert_at < quiet_since:
+                self._forget(incident.id)
+
+    def _forget(self, incident_id: uuid.UUID):
+        incident = self.incidents.pop(incident_id)
+        for key in incident.keys:
+            if self.index.get(key) == incident_id:
+                del self.index[key]
+
+    def _attach(
+        self, incident: OpenIncident, alert: dict, keys: List[tuple], fired_at: datetime, index: Dict[tuple, uuid.UUID]
+    ):
+        incident.last_alert_at = max(incident.last_alert_at, fired_at)
+        if alert.get("platform_id"):
+            incident.platforms.add(str(alert["platform_id"]))
+        if alert.get("service_id"):
+            incident.services.add(str(alert["service_id"]))
+        for key in keys:
+            incident.keys.add(key)
+            index[key] = incident.id
+
+    def _apply(self, batch: _Batch, opened: Set[uuid.UUID]):
+        """Merge a committed batch into the index."""
+        for incident_id, incident in batch.incidents.items():
+            current = self.incidents.get(incident_id)
+            if current is not None:
+                current.absorb(incident)
+            elif incident_id in opened:
+                self.incidents[incident_id] = incident
+        self.index.update(batch.index)
+
+    # Matching
+
+    def match(
+        self, alert: dict, keys: List[tuple], fired_at: datetime, batch: Optional[_Batch] = None
+    ) -> Optional[OpenIncident]:
+        """Open incident an alert belongs to, if any, seeing the batch's changes first."""
+        batch = batch or _Batch()
+        candidates = list(keys)
+        if alert.get("service_id"):
+            candidates += [("service", n) for n in self.neighbours.get(str(alert["service_id"]), ())]
+        window = self.window
+        for key in candidates:
+            incident_id = batch.index.get(key) or self.index.get(key)
+            incident = batch.incidents.get(incident_id) or self.incidents.get(incident_id)
+            if incident is not None and incident.started_at - window <= fired_at <= incident.last_alert_at + window:
+                return incident
+        return None
+
+    async def correlate(self, db: AsyncSession, alerts: List[dict]) -> int:
+        """Assign ``incident_id`` on each firing alert dict and persist the incidents.
+
+        Alerts must carry name, severity, fired_at and optionally platform_id,
+        service_id and labels. Returns the number of incidents opened. The
+        index sees the batch once ``db`` commits.
+        """
+        if not self._loaded:
+            await self.load(db)
+
+        batch = _Batch()
+        created: Dict[uuid.UUID, dict] = {}
+        changed: Dict[uuid.UUID, OpenIncident] = {}
+        events: List[dict] = []
+        now = datetime.utcnow()
+        for alert in sorted(alerts, key=lambda a: _naive(a["fired_at"])):
+            if alert.get("status", "firing") != "firing":
+                continue
+            fired_at = _naive(alert["fired_at"])
+            keys = self.keys_for(alert)
+            incident = self.match(alert, keys, fired_at, batch)
+            opened = incident is None
+            if opened:
+                incident = OpenIncident(uuid.uuid4(), alert["severity"], fired_at, fired_at)
+                batch.incidents[incident.id] = incident
+                created[incident.id] = {
+                    "id": incident.id,
+                    "title": alert["name"],
+                    "description": alert.get("description"),
+                    "status": "open",
+                    "started_at": fired_at,
+                    "detected_at": now,
+                    "timeline": [],
+                    "action_items": [],
+                }
+            elif incident.id not in batch.incidents:
+                incident = batch.incidents[incident.id] = incident.copy()
+            before = (incident.severity, len(incident.platforms), len(incident.services))
+            if SEVERITY_RANK.get(alert["severity"], 0) > SEVERITY_RANK.get(incident.severity, 0):
+                incident.severity = alert["severity"]
+            self._attach(incident, alert, keys, fired_at, batch.index)
+            if incident.id not in created and before != (
+                incident.severity, len(incident.platforms), len(incident.services)
+            ):
+                changed[incident.id] = incident
+            alert["incident_id"] = incident.id
+            events.append({
+                "incident_id": incident.id,
+                "timestamp": fired_at,
+                "action": "opened" if opened else "alert_attached",
+                "note": alert["name"],
+                "data": {
+                    "severity": alert["severity"],
+                    "platform_id": str(alert["platform_id"]) if alert.get("platform_id") else None,
+                    "service_id": str(alert["service_id"]) if alert.get("service_id") else None,
+                },
+            })
+
+        def impact(incident: OpenIncident) -> dict:
+            return {
+                "id": incident.id,
+                "severity": incident.severity,
+                "affected_platforms": sorted(incident.platforms),
+                "affected_services": sorted(incident.services),
+            }
+
+        if created:
+            await db.execute(insert(Incident), [created[i] | impact(batch.incidents[i]) for i in created])
+        if changed:
+            await db.execute(update(Incident), [impact(incident) for incident in changed.values()])
+        await incident_timeline.append(db, events)
+        if batch.incidents:
+            opened_ids = set(created)
+            after_commit(db, lambda: self._apply(batch, opened_ids))
+        if created:
+            logger.info("Incidents opened", incidents=len(created), alerts=len(alerts))
+        return len(created)
+
+
+correlator = IncidentCorrelator()
+
+
+async def run_refresh_loop():
+    """Keep the dependency graph current and prune closed incidents, off the ingest path."""
+    while True:
+        try:
+            async with background_session() as db:
+                await correlator.refresh(db)
+        except Exception as e:
+            logger.error("Failed to refresh incident correlation", error=str(e))
+        await asyncio.sleep(settings.INCIDENT_DEPENDENCY_REFRESH_SECONDS)
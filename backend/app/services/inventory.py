@@ -0,0 +1,91 @@
+"""
+Bulk inventory sync for platforms and services.
+
+``upsert`` writes a whole batch with ``INSERT ... ON CONFLICT DO UPDATE`` on
+the natural key (``code`` for platforms, ``platform_id, slug`` for
+services). Rows whose stored values already match are left untouched, so a
+resync of an unchanged inventory writes nothing. ``RETURNING (xmax = 0)``
+tells created rows from updated ones. ``deactivate_missing`` then flags the
+active rows the batch did not mention.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import JSON, cast, literal_column, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# key -> (id, "created" | "updated" | "unchanged")
+UpsertResult = Dict[tuple, Tuple[UUID, str]]
+
+
+def _distinct(column, incoming):
+    # json has no equality operator in Postgres; jsonb compares by value
+    if isinstance(column.type, JSON):
+        return cast(column, JSONB).is_distinct_from(cast(incoming, JSONB))
+    return column.is_distinct_from(incoming)
+
+
+async def upsert(db: AsyncSession, model, keys: Sequence[str], rows: List[dict]) -> UpsertResult:
+    """Insert or update ``rows`` (all with the same columns) on their ``keys``, reactivating them."""
+    if not rows:
+        return {}
+    table = model.__table__
+    key_columns = [table.c[name] for name in keys]
+    columns = [name for name in rows[0] if name not in keys]
+
+    stmt = pg_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={
+            **{name: stmt.excluded[name] for name in columns},
+            "is_active": True,
+            "updated_at": datetime.utcnow(),
+        },
+        where=or_(
+            table.c.is_active.isnot(True),
+            *(_distinct(table.c[name], stmt.excluded[name]) for name in columns),
+        ),
+    ).returning(table.c.id, *key_columns, literal_column("xmax = 0").label("inserted"))
+
+    results: UpsertResult = {}
+    for row in (await db.execute(stmt, rows)).all():
+        results[tuple(row[1:-1])] = (row.id, "created" if row.inserted else "updated")
+
+    # Rows skipped by the WHERE clause are not returned
+    unchanged = [tuple(row[name] for name in keys) for row in rows]
+    unchanged = [key for key in unchanged if key not in results]
+    if unchanged:
+        found = await db.execute(select(table.c.id, *key_columns).where(tuple_(*key_columns).in_(unchanged)))
+        for row in found.all():
+            results[tuple(row[1:])] = (row.id, "unchanged")
+    return results
+
+
+async def deactivate_missing(
+    db: AsyncSession,
+    model,
+    keys: Sequence[str],
+    present: List[tuple],
+    scope: Optional[object] = None,
+) -> int:
+    """Mark active rows (within ``scope``, a WHERE clause) whose key is not in ``present`` inactive."""
+    table = model.__table__
+    stmt = update(table).where(table.c.is_active.is_(True))
+    if present:
+        stmt = stmt.where(~tuple_(*(table.c[name] for name in keys)).in_(present))
+    if scope is not None:
+        stmt = stmt.where(scope)
+    result = await db.execute(stmt.values(is_active=False, updated_at=datetime.utcnow()))
+    return result.rowcount
+
+
+def summarize(items: List[dict], deactivated: int) -> dict:
+    """Bulk response body from per-item results."""
+    counts = {status: 0 for status in ("created", "updated", "unchanged", "failed")}
+    for item in items:
+        if item["status"] in counts:
+            counts[item["status"]] += 1
+    return {**counts, "deactivated": deactivated, "items": items}
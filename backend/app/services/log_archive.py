@@ -0,0 +1,339 @@
+"""
+Columnar archive for cold logs.
+
+Compaction moves old rows out of the ``logs`` table into immutable chunk files:
+
+    <archive>/<YYYY-MM-DD>/<min_us>_<max_us>_<id>.olc
+
+    b"OBSLOG01" | u32 header length | header JSON | column blocks | bloom bits
+
+The header carries the chunk's row count, min/max timestamp, per-column block
+offsets and the dictionaries of low-cardinality columns (platform, service,
+level, ...), which double as the chunk's zone map. Timestamps are stored as
+delta-encoded int64 microseconds, dictionary columns as uint32 codes and the
+rest as JSON arrays; every block is zlib-compressed. A bloom filter over
+``trace_id`` is stored uncompressed so lookups probe a handful of bytes through
+the memory map. Template texts referenced by the chunk are embedded in the
+header, so chunks can be rendered without the database.
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import uuid
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from hashlib import blake2b
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+
+from app.services.log_templates import render
+
+MAGIC = b"OBSLOG01"
+SUFFIX = ".olc"
+PENDING_SUFFIX = ".pending"  # written, awaiting the commit that deletes its rows
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+COLUMNS = [
+    "id", "timestamp", "platform_id", "service_id", "level", "message", "template_id", "params",
+    "trace_id", "span_id", "request_id", "user_id", "source", "environment", "host",
+    "container_id", "pod_name", "attributes",
+]
+DICTIONARY_COLUMNS = {
+    "platform_id", "service_id", "level", "template_id", "source", "environment", "host",
+    "container_id", "pod_name",
+}
+
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+
+
+def to_micros(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def _bloom_positions(key: str, bits: int) -> List[int]:
+    digest = blake2b(key.encode("utf-8"), digest_size=16).digest()
+    h1, h2 = struct.unpack("<QQ", digest)
+    return [(h1 + i * h2) % bits for i in range(BLOOM_HASHES)]
+
+
+def _json_value(value: Any) -> Any:
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+
+def write_chunk(directory: Path, rows: List[dict], templates: Dict[int, str], pending: bool = False) -> Path:
+    """Write rows (sorted by timestamp) as one chunk file, atomically.
+
+    With ``pending`` the durable file is left under ``PENDING_SUFFIX``, invisible
+    to searches, until ``publish_chunk`` renames it.
+    """
+    timestamps = [to_micros(row["timestamp"]) for row in rows]
+    deltas = array("q", (t - p for t, p in zip(timestamps, [0] + timestamps[:-1])))
+
+    header: Dict[str, Any] = {
+        "version": 1,
+        "rows": len(rows),
+        "min_ts": timestamps[0],
+        "max_ts": timestamps[-1],
+        "columns": {},
+        "templates": {},
+    }
+    blocks: List[bytes] = []
+    offset = 0
+
+    def add_block(payload: bytes) -> List[int]:
+        nonlocal offset
+        blocks.append(payload)
+        start, offset = offset, offset + len(payload)
+        return [start, len(payload)]
+
+    header["columns"]["timestamp"] = {
+        "encoding": "delta-i64",
+        "block": add_block(zlib.compress(deltas.tobytes(), 6)),
+    }
+    for name in COLUMNS:
+        if name == "timestamp":
+            continue
+        values = [_json_value(row.get(name)) for row in rows]
+        if name in DICTIONARY_COLUMNS:
+            dictionary = list(dict.fromkeys(values))
+            index = {value: code for code, value in enumerate(dictionary)}
+            codes = array("I", (index[value] for value in values))
+            header["columns"][name] = {
+                "encoding": "dictionary",
+                "dictionary": dictionary,
+                "block": add_block(zlib.compress(codes.tobytes(), 6)),
+            }
+        else:
+            header["columns"][name] = {
+                "encoding": "json",
+                "block": add_block(zlib.compress(orjson.dumps(values), 6)),
+            }
+
+    used_templates = {row["template_id"] for row in rows if row.get("template_id") is not None}
+    header["templates"] = {str(tid): templates[tid] for tid in used_templates if tid in templates}
+
+    bloom_bits = max(64, len(rows) * BLOOM_BITS_PER_KEY)
+    bloom = bytearray((bloom_bits + 7) // 8)
+    for row in rows:
+        if row.get("trace_id"):
+            for position in _bloom_positions(row["trace_id"], bloom_bits):
+                bloom[position >> 3] |= 1 << (position & 7)
+    header["bloom"] = {"bits": bloom_bits, "block": add_block(bytes(bloom))}
+
+    day_dir = directory / from_micros(timestamps[0]).strftime("%Y-%m-%d")
+    day_dir.mkdir(parents=True, exist_ok=True)
+    path = day_dir / f"{timestamps[0]}_{timestamps[-1]}_{uuid.uuid4().hex[:8]}{SUFFIX}"
+    tmp_path = path.with_suffix(".tmp")
+
+    header_bytes = orjson.dumps(header)
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for block in blocks:
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    if pending:
+        path = path.with_suffix(PENDING_SUFFIX)
+    os.replace(tmp_path, path)
+    return path
+
+
+def publish_chunk(pending_path: Path) -> Path:
+    """Make a pending chunk visible to searches."""
+    path = pending_path.with_suffix(SUFFIX)
+    os.replace(pending_path, path)
+    directory = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+    return path
+
+
+def pending_chunks(directory: Path) -> List[Path]:
+    return sorted(directory.glob(f"*/*{PENDING_SUFFIX}"))
+
+
+def first_row_id(path: Path) -> str:
+    with ArchiveChunk(path) as chunk:
+        return chunk.column("id")[0]
+
+
+@lru_cache(maxsize=8192)
+def read_header(path: Path) -> dict:
+    """Parse a chunk header. Chunks are immutable, so headers are cached per path."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a log archive chunk")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = orjson.loads(f.read(length))
+    header["data_offset"] = len(MAGIC) + 4 + length
+    return header
+
+
+class ArchiveChunk:
+    """Memory-mapped reader that decodes columns on demand."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.header = read_header(path)
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._columns: Dict[str, Any] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _block(self, block: List[int]) -> memoryview:
+        start = self.header["data_offset"] + block[0]
+        return memoryview(self._map)[start:start + block[1]]
+
+    def might_contain_trace(self, trace_id: str) -> bool:
+        bloom = self.header["bloom"]
+        bits = self._block(bloom["block"])
+        try:
+            return all(bits[p >> 3] & (1 << (p & 7)) for p in _bloom_positions(trace_id, bloom["bits"]))
+        finally:
+            bits.release()
+
+    def timestamps(self) -> List[int]:
+        if "timestamp" not in self._columns:
+            deltas = array("q")
+            deltas.frombytes(zlib.decompress(self._block(self.header["columns"]["timestamp"]["block"])))
+            running, values = 0, []
+            for delta in deltas:
+                running += delta
+                values.append(running)
+            self._columns["timestamp"] = values
+        return self._columns["timestamp"]
+
+    def codes(self, name: str) -> array:
+        key = f"{name}#codes"
+        if key not in self._columns:
+            codes = array("I")
+            codes.frombytes(zlib.decompress(self._block(self.header["columns"][name]["block"])))
+            self._columns[key] = codes
+        return self._columns[key]
+
+    def column(self, name: str) -> List[Any]:
+        if name == "timestamp":
+            return [from_micros(value) for value in self.timestamps()]
+        if name not in self._columns:
+            meta = self.header["columns"][name]
+            if meta["encoding"] == "dictionary":
+                dictionary = meta["dictionary"]
+                self._columns[name] = [dictionary[code] for code in self.codes(name)]
+            else:
+                self._columns[name] = orjson.loads(zlib.decompress(self._block(meta["block"])))
+        return self._columns[name]
+
+    def rows(self, indexes: Iterable[int]) -> List[dict]:
+        columns = {name: self.column(name) for name in COLUMNS}
+        templates = self.header["templates"]
+        rows = []
+        for i in indexes:
+            row = {name: values[i] for name, values in columns.items()}
+            if row["message"] is None and row["template_id"] is not None:
+                row["message"] = render(templates.get(str(row["template_id"]), ""), row["params"])
+            rows.append(row)
+        return rows
+
+
+def list_chunks(directory: Path, start: datetime, end: datetime) -> List[Path]:
+    """Chunk files overlapping [start, end), newest first, pruned by file name."""
+    start_us, end_us = to_micros(start), to_micros(end)
+    paths = []
+    day = start.date()
+    while day <= end.date():
+        day_dir = directory / day.isoformat()
+        if day_dir.is_dir():
+            for path in day_dir.glob(f"*{SUFFIX}"):
+                min_ts, max_ts, _ = path.stem.split("_")
+                if int(min_ts) < end_us and int(max_ts) >= start_us:
+                    paths.append((int(max_ts), path))
+        day += timedelta(days=1)
+    return [path for _, path in sorted(paths, reverse=True)]
+
+
+def _zone_allows(header: dict, name: str, value: Optional[str]) -> bool:
+    return value is None or value in header["columns"][name]["dictionary"]
+
+
+def search_archive(
+    directory: Path,
+    start: datetime,
+    end: datetime,
+    limit: int,
+    platform_id: Optional[str] = None,
+    service_id: Optional[str] = None,
+    level: Optional[str] = None,
+    trace_id: Optional[str] = None,
+    q: Optional[str] = None,
+) -> List[dict]:
+    """Newest matching archived rows in [start, end). Blocking; run in a thread."""
+    start_us, end_us = to_micros(start), to_micros(end)
+    needle = q.lower() if q else None
+    newest: List[tuple] = []  # min-heap of (timestamp, seq, row)
+    seq = 0
+
+    for path in list_chunks(directory, start, end):
+        header = read_header(path)
+        if len(newest) >= limit and header["max_ts"] < newest[0][0]:
+            break
+        if not (
+            _zone_allows(header, "platform_id", platform_id)
+            and _zone_allows(header, "service_id", service_id)
+            and _zone_allows(header, "level", level)
+        ):
+            continue
+
+        with ArchiveChunk(path) as chunk:
+            if trace_id and not chunk.might_contain_trace(trace_id):
+                continue
+
+            timestamps = chunk.timestamps()
+            candidates = [i for i, ts in enumerate(timestamps) if start_us <= ts < end_us]
+            for name, value in (("platform_id", platform_id), ("service_id", service_id), ("level", level)):
+                if value is not None and candidates:
+                    code = header["columns"][name]["dictionary"].index(value)
+                    codes = chunk.codes(name)
+                    candidates = [i for i in candidates if codes[i] == code]
+            if trace_id and candidates:
+                trace_ids = chunk.column("trace_id")
+                candidates = [i for i in candidates if trace_ids[i] == trace_id]
+            if not candidates:
+                continue
+
+            for row in chunk.rows(candidates):
+                if needle and needle not in (row["message"] or "").lower():
+                    continue
+                key = (to_micros(row["timestamp"]), seq, row)
+                seq += 1
+                if len(newest) < limit:
+                    heapq.heappush(newest, key)
+                elif key[0] > newest[0][0]:
+                    heapq.heapreplace(newest, key)
+
+    return [row for _, _, row in sorted(newest, key=lambda item: (item[0], item[1]), reverse=True)]
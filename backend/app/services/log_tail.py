@@ -0,0 +1,223 @@
+"""
+Live log tail fed from the ingest path.
+
+Every ingested batch is offered to ``log_bus`` once its transaction commits;
+nothing is read back from the database. Publishing only puts the batch on a
+bounded inbox: ``LogBus.run`` matches it against the subscribers in the
+background, so ingest never pays for the fan-out. Each subscriber's filter
+(service, platform, levels, substring, attribute values) is compiled once
+into a list of predicates when it subscribes, and lines it matches are
+encoded and put on its queue. The queue is bounded by
+``LOG_TAIL_QUEUE_SIZE``: when a client reads too slowly, new lines for it are
+dropped, counted in ``observatory_log_tail_dropped_total`` and reported on
+its stream. Batches arriving while ``LOG_TAIL_INBOX_BATCHES`` are already
+waiting are dropped and counted the same way.
+
+Regular expressions are user input and Python's engine backtracks without a
+time limit, holding the GIL, so they run in the ``regex_matcher`` child
+process, which is killed when a pattern takes longer than
+``LOG_TAIL_MATCH_TIMEOUT_SECONDS`` on a batch. That subscriber's stream ends
+with an ``error`` event; the others are unaffected.
+
+The bus is per process: a subscriber sees the lines ingested by the worker
+serving its stream.
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import structlog
+
+from app import telemetry
+from app.config import settings
+from app.responses import dumps
+from app.services.regex_matcher import regex_matcher
+
+logger = structlog.get_logger()
+
+# Longest regex accepted in a tail filter
+MAX_PATTERN_LENGTH = 200
+
+dropped_lines = telemetry.counter(
+    "observatory_log_tail_dropped_total",
+    "Log lines not delivered to a live tail subscriber whose queue, or the bus inbox, was full.",
+)
+
+
+Predicate = Callable[[dict], bool]
+
+
+@dataclass
+class TailFilter:
+    predicates: List[Predicate]
+    pattern: Optional[str] = None  # regex on the message, run by the matcher process
+
+
+def compile_filter(
+    service_id: Optional[str] = None,
+    platform_id: Optional[str] = None,
+    levels: Sequence[str] = (),
+    q: Optional[str] = None,
+    pattern: Optional[str] = None,
+    attributes: Optional[Dict[str, str]] = None,
+) -> TailFilter:
+    """Predicates a line must all satisfy, cheapest first, and its regex. Raises ValueError on a bad pattern."""
+    predicates: List[Predicate] = []
+    if service_id:
+        predicates.append(lambda row: str(row["service_id"]) == service_id)
+    if platform_id:
+        predicates.append(lambda row: str(row["platform_id"]) == platform_id)
+    if levels:
+        wanted = frozenset(levels)
+        predicates.append(lambda row: row["level"] in wanted)
+    for name, value in (attributes or {}).items():
+        predicates.append(lambda row, name=name, value=value: str((row["attributes"] or {}).get(name)) == value)
+    if q:
+        needle = q.lower()
+        predicates.append(lambda row: needle in row["message"].lower())
+    if pattern:
+        if len(pattern) > MAX_PATTERN_LENGTH:
+            raise ValueError(f"Pattern longer than {MAX_PATTERN_LENGTH} characters")
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern: {e}")
+    return TailFilter(predicates, pattern)
+
+
+@dataclass(eq=False)
+class Subscriber:
+    predicates: List[Predicate]
+    pattern: Optional[str] = None
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(settings.LOG_TAIL_QUEUE_SIZE))
+    dropped: int = 0  # since last reported to the client
+    error: Optional[str] = None  # set when the bus closes the subscription
+
+    def matches(self, row: dict) -> bool:
+        for predicate in self.predicates:
+            if not predicate(row):
+                return False
+        return True
+
+
+class LogBus:
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.matcher = regex_matcher
+        self._inbox: Optional[asyncio.Queue] = None
+
+    @property
+    def inbox(self) -> asyncio.Queue:
+        if self._inbox is None:
+            self._inbox = asyncio.Queue(settings.LOG_TAIL_INBOX_BATCHES)
+        return self._inbox
+
+    def subscribe(self, tail_filter: TailFilter) -> Subscriber:
+        if len(self.subscribers) >= settings.LOG_TAIL_MAX_SUBSCRIBERS:
+            raise OverflowError("Too many live tail subscribers")
+        subscriber = Subscriber(tail_filter.predicates, tail_filter.pattern)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, rows: Sequence[dict]):
+        """Queue committed rows (``logs`` columns, message rendered) for delivery; never blocks."""
+        if not self.subscribers:
+            return
+        try:
+            self.inbox.put_nowait(rows)
+        except asyncio.QueueFull:
+            dropped_lines.inc(len(rows))
+
+    async def run(self):
+        """Deliver published batches to the subscribers, one batch at a time."""
+        while True:
+            rows = await self.inbox.get()
+            try:
+                await self.deliver(rows)
+            except Exception as e:
+                logger.error("Failed to deliver log tail batch", error=str(e))
+
+    async def deliver(self, rows: Sequence[dict]):
+        encoded: Dict[int, bytes] = {}
+        by_pattern: List[Tuple[Subscriber, List[int]]] = []
+        for subscriber in list(self.subscribers):
+            matched = [i for i, row in enumerate(rows) if subscriber.matches(row)]
+            if subscriber.pattern and matched:
+                by_pattern.append((subscriber, matched))
+            else:
+                self._enqueue(subscriber, rows, matched, encoded)
+            await asyncio.sleep(0)  # let ingest and streams run between subscribers
+
+        if by_pattern:
+            results = await asyncio.to_thread(
+                self.matcher.match,
+                [row["message"] for row in rows],
+                [(subscriber.pattern, matched) for subscriber, matched in by_pattern],
+                settings.LOG_TAIL_MATCH_TIMEOUT_SECONDS,
+            )
+            for (subscriber, _), matched in zip(by_pattern, results):
+                if matched is None:
+                    self._close(subscriber, "Pattern took too long to match; the tail was closed")
+                elif subscriber in self.subscribers:
+                    self._enqueue(subscriber, rows, matched, encoded)
+
+    def _enqueue(self, subscriber: Subscriber, rows: Sequence[dict], matched: List[int], encoded: Dict[int, bytes]):
+        queue = subscriber.queue
+        for i in matched:
+            if queue.full():
+                subscriber.dropped += 1
+                dropped_lines.inc()
+                continue
+            line = encoded.get(i)
+            if line is None:
+                line = encoded[i] = dumps(rows[i])
+            queue.put_nowait(line)
+
+    def _close(self, subscriber: Subscriber, reason: str):
+        logger.warning("Closed live tail subscriber", reason=reason, pattern=subscriber.pattern)
+        self.unsubscribe(subscriber)
+        subscriber.error = reason
+        if not subscriber.queue.full():
+            subscriber.queue.put_nowait(b"")  # wake the stream
+
+
+log_bus = LogBus()
+
+
+async def stream(subscriber: Subscriber, is_disconnected: Callable):
+    """Server-sent events for a subscriber: one ``data`` line per log line."""
+    heartbeat = settings.LOG_TAIL_HEARTBEAT_SECONDS
+    try:
+        while True:
+            try:
+                line = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield b": keepalive\n\n"
+                continue
+
+            # Drain what is already queued into one write
+            lines = [line]
+            while not subscriber.queue.empty() and len(lines) < 100:
+                lines.append(subscriber.queue.get_nowait())
+            chunk = []
+            for line in lines:
+                if line:
+                    chunk += (b"data: ", line, b"\n\n")
+            if subscriber.dropped:
+                chunk.append(b"event: dropped\ndata: " + dumps({"dropped": subscriber.dropped}) + b"\n\n")
+                subscriber.dropped = 0
+            if subscriber.error:
+                chunk.append(b"event: error\ndata: " + dumps({"detail": subscriber.error}) + b"\n\n")
+            if chunk:
+                yield b"".join(chunk)
+            if subscriber.error:
+                return
+    finally:
+        log_bus.unsubscribe(subscriber)
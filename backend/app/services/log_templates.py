@@ -0,0 +1,227 @@
+"""
+Online log template mining.
+
+Implements the Drain algorithm (He et al., ICWS 2017): messages are routed
+through a fixed-depth parse tree keyed by token count and leading tokens, and
+joined to the most similar template in the leaf, turning differing positions
+into ``<*>`` parameter slots.
+
+Messages are tokenized with ``str.split(" ")`` so ``render(template, params)``
+reproduces them byte for byte. Templates are immutable once persisted: when a
+cluster generalizes it gets a new ``log_templates`` row, so stored params
+always line up with the template they were extracted with.
+"""
+
+import hashlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Integer, case, cast, func, literal, literal_column, select, true
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import after_commit
+from app.models import LogEntry, LogTemplate
+
+WILDCARD = "<*>"
+
+
+def tokenize(message: str) -> List[str]:
+    return message.split(" ")
+
+
+def render(template: str, params: Sequence[str]) -> str:
+    """Rebuild the original message from a template and its parameters."""
+    values = iter(params or ())
+    return " ".join(next(values, "") if token == WILDCARD else token for token in tokenize(template))
+
+
+def rendered_message():
+    """SQL for a ``logs`` row's message: stored as is, or ``render``-ed from its template and params."""
+    tokens = (
+        func.unnest(func.string_to_array(LogTemplate.template, " "))
+        .table_valued("token", with_ordinality="position")
+        .render_derived()
+    )
+    slots = (
+        select(
+            tokens.c.token,
+            tokens.c.position,
+            (func.count().filter(tokens.c.token == WILDCARD).over(order_by=tokens.c.position) - 1).label("slot"),
+        )
+        .select_from(LogTemplate)
+        .join(tokens, true())
+        .where(LogTemplate.id == LogEntry.template_id)
+        .correlate(LogEntry)
+        .subquery()
+    )
+    token = case(
+        (slots.c.token == WILDCARD, func.coalesce(LogEntry.params.op("->>")(cast(slots.c.slot, Integer)), "")),
+        else_=slots.c.token,
+    )
+    rendered = select(
+        func.coalesce(func.string_agg(token, aggregate_order_by(literal(" "), slots.c.position)), "")
+    ).scalar_subquery()
+    return func.coalesce(LogEntry.message, rendered)
+
+
+def template_hash(template: str) -> str:
+    return hashlib.sha1(template.encode("utf-8")).hexdigest()
+
+
+def _is_variable(token: str) -> bool:
+    return token == WILDCARD or any(c.isdigit() for c in token)
+
+
+class Cluster:
+    __slots__ = ("tokens",)
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+
+class TemplateMiner:
+    """Drain parse tree. Pure CPU, no I/O."""
+
+    def __init__(
+        self,
+        similarity: float = settings.LOG_TEMPLATE_SIMILARITY,
+        depth: int = settings.LOG_TEMPLATE_DEPTH,
+        max_children: int = settings.LOG_TEMPLATE_MAX_CHILDREN,
+    ):
+        self.similarity = similarity
+        self.prefix_depth = max(1, depth - 2)
+        self.max_children = max_children
+        self.root: Dict = {}
+
+    def _leaf(self, tokens: List[str]) -> List[Cluster]:
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[: self.prefix_depth]:
+            key = WILDCARD if _is_variable(token) else token
+            if key not in node:
+                if len(node) >= self.max_children:
+                    key = WILDCARD
+                node = node.setdefault(key, {})
+            else:
+                node = node[key]
+        return node.setdefault(None, [])
+
+    def _best_match(self, clusters: List[Cluster], tokens: List[str]) -> Optional[Cluster]:
+        best, best_score = None, (-1.0, -1)
+        for cluster in clusters:
+            same = wildcards = 0
+            for template_token, token in zip(cluster.tokens, tokens):
+                if template_token == WILDCARD:
+                    wildcards += 1
+                elif template_token == token:
+                    same += 1
+            score = ((same + wildcards) / len(tokens), wildcards)
+            if score > best_score:
+                best, best_score = cluster, score
+        if best is not None and best_score[0] >= self.similarity:
+            return best
+        return None
+
+    def add(self, message: str) -> Tuple[Cluster, List[str]]:
+        """Assign a message to a cluster, generalizing it if needed.
+
+        Returns the cluster and the message's parameters for the cluster's
+        (possibly updated) template.
+        """
+        tokens = tokenize(message)
+        leaf = self._leaf(tokens)
+        cluster = self._best_match(leaf, tokens)
+        if cluster is None:
+            cluster = Cluster([WILDCARD if _is_variable(t) else t for t in tokens])
+            leaf.append(cluster)
+        else:
+            cluster.tokens = [a if a == b else WILDCARD for a, b in zip(cluster.tokens, tokens)]
+        params = [token for slot, token in zip(cluster.tokens, tokens) if slot == WILDCARD]
+        return cluster, params
+
+
+class TemplateStore:
+    """Process-local miner plus a cache of the ``log_templates`` dictionary."""
+
+    def __init__(self):
+        self.miner = TemplateMiner()
+        self.templates: Dict[int, str] = {}
+        self.ids: Dict[str, int] = {}
+        self._loaded = False
+
+    def _remember(self, template_id: int, template: str):
+        self.templates[template_id] = template
+        self.ids[template] = template_id
+
+    async def load(self, db: AsyncSession):
+        """Warm the cache and parse tree from templates mined by other workers."""
+        result = await db.execute(select(LogTemplate.id, LogTemplate.template).order_by(LogTemplate.id))
+        for template_id, template in result.all():
+            self._remember(template_id, template)
+            self.miner.add(template)
+        self._loaded = True
+
+    async def mine(self, db: AsyncSession, messages: Iterable[str]) -> Tuple[List[Tuple[int, List[str]]], int]:
+        """Return (template_id, params) for each message, and how many templates the batch created.
+
+        Costs one INSERT ... ON CONFLICT round trip for batches that produce
+        new templates and none otherwise. New ids are cached only once ``db``
+        commits: a rolled-back batch must not leave ids that were never
+        written.
+        """
+        if not self._loaded:
+            await self.load(db)
+
+        # Params line up with the template current when the message was mined,
+        # even if the cluster generalizes again later in the batch.
+        mined = []
+        for message in messages:
+            cluster, params = self.miner.add(message)
+            mined.append((cluster.template, params))
+
+        written: Dict[str, int] = {}
+        created = 0
+        missing = {template for template, _ in mined if template not in self.ids}
+        if missing:
+            statement = insert(LogTemplate).values([
+                {
+                    "template": template,
+                    "template_hash": template_hash(template),
+                    "token_count": len(tokenize(template)),
+                }
+                for template in missing
+            ])
+            statement = statement.on_conflict_do_update(
+                index_elements=[LogTemplate.template_hash],
+                set_={"template_hash": statement.excluded.template_hash},
+            ).returning(LogTemplate.id, LogTemplate.template, literal_column("xmax = 0").label("inserted"))
+            result = (await db.execute(statement)).all()
+            written = {template: template_id for template_id, template, _ in result}
+            created = sum(1 for *_, inserted in result if inserted)
+
+            def remember():
+                for template, template_id in written.items():
+                    self._remember(template_id, template)
+
+            after_commit(db, remember)
+
+        return [(written.get(template) or self.ids[template], params) for template, params in mined], created
+
+    async def get_templates(self, db: AsyncSession, template_ids: Iterable[int]) -> Dict[int, str]:
+        """Template text by id, reading only ids this process has not seen."""
+        wanted = set(template_ids)
+        unknown = [template_id for template_id in wanted if template_id not in self.templates]
+        if unknown:
+            result = await db.execute(
+                select(LogTemplate.id, LogTemplate.template).where(LogTemplate.id.in_(unknown))
+            )
+            for template_id, template in result.all():
+                self._remember(template_id, template)
+        return {template_id: self.templates[template_id] for template_id in wanted if template_id in self.templates}
+
+
+template_store = TemplateStore()
@@ -0,0 +1,440 @@
+"""
+Vectorized evaluation of metric queries.
+
+Series are packed into a ``SeriesSet``: every sample of every series in one
+contiguous int64/float64 array pair, with ``offsets`` marking where each series
+starts (CSR layout). Range functions are evaluated for all series and all
+steps at once: samples are bucketed by step boundary with one ``bincount``,
+whose running totals give the [lo, hi) sample bounds of every (series, step)
+window, and sums/increases come from gathers at those bounds. The cost is a
+handful of array passes regardless of how many series are involved.
+
+Results are ``Matrix`` objects, one row per series and one column per step,
+with NaN where a series has no value. Aggregations across series group rows by
+label values and reduce them with ``ufunc.reduceat``.
+
+Semantics follow Prometheus: ``rate`` and ``increase`` handle counter resets
+and extrapolate to the window boundaries, and windows are left-open
+``(t - range, t]``.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+from app.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# Upper bound on padded elements materialized at once by window reductions
+WINDOW_BLOCK_ELEMENTS = 4_000_000
+
+
+@dataclass
+class SeriesSet:
+    labels: List[Dict[str, str]]
+    timestamps: "np.ndarray"  # int64 ms, ascending within each series
+    values: "np.ndarray"  # float64
+    offsets: "np.ndarray"  # int64, len(labels) + 1
+
+    @classmethod
+    def from_arrays(cls, labels: List[Dict[str, str]], arrays: Sequence[tuple]) -> "SeriesSet":
+        """Pack per-series (timestamps, values) arrays."""
+        lengths = np.array([len(ts) for ts, _ in arrays], dtype=np.int64)
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if arrays:
+            timestamps = np.concatenate([np.asarray(ts, dtype=np.int64) for ts, _ in arrays])
+            values = np.concatenate([np.asarray(vs, dtype=np.float64) for _, vs in arrays])
+        else:
+            timestamps, values = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return cls(labels, timestamps, values, offsets)
+
+    @classmethod
+    def from_series(cls, series: Sequence) -> "SeriesSet":
+        """Pack ``metric_store.Series`` objects, exposing origin ids as labels."""
+        return cls.from_arrays([series_labels(s) for s in series], [(s.timestamps, s.values) for s in series])
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+
+def series_labels(series) -> Dict[str, str]:
+    """Labels of a stored series as the engine reports them."""
+    labels = {"__name__": series.name, **(series.labels or {})}
+    if series.platform_id:
+        labels["platform_id"] = str(series.platform_id)
+    if series.service_id:
+        labels["service_id"] = str(series.service_id)
+    return labels
+
+
+@dataclass
+class Matrix:
+    labels: List[Dict[str, str]]
+    steps: "np.ndarray"  # int64 ms
+    values: "np.ndarray"  # float64, shape (len(labels), len(steps)); NaN = no value
+
+    def drop_empty(self) -> "Matrix":
+        keep = ~np.all(np.isnan(self.values), axis=1)
+        return Matrix([l for l, k in zip(self.labels, keep) if k], self.steps, self.values[keep])
+
+    def to_dicts(self) -> List[dict]:
+        """Serializable ``[{labels, timestamps, values}]``, skipping NaN points."""
+        result = []
+        for labels, row in zip(self.labels, self.values):
+            present = ~np.isnan(row)
+            if present.any():
+                result.append({
+                    "labels": labels,
+                    "timestamps": self.steps[present],
+                    "values": row[present],
+                })
+        return result
+
+
+def step_times(start_ms: int, end_ms: int, step_ms: int) -> "np.ndarray":
+    return np.arange(start_ms, end_ms + 1, step_ms, dtype=np.int64)
+
+
+class _Windows:
+    """Sample index bounds [lo, hi) of every (series, step) window."""
+
+    def __init__(self, series: SeriesSet, steps: "np.ndarray", range_ms: int):
+        n, m = len(series), len(steps)
+        self.shape = (n, m)
+        self.steps = steps
+        self.range_ms = range_ms
+
+        step_ms = int(steps[1] - steps[0]) if m > 1 else range_ms
+        if range_ms % step_ms == 0:
+            # Window starts are earlier step boundaries: one pass yields both bounds
+            shift = range_ms // step_ms
+            bounds = self._cumulative(series, int(steps[0]) - range_ms, step_ms, m + shift)
+            self.lo, self.hi = bounds[:, :m], bounds[:, shift:]
+        else:
+            self.lo = self._cumulative(series, int(steps[0]) - range_ms, step_ms, m)
+            self.hi = self._cumulative(series, int(steps[0]), step_ms, m)
+        self.count = self.hi - self.lo
+
+    @staticmethod
+    def _cumulative(series: SeriesSet, origin: int, step_ms: int, columns: int) -> "np.ndarray":
+        """Index one past the last sample at or before ``origin + j * step_ms``, per series."""
+        n = len(series)
+        width = columns + 1  # trailing bucket collects samples after the last boundary
+        bucket = series.timestamps.astype(np.float64)
+        bucket -= origin
+        bucket /= step_ms
+        np.ceil(bucket, out=bucket)
+        np.clip(bucket, 0, columns, out=bucket)
+        bucket += np.repeat(np.arange(n, dtype=np.float64) * width, np.diff(series.offsets))
+        counts = np.bincount(bucket.astype(np.int64), minlength=n * width).reshape(n, width)[:, :columns]
+        bounds = np.cumsum(counts, axis=1)
+        bounds += series.offsets[:-1, None]
+        return bounds
+
+
+def _prefix(values: "np.ndarray") -> "np.ndarray":
+    prefix = np.zeros(values.size + 1, dtype=np.float64)
+    np.cumsum(values, out=prefix[1:])
+    return prefix
+
+
+def _add_counter_resets(series: SeriesSet, delta: "np.ndarray", first: "np.ndarray", last: "np.ndarray"):
+    """Add the value lost to counter resets inside each window to its delta.
+
+    Resets are rare, so only the rows of series that have one are touched.
+    """
+    values = series.values
+    resets = np.flatnonzero(values[1:] < values[:-1]) + 1
+    resets = resets[~np.isin(resets, series.offsets)]  # a new series is not a reset
+    if not resets.size:
+        return
+    lost = np.zeros(resets.size + 1, dtype=np.float64)
+    np.cumsum(values[resets - 1], out=lost[1:])
+    rows = np.unique(np.searchsorted(series.offsets, resets, side="right") - 1)
+    delta[rows] += (
+        lost[np.searchsorted(resets, last[rows], side="right")]
+        - lost[np.searchsorted(resets, first[rows], side="right")]
+    )
+
+
+def _extrapolated_delta(series: SeriesSet, windows: _Windows, is_counter: bool, is_rate: bool) -> "np.ndarray":
+    """Prometheus ``extrapolatedRate``, computed for every window at once (in place where possible)."""
+    ok = windows.count >= 2
+    if not ok.any():
+        return np.full(windows.shape, np.nan)
+    # Empty windows may point one past the end; they are masked out below
+    first = windows.lo
+    last = windows.hi - 1
+
+    first_values = np.take(series.values, first, mode="clip")
+    delta = np.take(series.values, last, mode="clip")
+    delta -= first_values
+    if is_counter:
+        _add_counter_resets(series, delta, first, last)
+
+    # Durations in milliseconds; only their ratios matter until the final rate
+    first_ts = np.take(series.timestamps, first, mode="clip").astype(np.float64)
+    last_ts = np.take(series.timestamps, last, mode="clip").astype(np.float64)
+    steps = windows.steps[None, :].astype(np.float64)
+    sampled = last_ts - first_ts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        half_gap = sampled / (2 * (windows.count - 1))
+        to_start = first_ts
+        to_start -= steps - windows.range_ms
+        to_end = last_ts
+        np.subtract(steps, last_ts, out=to_end)
+        if is_counter:
+            to_zero = first_values / delta
+            to_zero *= sampled
+            to_zero[(delta <= 0) | (first_values < 0)] = np.inf
+            np.fmin(to_start, to_zero, out=to_start)
+        threshold = half_gap * 2.2  # 1.1 x the average gap between samples
+        interval = np.where(to_start < threshold, to_start, half_gap)
+        interval += np.where(to_end < threshold, to_end, half_gap)
+        interval += sampled
+        interval /= sampled
+        delta *= interval
+        if is_rate:
+            delta /= windows.range_ms / 1000.0
+    delta[~ok] = np.nan
+    return delta
+
+
+def _window_reduce(series: SeriesSet, windows: _Windows, reducer: Callable) -> "np.ndarray":
+    """Apply ``reducer(padded, axis=1)`` to every window, NaN-padded in blocks."""
+    lo, count = windows.lo.ravel(), windows.count.ravel()
+    out = np.full(lo.size, np.nan)
+    width = int(count.max()) if count.size else 0
+    if width == 0:
+        return out.reshape(windows.shape)
+    padded_values = np.append(series.values, np.nan)
+    pad_index = series.values.size
+    block = max(1, WINDOW_BLOCK_ELEMENTS // width)
+    columns = np.arange(width, dtype=np.int64)[None, :]
+    for start in range(0, lo.size, block):
+        stop = min(start + block, lo.size)
+        index = lo[start:stop, None] + columns
+        index = np.where(columns < count[start:stop, None], index, pad_index)
+        present = count[start:stop] > 0
+        if present.any():
+            out[start:stop][present] = reducer(padded_values[index[present]], axis=1)
+    return out.reshape(windows.shape)
+
+
+def _range_sum(series: SeriesSet, windows: _Windows) -> "np.ndarray":
+    prefix = _prefix(series.values)
+    return prefix[windows.hi] - prefix[windows.lo]
+
+
+def rate(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    return Matrix(series.labels, steps, _extrapolated_delta(series, windows, is_counter=True, is_rate=True))
+
+
+def increase(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    return Matrix(series.labels, steps, _extrapolated_delta(series, windows, is_counter=True, is_rate=False))
+
+
+def delta(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    return Matrix(series.labels, steps, _extrapolated_delta(series, windows, is_counter=False, is_rate=False))
+
+
+def sum_over_time(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    values = np.where(windows.count > 0, _range_sum(series, windows), np.nan)
+    return Matrix(series.labels, steps, values)
+
+
+def count_over_time(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    values = np.where(windows.count > 0, windows.count.astype(np.float64), np.nan)
+    return Matrix(series.labels, steps, values)
+
+
+def avg_over_time(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = _range_sum(series, windows) / windows.count
+    return Matrix(series.labels, steps, values)
+
+
+def min_over_time(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    return Matrix(series.labels, steps, _window_reduce(series, windows, np.nanmin))
+
+
+def max_over_time(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    return Matrix(series.labels, steps, _window_reduce(series, windows, np.nanmax))
+
+
+def quantile_over_time(series: SeriesSet, steps, range_ms: int, q: float) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    reducer = lambda padded, axis: np.nanquantile(padded, q, axis=axis)
+    return Matrix(series.labels, steps, _window_reduce(series, windows, reducer))
+
+
+def last_over_time(series: SeriesSet, steps, range_ms: int) -> Matrix:
+    windows = _Windows(series, steps, range_ms)
+    if not series.values.size:
+        return Matrix(series.labels, steps, np.full(windows.shape, np.nan))
+    values = np.take(series.values, windows.hi - 1, mode="clip")
+    return Matrix(series.labels, steps, np.where(windows.count > 0, values, np.nan))
+
+
+RANGE_FUNCTIONS: Dict[str, Callable] = {
+    "rate": rate,
+    "increase": increase,
+    "delta": delta,
+    "sum_over_time": sum_over_time,
+    "count_over_time": count_over_time,
+    "avg_over_time": avg_over_time,
+    "min_over_time": min_over_time,
+    "max_over_time": max_over_time,
+    "last_over_time": last_over_time,
+}
+
+
+def instant(series: SeriesSet, steps, lookback_ms: int) -> Matrix:
+    """Latest sample at or before each step, within the lookback window."""
+    return last_over_time(series, steps, lookback_ms)
+
+
+def _group_keys(labels: List[Dict[str, str]], by: Optional[Sequence[str]], without: Optional[Sequence[str]]):
+    keys, group_labels = [], {}
+    if by is not None:
+        by = list(by)
+        for series_labels in labels:
+            key = tuple(series_labels.get(name) for name in by)
+            keys.append(key)
+            if key not in group_labels:
+                group_labels[key] = {name: value for name, value in zip(by, key) if value is not None}
+        return keys, group_labels
+
+    dropped = set(without or ()) | {"__name__"}
+    for series_labels in labels:
+        kept = {name: value for name, value in series_labels.items() if name not in dropped}
+        key = tuple(sorted(kept.items()))
+        keys.append(key)
+        group_labels.setdefault(key, kept)
+    return keys, group_labels
+
+
+def _column_quantile(block: "np.ndarray", counts: "np.ndarray", q: float) -> "np.ndarray":
+    """Linearly interpolated quantile of each column, ignoring NaN.
+
+    Sorting moves NaN to the end of each column, so the rank only has to be
+    taken over each column's present values. Much faster than ``nanquantile``
+    for the short, wide blocks produced by grouping.
+    """
+    ordered = np.sort(block, axis=0)
+    rank = np.clip(q, 0.0, 1.0) * np.maximum(counts - 1, 0)
+    below = np.floor(rank).astype(np.int64)
+    above = np.minimum(below + 1, np.maximum(counts - 1, 0))
+    columns = np.arange(block.shape[1])
+    low, high = ordered[below, columns], ordered[above, columns]
+    return low + (high - low) * (rank - below)
+
+
+def aggregate(
+    matrix: Matrix,
+    op: str,
+    by: Optional[Sequence[str]] = None,
+    without: Optional[Sequence[str]] = None,
+    param: Optional[float] = None,
+) -> Matrix:
+    """Reduce rows sharing the same grouping labels (``sum by (...)`` etc.)."""
+    if not matrix.labels:
+        return Matrix([], matrix.steps, np.empty((0, matrix.steps.size)))
+
+    keys, group_labels = _group_keys(matrix.labels, by, without)
+    unique = list(group_labels)
+    code = {key: i for i, key in enumerate(unique)}
+    inverse = np.fromiter((code[key] for key in keys), dtype=np.int64, count=len(keys))
+    order = np.argsort(inverse, kind="stable")
+    starts = np.searchsorted(inverse[order], np.arange(len(unique)))
+    rows = matrix.values[order]
+    present = ~np.isnan(rows)
+    counts = np.add.reduceat(present.astype(np.int64), starts, axis=0)
+
+    if op in ("sum", "avg"):
+        totals = np.add.reduceat(np.where(present, rows, 0.0), starts, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = totals if op == "sum" else totals / counts
+    elif op == "count":
+        values = counts.astype(np.float64)
+    elif op == "min":
+        values = np.fmin.reduceat(rows, starts, axis=0)
+    elif op == "max":
+        values = np.fmax.reduceat(rows, starts, axis=0)
+    elif op == "quantile":
+        bounds = np.append(starts, len(rows))
+        values = np.empty((len(unique), matrix.steps.size))
+        for group, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            values[group] = _column_quantile(rows[lo:hi], counts[group], param)
+    else:
+        raise ValueError(f"Unsupported aggregation: {op}")
+
+    values = np.where(counts > 0, values, np.nan)
+    return Matrix([group_labels[key] for key in unique], matrix.steps, values)
+
+
+AGGREGATIONS = ("sum", "avg", "count", "min", "max", "quantile")
+
+
+def histogram_quantile(q: float, bounds: "np.ndarray", counts: "np.ndarray") -> "np.ndarray":
+    """Estimate the q-quantile of each row of per-bucket counts.
+
+    ``bounds`` are the finite upper bounds shared by every row and ``counts``
+    has one extra trailing column for the +Inf bucket. Like Prometheus, values
+    are interpolated linearly inside the bucket holding the rank, the first
+    bucket starts at 0 (or at its bound, if negative), and ranks landing in the
+    +Inf bucket return the largest finite bound. Rows without observations
+    yield NaN.
+    """
+    counts = np.atleast_2d(np.asarray(counts, dtype=np.float64))
+    bounds = np.asarray(bounds, dtype=np.float64)
+    cumulative = np.cumsum(counts, axis=1)
+    total = cumulative[:, -1]
+    if q < 0:
+        return np.where(total > 0, -np.inf, np.nan)
+    if q > 1:
+        return np.where(total > 0, np.inf, np.nan)
+
+    rank = q * total
+    bucket = np.minimum((cumulative < rank[:, None]).sum(axis=1), counts.shape[1] - 1)
+    rows = np.arange(counts.shape[0])
+    in_inf = bucket >= bounds.size
+    finite = np.minimum(bucket, bounds.size - 1)
+
+    upper = bounds[finite]
+    lower = np.where(finite > 0, bounds[np.maximum(finite - 1, 0)], np.minimum(bounds[0], 0.0))
+    below = np.where(bucket > 0, cumulative[rows, np.maximum(bucket - 1, 0)], 0.0)
+    in_bucket = counts[rows, bucket]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(in_bucket > 0, (rank - below) / in_bucket, 0.0)
+    value = lower + (upper - lower) * fraction
+    value = np.where(in_inf, bounds[-1], value)
+    return np.where(total > 0, value, np.nan)
+
+
+def rebucket(bounds: "np.ndarray", counts: "np.ndarray", target: "np.ndarray") -> "np.ndarray":
+    """Redistribute per-bucket counts onto other bounds, interpolating linearly inside buckets.
+
+    Used to add histograms whose layouts differ; ``target`` should be a superset
+    of ``bounds`` (e.g. their union) to keep the estimate exact at every bound.
+    """
+    counts = np.atleast_2d(np.asarray(counts, dtype=np.float64))
+    bounds = np.asarray(bounds, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    cumulative = np.cumsum(counts[:, :-1], axis=1)
+    xs = np.concatenate(([min(bounds[0], 0.0)], bounds))
+    result = np.empty((counts.shape[0], target.size + 1))
+    for row in range(counts.shape[0]):
+        at_target = np.interp(target, xs, np.concatenate(([0.0], cumulative[row])))
+        result[row, :-1] = np.diff(at_target, prepend=0.0)
+        result[row, -1] = counts[row].sum() - at_target[-1]
+    return result
@@ -0,0 +1,143 @@
+"""
+Series loading for metric queries.
+
+Reads raw samples from ``metrics`` (hot tier) and Gorilla chunks from
+``metric_chunks`` (cold tier) and returns each series as a pair of contiguous
+NumPy arrays, ready for vectorized evaluation.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from hashlib import sha1
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from uuid import UUID
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.lazy import lazy_import
+from app.models import Metric, MetricChunk
+from app.services import gorilla
+
+np = lazy_import("numpy")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_millis(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def canonical_labels(labels: Optional[dict]) -> str:
+    return orjson.dumps(labels or {}, option=orjson.OPT_SORT_KEYS).decode()
+
+
+def series_hash(name: str, platform_id: Optional[UUID], service_id: Optional[UUID], labels: Optional[dict]) -> str:
+    """Stable identity of a series across the hot and cold tiers."""
+    key = f"{name}|{platform_id or ''}|{service_id or ''}|{canonical_labels(labels)}"
+    return sha1(key.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Series:
+    name: str
+    metric_type: str
+    platform_id: Optional[UUID]
+    service_id: Optional[UUID]
+    labels: Dict[str, str]
+    timestamps: "np.ndarray"  # int64 milliseconds, ascending
+    values: "np.ndarray"  # float64
+
+
+def apply_filters(query, model, platform_id, service_id, labels):
+    """Restrict a query on a series table; a label given several values matches any of them."""
+    if platform_id:
+        query = query.where(model.platform_id == platform_id)
+    if service_id:
+        query = query.where(model.service_id == service_id)
+    for key, value in (labels or {}).items():
+        if isinstance(value, str):
+            query = query.where(model.labels[key].as_string() == value)
+        else:
+            query = query.where(model.labels[key].as_string().in_(value))
+    return query
+
+
+async def load_series(
+    db: AsyncSession,
+    name: str,
+    start: datetime,
+    end: datetime,
+    platform_id: Optional[UUID] = None,
+    service_id: Optional[UUID] = None,
+    labels: Optional[Dict[str, Union[str, Sequence[str]]]] = None,
+) -> List[Series]:
+    """Load every series of a metric with samples in [start, end)."""
+    start_ms, end_ms = to_millis(start), to_millis(end)
+    parts: Dict[Tuple, dict] = {}
+
+    def entry(platform, service, series_labels, metric_type):
+        key = (platform, service, canonical_labels(series_labels))
+        if key not in parts:
+            parts[key] = {
+                "meta": (metric_type, platform, service, series_labels or {}),
+                "timestamps": [],
+                "values": [],
+                "arrays": [],
+            }
+        return parts[key]
+
+    # Cold tier: decode chunks straight into arrays
+    cold = select(
+        MetricChunk.platform_id,
+        MetricChunk.service_id,
+        MetricChunk.labels,
+        MetricChunk.metric_type,
+        MetricChunk.sample_count,
+        MetricChunk.data,
+    ).where(
+        MetricChunk.name == name,
+        MetricChunk.start_time < end,
+        MetricChunk.end_time >= start,
+    )
+    cold = apply_filters(cold, MetricChunk, platform_id, service_id, labels)
+    for platform, service, series_labels, metric_type, count, data in (await db.execute(cold)).all():
+        timestamps, values = gorilla.decode(data, count)
+        mask = (timestamps >= start_ms) & (timestamps < end_ms)
+        entry(platform, service, series_labels, metric_type)["arrays"].append((timestamps[mask], values[mask]))
+
+    # Hot tier: raw rows
+    hot = select(
+        Metric.platform_id,
+        Metric.service_id,
+        Metric.labels,
+        Metric.metric_type,
+        Metric.timestamp,
+        Metric.value,
+    ).where(
+        Metric.name == name,
+        Metric.timestamp >= start,
+        Metric.timestamp < end,
+    )
+    hot = apply_filters(hot, Metric, platform_id, service_id, labels)
+    for platform, service, series_labels, metric_type, timestamp, value in (await db.execute(hot)).all():
+        series = entry(platform, service, series_labels, metric_type)
+        series["timestamps"].append(to_millis(timestamp))
+        series["values"].append(value)
+
+    result = []
+    for series in parts.values():
+        arrays = list(series["arrays"])
+        if series["timestamps"]:
+            arrays.append((np.array(series["timestamps"], dtype=np.int64), np.array(series["values"], dtype=np.float64)))
+        timestamps = np.concatenate([a for a, _ in arrays])
+        values = np.concatenate([v for _, v in arrays])
+        if len(arrays) > 1 or not np.all(timestamps[1:] >= timestamps[:-1]):
+            order = np.argsort(timestamps, kind="stable")
+            timestamps, values = timestamps[order], values[order]
+        metric_type, platform, service, series_labels = series["meta"]
+        result.append(Series(name, metric_type, platform, service, series_labels, timestamps, values))
+    return result
@@ -0,0 +1,430 @@
+"""
+Parser for the PromQL subset shared by alert rules, SLOs and dashboards.
+
+Supported:
+
+- selectors with ``=``, ``!=``, ``=~`` and ``!~`` label matchers, and range
+  vectors (``http_requests_total{code=~"5.."}[5m]``);
+- range functions (``rate``, ``increase``, ``delta``, ``*_over_time``,
+  ``quantile_over_time``), ``histogram_quantile`` and a few elementwise
+  functions (``abs``, ``clamp_min``, ``time()``, ...);
+- ``sum``, ``avg``, ``count``, ``min``, ``max`` and ``quantile`` with
+  ``by``/``without``;
+- arithmetic (``+ - * / % ^``), comparisons with optional ``bool``, and
+  ``and``/``or``/``unless``, with ``on``/``ignoring`` one-to-one matching.
+
+Not supported: ``offset``, ``@``, subqueries, ``group_left``/``group_right``
+and string values. ``parse`` returns an immutable tree of the node classes
+below and raises ``QueryError`` (a ValueError) with the offending position.
+Operands are type checked while parsing, so a tree that parses can be
+evaluated.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+Matcher = Tuple[str, str, str]  # label, operator, value
+
+
+class QueryError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Number:
+    value: float
+
+
+@dataclass(frozen=True)
+class Selector:
+    name: str
+    matchers: Tuple[Matcher, ...]
+    range_ms: Optional[int] = None  # set for range vectors
+
+
+@dataclass(frozen=True)
+class Call:
+    function: str
+    args: tuple
+
+
+@dataclass(frozen=True)
+class Aggregate:
+    op: str
+    expr: object
+    by: Optional[Tuple[str, ...]] = None
+    without: Optional[Tuple[str, ...]] = None
+    param: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class Binary:
+    op: str
+    lhs: object
+    rhs: object
+    bool: bool = False
+    on: Optional[Tuple[str, ...]] = None
+    ignoring: Optional[Tuple[str, ...]] = None
+
+
+@dataclass(frozen=True)
+class Negate:
+    expr: object
+
+
+RANGE_FUNCTIONS = frozenset({
+    "rate", "increase", "delta", "sum_over_time", "count_over_time", "avg_over_time",
+    "min_over_time", "max_over_time", "last_over_time", "quantile_over_time",
+})
+
+# Elementwise functions of one instant vector
+MATH_FUNCTIONS = frozenset({"abs", "ceil", "floor", "sqrt", "exp", "ln", "log2", "log10"})
+
+# Functions with their argument types; "matrix" is a range vector
+FUNCTIONS = {
+    **{name: ("matrix",) for name in RANGE_FUNCTIONS},
+    **{name: ("vector",) for name in MATH_FUNCTIONS},
+    "quantile_over_time": ("scalar", "matrix"),
+    "histogram_quantile": ("scalar", "vector"),
+    "clamp_min": ("vector", "scalar"),
+    "clamp_max": ("vector", "scalar"),
+    "scalar": ("vector",),
+    "vector": ("scalar",),
+    "time": (),
+}
+
+AGGREGATIONS = frozenset({"sum", "avg", "count", "min", "max", "quantile"})
+
+COMPARISONS = frozenset({"==", "!=", ">", "<", ">=", "<="})
+SET_OPERATORS = frozenset({"and", "or", "unless"})
+
+# Binding power of binary operators; ^ is right-associative
+PRECEDENCE = {
+    "or": 1,
+    "and": 2, "unless": 2,
+    "==": 3, "!=": 3, ">": 3, "<": 3, ">=": 3, "<=": 3,
+    "+": 4, "-": 4,
+    "*": 5, "/": 5, "%": 5,
+    "^": 6,
+}
+
+_UNITS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000, "y": 31_536_000_000}
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+|\#[^\n]*)
+  | (?P<duration>(?:\d+(?:ms|[smhdwy]))+(?![\w.]))
+  | (?P<number>0x[0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`[^`]*`)
+  | (?P<ident>[a-zA-Z_:][a-zA-Z0-9_:]*)
+  | (?P<op>==|!=|<=|>=|=~|!~|[-+*/%^=<>(){}\[\],:@])
+""", re.VERBOSE)
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "\\": "\\", '"': '"', "'": "'"}
+
+# Most tokens accepted in one expression
+MAX_TOKENS = 2000
+
+
+def _unquote(text: str) -> str:
+    if text[0] == "`":
+        return text[1:-1]
+    return re.sub(r"\\(.)", lambda m: _ESCAPES.get(m.group(1), m.group(1)), text[1:-1])
+
+
+def _duration(text: str) -> int:
+    return sum(int(amount) * _UNITS[unit] for amount, unit in re.findall(r"(\d+)(ms|[smhdwy])", text))
+
+
+def _tokenize(text: str) -> List[Tuple[str, str, int]]:
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise QueryError(f"Unexpected character {text[position]!r} at position {position}")
+        kind = match.lastgroup
+        if kind != "space":
+            tokens.append((kind, match.group(), position))
+        position = match.end()
+        if len(tokens) > MAX_TOKENS:
+            raise QueryError(f"Expression longer than {MAX_TOKENS} tokens")
+    tokens.append(("end", "", len(text)))
+    return tokens
+
+
+def value_type(node) -> str:
+    """``scalar``, ``vector`` (instant vector) or ``matrix`` (range vector)."""
+    if isinstance(node, Number):
+        return "scalar"
+    if isinstance(node, Selector):
+        return "matrix" if node.range_ms is not None else "vector"
+    if isinstance(node, Call):
+        return "scalar" if node.function in ("scalar", "time") else "vector"
+    if isinstance(node, Negate):
+        return value_type(node.expr)
+    if isinstance(node, Binary):
+        if value_type(node.lhs) == "scalar" and value_type(node.rhs) == "scalar":
+            return "scalar"
+        return "vector"
+    return "vector"
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.index = 0
+
+    @property
+    def token(self):
+        return self.tokens[self.index]
+
+    def error(self, message: str, token=None):
+        kind, value, position = token or self.token
+        found = "end of input" if kind == "end" else repr(value)
+        return QueryError(f"{message} at position {position}, found {found}")
+
+    def next(self):
+        token = self.token
+        self.index += 1
+        return token
+
+    def accept(self, value: str) -> bool:
+        kind, text, _ = self.token
+        if kind in ("op", "ident") and text == value:
+            self.index += 1
+            return True
+        return False
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise self.error(f"Expected {value!r}")
+
+    def parse(self):
+        node = self.expression(0)
+        if self.token[0] != "end":
+            raise self.error("Unexpected token")
+        if value_type(node) == "matrix":
+            raise QueryError("A range vector must be wrapped in a range function")
+        return node
+
+    def expression(self, min_precedence: int):
+        lhs = self.unary()
+        while True:
+            kind, op, _ = self.token
+            if kind not in ("op", "ident") or op not in PRECEDENCE or PRECEDENCE[op] < min_precedence:
+                return lhs
+            operator_token = self.next()
+            returns_bool = self.accept("bool")
+            on = ignoring = None
+            if self.accept("on"):
+                on = self.label_list()
+            elif self.accept("ignoring"):
+                ignoring = self.label_list()
+            if self.token[1] in ("group_left", "group_right"):
+                raise self.error("Many-to-one matching is not supported")
+            precedence = PRECEDENCE[op]
+            rhs = self.expression(precedence if op == "^" else precedence + 1)
+            lhs = self.binary(operator_token, lhs, rhs, returns_bool, on, ignoring)
+
+    def binary(self, token, lhs, rhs, returns_bool, on, ignoring):
+        op = token[1]
+        types = (value_type(lhs), value_type(rhs))
+        if "matrix" in types:
+            raise self.error("Binary operators take instant vectors or scalars", token)
+        if returns_bool and op not in COMPARISONS:
+            raise self.error("bool is only allowed on comparisons", token)
+        if op in SET_OPERATORS and types != ("vector", "vector"):
+            raise self.error(f"{op} is only defined between instant vectors", token)
+        if op in COMPARISONS and types == ("scalar", "scalar") and not returns_bool:
+            raise self.error("Comparisons between scalars must use bool", token)
+        if (on is not None or ignoring is not None) and types != ("vector", "vector"):
+            raise self.error("Vector matching is only allowed between instant vectors", token)
+        if isinstance(lhs, Number) and isinstance(rhs, Number) and op not in COMPARISONS:
+            return Number(_fold(op, lhs.value, rhs.value))
+        return Binary(op, lhs, rhs, returns_bool, on, ignoring)
+
+    def unary(self):
+        if self.accept("-"):
+            node = self.expression(PRECEDENCE["^"])
+            return Number(-node.value) if isinstance(node, Number) else Negate(node)
+        if self.accept("+"):
+            return self.expression(PRECEDENCE["^"])
+        return self.primary()
+
+    def primary(self):
+        kind, text, _ = self.token
+        if kind == "number":
+            self.next()
+            return Number(float(int(text, 16)) if text.startswith("0x") else float(text))
+        if kind == "op" and text == "(":
+            self.next()
+            node = self.expression(0)
+            self.expect(")")
+            return self.range_suffix(node)
+        if kind == "op" and text == "{":
+            return self.range_suffix(self.selector(None))
+        if kind == "ident":
+            lowered = text.lower()
+            if lowered in ("inf", "nan"):
+                self.next()
+                return Number(float(lowered))
+            if text in AGGREGATIONS and self.tokens[self.index + 1][1] in ("(", "by", "without"):
+                return self.aggregate()
+            if self.tokens[self.index + 1][1] == "(":
+                return self.call()
+            self.next()
+            return self.range_suffix(self.selector(text))
+        raise self.error("Expected an expression")
+
+    def range_suffix(self, node):
+        if not self.accept("["):
+            return node
+        token = self.token
+        if token[0] != "duration":
+            raise self.error("Expected a duration such as 5m")
+        self.next()
+        if self.token[1] == ":":
+            raise self.error("Subqueries are not supported")
+        self.expect("]")
+        if not isinstance(node, Selector) or node.range_ms is not None:
+            raise self.error("Ranges can only follow a selector", token)
+        range_ms = _duration(token[1])
+        if range_ms <= 0:
+            raise self.error("Range must be positive", token)
+        return Selector(node.name, node.matchers, range_ms)
+
+    def selector(self, name: Optional[str]) -> Selector:
+        matchers = []
+        if self.accept("{"):
+            while not self.accept("}"):
+                label_token = self.next()
+                if label_token[0] != "ident":
+                    raise self.error("Expected a label name", label_token)
+                operator_token = self.next()
+                if operator_token[1] not in ("=", "!=", "=~", "!~"):
+                    raise self.error("Expected a label matcher operator", operator_token)
+                value_token = self.next()
+                if value_token[0] != "string":
+                    raise self.error("Expected a quoted label value", value_token)
+                value = _unquote(value_token[1])
+                if operator_token[1] in ("=~", "!~"):
+                    try:
+                        re.compile(value)
+                    except re.error as e:
+                        raise self.error(f"Invalid regex ({e.msg})", value_token)
+                matchers.append((label_token[1], operator_token[1], value))
+                if not self.accept(","):
+                    self.expect("}")
+                    break
+        named = [value for label, op, value in matchers if label == "__name__" and op == "="]
+        if name is None:
+            if not named:
+                raise self.error("A selector needs a metric name")
+            name = named[0]
+        matchers = [m for m in matchers if not (m[0] == "__name__" and m[1] == "=" and m[2] == name)]
+        if any(label == "__name__" for label, _, _ in matchers):
+            raise self.error("Metric names can only be matched exactly")
+        return Selector(name, tuple(sorted(matchers)))
+
+    def label_list(self) -> Tuple[str, ...]:
+        self.expect("(")
+        labels = []
+        while not self.accept(")"):
+            token = self.next()
+            if token[0] != "ident":
+                raise self.error("Expected a label name", token)
+            labels.append(token[1])
+            if not self.accept(","):
+                self.expect(")")
+                break
+        return tuple(labels)
+
+    def aggregate(self) -> Aggregate:
+        op = self.next()[1]
+        by = without = None
+        if self.accept("by"):
+            by = self.label_list()
+        elif self.accept("without"):
+            without = self.label_list()
+        self.expect("(")
+        param = None
+        if op == "quantile":
+            param_node = self.expression(0)
+            if not isinstance(param_node, Number):
+                raise self.error("quantile takes a number as its first argument")
+            param = param_node.value
+            self.expect(",")
+        start = self.token
+        expr = self.expression(0)
+        self.expect(")")
+        if by is None and without is None:
+            if self.accept("by"):
+                by = self.label_list()
+            elif self.accept("without"):
+                without = self.label_list()
+        if value_type(expr) != "vector":
+            raise self.error(f"{op} takes an instant vector", start)
+        return Aggregate(op, expr, by, without, param)
+
+    def call(self) -> Call:
+        token = self.next()
+        function = token[1]
+        if function not in FUNCTIONS:
+            raise self.error("Unknown function", token)
+        self.expect("(")
+        args = []
+        while not self.accept(")"):
+            args.append((self.token, self.expression(0)))
+            if not self.accept(","):
+                self.expect(")")
+                break
+        expected = FUNCTIONS[function]
+        if len(args) != len(expected):
+            raise self.error(f"{function} takes {len(expected)} argument(s)", token)
+        for (arg_token, arg), wanted in zip(args, expected):
+            if value_type(arg) != wanted:
+                raise self.error(f"{function} expects a {wanted.replace('matrix', 'range vector')}", arg_token)
+        return Call(function, tuple(arg for _, arg in args))
+
+
+def _fold(op: str, a: float, b: float) -> float:
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if op == "/":
+        if b == 0:
+            return math.copysign(math.inf, a) if a and a == a else math.nan
+        return a / b
+    if op == "%":
+        return math.fmod(a, b) if b else math.nan
+    try:
+        return math.pow(a, b)
+    except OverflowError:
+        return math.inf
+    except ValueError:
+        return math.nan
+
+
+def parse(text: str):
+    """Parse an expression into a node tree. Raises QueryError."""
+    return _Parser(text).parse()
+
+
+def selectors(node) -> List[Selector]:
+    """Every selector in an expression, in order."""
+    if isinstance(node, Selector):
+        return [node]
+    if isinstance(node, Call):
+        return [s for arg in node.args for s in selectors(arg)]
+    if isinstance(node, Aggregate):
+        return selectors(node.expr)
+    if isinstance(node, Binary):
+        return selectors(node.lhs) + selectors(node.rhs)
+    if isinstance(node, Negate):
+        return selectors(node.expr)
+    return []
@@ -0,0 +1,493 @@
+"""
+Planning and vectorized evaluation of PromQL expressions.
+
+``load`` plans an expression before reading anything:
+
+- Every distinct selector (metric name and matchers) is read once, over the
+  widest window any of its uses needs, through ``metric_store.load_series``.
+- Equality matchers on ``platform_id``, ``service_id`` and plain labels are
+  pushed down into the indexed SQL filters, and so are ``=~`` alternations of
+  literal values (``code=~"500|503"``). Only the remaining matchers are
+  checked against the loaded series.
+- ``histogram_quantile`` over ``rate``/``increase`` of a native histogram
+  reads ``histogram_series`` directly. An instant query reads the hourly and
+  daily rollups, so long SLO windows cost a few rows per series; a range
+  query reads raw samples and sums them per step window.
+
+``evaluate`` then runs the whole tree on ``metric_engine`` matrices (one row
+per series, one column per step), so every operator costs a few array passes
+whatever the number of series and steps. It is CPU-bound and meant for a
+thread pool.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.lazy import lazy_import
+from app.services import histograms, metric_engine, promql
+from app.services.metric_engine import Matrix, SeriesSet
+from app.services.metric_store import EPOCH, load_series
+from app.services.promql import Aggregate, Binary, Call, Negate, Number, Selector
+
+np = lazy_import("numpy")
+
+# How far back an instant selector looks for the latest sample
+LOOKBACK_MS = 5 * 60 * 1000
+
+# ``=~`` values that are plain alternatives and can become SQL ``IN``
+_LITERAL_ALTERNATION = re.compile(r"[\w:/ -]+(?:\|[\w:/ -]+)*")
+
+
+@dataclass
+class Scalar:
+    values: "np.ndarray"  # one per step
+
+
+Value = Union[Matrix, Scalar]
+
+
+@dataclass(frozen=True)
+class Pushdown:
+    platform_id: Optional[UUID] = None
+    service_id: Optional[UUID] = None
+    labels: Dict[str, Union[str, Tuple[str, ...]]] = field(default_factory=dict)
+    residual: Tuple[promql.Matcher, ...] = ()
+    empty: bool = False  # a pushed-down matcher can never match
+
+
+def pushdown(matchers: Sequence[promql.Matcher]) -> Pushdown:
+    """Split matchers into SQL filters and the rest."""
+    ids: Dict[str, UUID] = {}
+    labels: Dict[str, Union[str, Tuple[str, ...]]] = {}
+    residual = []
+    empty = False
+    for matcher in matchers:
+        label, op, value = matcher
+        if label in ("platform_id", "service_id"):
+            if op == "=" and value and label not in ids:
+                try:
+                    ids[label] = UUID(value)
+                except ValueError:
+                    empty = True
+                continue
+        elif label not in labels:
+            if op == "=" and value:
+                labels[label] = value
+                continue
+            if op == "=~" and _LITERAL_ALTERNATION.fullmatch(value):
+                labels[label] = tuple(value.split("|"))
+                continue
+        residual.append(matcher)
+    return Pushdown(ids.get("platform_id"), ids.get("service_id"), labels, tuple(residual), empty)
+
+
+@lru_cache(maxsize=256)
+def _pattern(value: str):
+    return re.compile(value)
+
+
+def matches(labels: Dict[str, str], matchers: Sequence[promql.Matcher]) -> bool:
+    """Prometheus matcher semantics: a missing label has the empty value, regexes are anchored."""
+    for label, op, value in matchers:
+        actual = labels.get(label, "")
+        if op == "=":
+            ok = actual == value
+        elif op == "!=":
+            ok = actual != value
+        elif op == "=~":
+            ok = _pattern(value).fullmatch(actual) is not None
+        else:
+            ok = _pattern(value).fullmatch(actual) is None
+        if not ok:
+            return False
+    return True
+
+
+def _native_selector(call: Call) -> Optional[Selector]:
+    """The histogram selector of ``histogram_quantile(q, [sum ...] (rate|increase(h[r])))``."""
+    inner = call.args[1]
+    if isinstance(inner, Aggregate) and inner.op == "sum":
+        inner = inner.expr
+    if isinstance(inner, Call) and inner.function in ("rate", "increase"):
+        return inner.args[0]
+    return None
+
+
+def _walk(node):
+    yield node
+    if isinstance(node, Call):
+        for arg in node.args:
+            yield from _walk(arg)
+    elif isinstance(node, (Aggregate, Negate)):
+        yield from _walk(node.expr)
+    elif isinstance(node, Binary):
+        yield from _walk(node.lhs)
+        yield from _walk(node.rhs)
+
+
+@dataclass
+class QueryData:
+    series: Dict[tuple, SeriesSet] = field(default_factory=dict)  # (name, matchers)
+    native: Dict[tuple, list] = field(default_factory=dict)  # (name, matchers, range_ms)
+
+
+def _to_datetime(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+async def load(db: AsyncSession, expr, start_ms: int, end_ms: int) -> QueryData:
+    """Read everything ``expr`` needs to be evaluated at the steps in [start_ms, end_ms]."""
+    calls = [node for node in _walk(expr) if isinstance(node, Call) and node.function == "histogram_quantile"]
+    candidates = [s for s in map(_native_selector, calls) if s is not None]
+    names = await histograms.histogram_names(db, {s.name for s in candidates})
+    native = [s for s in candidates if s.name in names]
+
+    windows: Dict[tuple, int] = {}
+    skipped = {id(s) for s in native}
+    for node in _walk(expr):
+        if isinstance(node, Selector) and id(node) not in skipped:
+            key = (node.name, node.matchers)
+            windows[key] = max(windows.get(key, 0), node.range_ms or LOOKBACK_MS)
+
+    data = QueryData()
+    for (name, matchers), window in windows.items():
+        filters = pushdown(matchers)
+        series = [] if filters.empty else await load_series(
+            db, name, _to_datetime(start_ms - window), _to_datetime(end_ms + 1),
+            platform_id=filters.platform_id, service_id=filters.service_id, labels=filters.labels,
+        )
+        series = [s for s in series if matches(metric_engine.series_labels(s), filters.residual)]
+        data.series[(name, matchers)] = SeriesSet.from_series(series)
+
+    for selector in native:
+        key = (selector.name, selector.matchers, selector.range_ms)
+        if key in data.native:
+            continue
+        filters = pushdown(selector.matchers)
+        if filters.empty:
+            data.native[key] = []
+            continue
+        arguments = dict(platform_id=filters.platform_id, service_id=filters.service_id, labels=filters.labels)
+        if start_ms == end_ms:
+            # One window: rollups cover all but its sub-hour edges
+            found = await histograms.load_histograms(
+                db, selector.name, _to_datetime(end_ms - selector.range_ms), _to_datetime(end_ms + 1), **arguments
+            )
+            data.native[key] = [(h.labels, h.bounds, h.counts[None, :]) for h in found
+                                if matches(h.labels, filters.residual)]
+        else:
+            found = await histograms.load_histogram_samples(
+                db, selector.name, _to_datetime(start_ms - selector.range_ms), _to_datetime(end_ms + 1), **arguments
+            )
+            data.native[key] = [s for s in found if matches(s.labels, filters.residual)]
+    return data
+
+
+# Evaluation
+
+def _drop_name(labels: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [{k: v for k, v in l.items() if k != "__name__"} for l in labels]
+
+
+_ARITHMETIC = {
+    "+": lambda a, b: np.add(a, b),
+    "-": lambda a, b: np.subtract(a, b),
+    "*": lambda a, b: np.multiply(a, b),
+    "/": lambda a, b: np.true_divide(a, b),
+    "%": lambda a, b: np.fmod(a, b),
+    "^": lambda a, b: np.power(a, b),
+    "==": lambda a, b: np.equal(a, b),
+    "!=": lambda a, b: np.not_equal(a, b),
+    ">": lambda a, b: np.greater(a, b),
+    "<": lambda a, b: np.less(a, b),
+    ">=": lambda a, b: np.greater_equal(a, b),
+    "<=": lambda a, b: np.less_equal(a, b),
+}
+
+_MATH = {
+    "abs": lambda v: np.abs(v),
+    "ceil": lambda v: np.ceil(v),
+    "floor": lambda v: np.floor(v),
+    "sqrt": lambda v: np.sqrt(v),
+    "exp": lambda v: np.exp(v),
+    "ln": lambda v: np.log(v),
+    "log2": lambda v: np.log2(v),
+    "log10": lambda v: np.log10(v),
+}
+
+
+def _signature(labels: Dict[str, str], on, ignoring) -> tuple:
+    if on is not None:
+        return tuple(labels.get(name, "") for name in on)
+    dropped = set(ignoring or ()) | {"__name__"}
+    return tuple(sorted((k, v) for k, v in labels.items() if k not in dropped))
+
+
+def _presence(matrix: Matrix, keys: List[tuple]) -> Dict[tuple, "np.ndarray"]:
+    """Per signature, the steps at which any row with it has a value."""
+    present = ~np.isnan(matrix.values)
+    by_key: Dict[tuple, "np.ndarray"] = {}
+    for key, row in zip(keys, present):
+        if key in by_key:
+            by_key[key] = by_key[key] | row
+        else:
+            by_key[key] = row
+    return by_key
+
+
+class _Evaluator:
+    def __init__(self, data: QueryData, steps: "np.ndarray"):
+        self.data = data
+        self.steps = steps
+
+    def scalar(self, value) -> Scalar:
+        return Scalar(np.full(self.steps.size, value, dtype=np.float64))
+
+    def eval(self, node) -> Value:
+        if isinstance(node, Number):
+            return self.scalar(node.value)
+        if isinstance(node, Selector):
+            series = self.data.series[(node.name, node.matchers)]
+            return metric_engine.instant(series, self.steps, LOOKBACK_MS)
+        if isinstance(node, Negate):
+            value = self.eval(node.expr)
+            if isinstance(value, Scalar):
+                return Scalar(-value.values)
+            return Matrix(_drop_name(value.labels), self.steps, -value.values)
+        if isinstance(node, Aggregate):
+            return self.aggregate(node)
+        if isinstance(node, Binary):
+            return self.binary(node)
+        return self.call(node)
+
+    def aggregate(self, node: Aggregate) -> Matrix:
+        matrix = self.eval(node.expr)
+        by = list(node.by) if node.by is not None else ([] if node.without is None else None)
+        without = list(node.without) if node.without is not None else None
+        return metric_engine.aggregate(matrix, node.op, by=by, without=without, param=node.param)
+
+    def call(self, node: Call) -> Value:
+        function = node.function
+        if function == "time":
+            return Scalar(self.steps / 1000.0)
+        if function in promql.RANGE_FUNCTIONS:
+            selector = node.args[-1]
+            series = self.data.series[(selector.name, selector.matchers)]
+            if function == "quantile_over_time":
+                q = float(self.eval(node.args[0]).values[0])
+                matrix = metric_engine.quantile_over_time(series, self.steps, selector.range_ms, q)
+            else:
+                matrix = metric_engine.RANGE_FUNCTIONS[function](series, self.steps, selector.range_ms)
+            labels = matrix.labels if function == "last_over_time" else _drop_name(matrix.labels)
+            return Matrix(labels, self.steps, matrix.values)
+        if function == "histogram_quantile":
+            return self.histogram_quantile(node)
+        if function == "vector":
+            return Matrix([{}], self.steps, self.eval(node.args[0]).values[None, :])
+
+        matrix = self.eval(node.args[0])
+        with np.errstate(all="ignore"):
+            if function == "scalar":
+                present = ~np.isnan(matrix.values)
+                single = present.sum(axis=0) == 1
+                total = np.where(present, matrix.values, 0.0).sum(axis=0)
+                return Scalar(np.where(single, total, np.nan))
+            if function in _MATH:
+                values = _MATH[function](matrix.values)
+            else:
+                bound = self.eval(node.args[1]).values[None, :]
+                values = np.maximum(matrix.values, bound) if function == "clamp_min" else np.minimum(matrix.values, bound)
+        return Matrix(_drop_name(matrix.labels), self.steps, values)
+
+    # Binary operators
+
+    def binary(self, node: Binary) -> Value:
+        lhs, rhs = self.eval(node.lhs), self.eval(node.rhs)
+        if node.op in promql.SET_OPERATORS:
+            return self.set_operation(node, lhs, rhs)
+        apply = _ARITHMETIC[node.op]
+        comparison = node.op in promql.COMPARISONS
+
+        with np.errstate(all="ignore"):
+            if isinstance(lhs, Scalar) and isinstance(rhs, Scalar):
+                result = apply(lhs.values, rhs.values)
+                return Scalar(result.astype(np.float64))
+
+            if isinstance(lhs, Scalar) or isinstance(rhs, Scalar):
+                vector = lhs if isinstance(lhs, Matrix) else rhs
+                left = lhs.values if isinstance(lhs, Matrix) else lhs.values[None, :]
+                right = rhs.values if isinstance(rhs, Matrix) else rhs.values[None, :]
+                result = apply(left, right)
+                if not comparison:
+                    return Matrix(_drop_name(vector.labels), self.steps, result)
+                if node.bool:
+                    values = np.where(np.isnan(vector.values), np.nan, result.astype(np.float64))
+                    return Matrix(_drop_name(vector.labels), self.steps, values)
+                return Matrix(vector.labels, self.steps, np.where(result, vector.values, np.nan))
+
+            left_rows, right_rows = self.match(node, lhs, rhs)
+            left = lhs.values[left_rows]
+            right = rhs.values[right_rows]
+            labels = [lhs.labels[i] for i in left_rows]
+            if not comparison or node.bool:
+                labels = _drop_name(labels)
+            if node.on is not None:
+                labels = [{k: v for k, v in l.items() if k in node.on} for l in labels]
+            elif node.ignoring:
+                labels = [{k: v for k, v in l.items() if k not in node.ignoring} for l in labels]
+            result = apply(left, right)
+            if not comparison:
+                values = result
+            elif node.bool:
+                values = np.where(np.isnan(left) | np.isnan(right), np.nan, result.astype(np.float64))
+            else:
+                values = np.where(result & ~np.isnan(right), left, np.nan)
+        return Matrix(labels, self.steps, np.asarray(values, dtype=np.float64).reshape(len(labels), self.steps.size))
+
+    def match(self, node: Binary, lhs: Matrix, rhs: Matrix) -> Tuple[List[int], List[int]]:
+        """One-to-one pairs of rows with equal signatures."""
+        right: Dict[tuple, int] = {}
+        for j, labels in enumerate(rhs.labels):
+            key = _signature(labels, node.on, node.ignoring)
+            if key in right:
+                raise promql.QueryError(f"Many-to-many matching for {node.op}: duplicate series on the right side")
+            right[key] = j
+        left_rows, right_rows, seen = [], [], set()
+        for i, labels in enumerate(lhs.labels):
+            key = _signature(labels, node.on, node.ignoring)
+            j = right.get(key)
+            if j is None:
+                continue
+            if key in seen:
+                raise promql.QueryError(f"Many-to-one matching for {node.op}: duplicate series on the left side")
+            seen.add(key)
+            left_rows.append(i)
+            right_rows.append(j)
+        return left_rows, right_rows
+
+    def set_operation(self, node: Binary, lhs: Matrix, rhs: Matrix) -> Matrix:
+        left_keys = [_signature(l, node.on, node.ignoring) for l in lhs.labels]
+        right_keys = [_signature(l, node.on, node.ignoring) for l in rhs.labels]
+        never = np.zeros(self.steps.size, dtype=bool)
+        if node.op == "or":
+            present = _presence(lhs, left_keys)
+            extra = np.array([
+                np.where(present.get(key, never), np.nan, row) for key, row in zip(right_keys, rhs.values)
+            ]).reshape(len(rhs.labels), self.steps.size)
+            return Matrix(lhs.labels + rhs.labels, self.steps, np.vstack([lhs.values, extra]))
+        present = _presence(rhs, right_keys)
+        keep = np.array([present.get(key, never) for key in left_keys]).reshape(lhs.values.shape)
+        if node.op == "unless":
+            keep = ~keep
+        return Matrix(lhs.labels, self.steps, np.where(keep, lhs.values, np.nan))
+
+    # Histograms
+
+    def histogram_quantile(self, node: Call) -> Matrix:
+        q = float(self.eval(node.args[0]).values[0])
+        selector = _native_selector(node)
+        if selector is not None:
+            key = (selector.name, selector.matchers, selector.range_ms)
+            if key in self.data.native:
+                return self.native_quantile(node, q, self.data.native[key], selector.range_ms)
+        return self.bucket_quantile(q, self.eval(node.args[1]))
+
+    def native_quantile(self, node: Call, q: float, entries: list, range_ms: int) -> Matrix:
+        inner = node.args[1]
+        aggregation = inner if isinstance(inner, Aggregate) else None
+
+        groups: Dict[tuple, list] = {}
+        group_labels: Dict[tuple, Dict[str, str]] = {}
+        for entry in entries:
+            if isinstance(entry, histograms.HistogramSamples):
+                labels, bounds, counts = entry.labels, entry.bounds, self.window_counts(entry, range_ms)
+            else:
+                labels, bounds, counts = entry
+            if aggregation is None:
+                kept = {k: v for k, v in labels.items() if k != "__name__"}
+            elif aggregation.by is not None:
+                kept = {name: labels[name] for name in aggregation.by if name in labels}
+            elif aggregation.without is not None:
+                kept = {k: v for k, v in labels.items() if k != "__name__" and k not in aggregation.without}
+            else:
+                kept = {}
+            key = tuple(sorted(kept.items()))
+            groups.setdefault(key, []).append((bounds, counts))
+            group_labels.setdefault(key, kept)
+
+        labels, rows = [], []
+        for key, members in groups.items():
+            layouts = {tuple(bounds) for bounds, _ in members}
+            if len(layouts) == 1:
+                bounds = members[0][0]
+                counts = np.sum([counts for _, counts in members], axis=0)
+            else:
+                bounds = np.unique(np.concatenate([b for b, _ in members]))
+                counts = np.zeros((self.steps.size, bounds.size + 1))
+                for member_bounds, member_counts in members:
+                    if tuple(member_bounds) == tuple(bounds):
+                        counts += member_counts
+                    else:
+                        counts += metric_engine.rebucket(member_bounds, member_counts, bounds)
+            labels.append(group_labels[key])
+            rows.append(metric_engine.histogram_quantile(q, bounds, counts))
+        values = np.array(rows, dtype=np.float64).reshape(len(labels), self.steps.size)
+        return Matrix(labels, self.steps, values)
+
+    def window_counts(self, entry, range_ms: int) -> "np.ndarray":
+        """Per-bucket observations in each (step - range, step] window of one series."""
+        prefix = np.zeros((entry.timestamps.size + 1, entry.counts.shape[1]))
+        np.cumsum(entry.counts, axis=0, out=prefix[1:])
+        lo = np.searchsorted(entry.timestamps, self.steps - range_ms, side="right")
+        hi = np.searchsorted(entry.timestamps, self.steps, side="right")
+        return prefix[hi] - prefix[lo]
+
+    def bucket_quantile(self, q: float, matrix: Matrix) -> Matrix:
+        """``histogram_quantile`` over cumulative ``le`` bucket series."""
+        groups: Dict[tuple, List[Tuple[float, int]]] = {}
+        group_labels: Dict[tuple, Dict[str, str]] = {}
+        for row, labels in enumerate(matrix.labels):
+            try:
+                upper = float(labels.get("le", ""))
+            except ValueError:
+                continue
+            kept = {k: v for k, v in labels.items() if k not in ("le", "__name__")}
+            key = tuple(sorted(kept.items()))
+            groups.setdefault(key, []).append((upper, row))
+            group_labels.setdefault(key, kept)
+
+        labels, rows = [], []
+        for key, buckets in groups.items():
+            buckets.sort()
+            labels.append(group_labels[key])
+            if buckets[-1][0] != np.inf or len(buckets) < 2:
+                rows.append(np.full(self.steps.size, np.nan))
+                continue
+            block = matrix.values[[row for _, row in buckets]]
+            missing = np.all(np.isnan(block), axis=0)
+            cumulative = np.maximum.accumulate(np.nan_to_num(block, nan=0.0), axis=0)
+            counts = np.diff(cumulative, axis=0, prepend=0.0).T
+            bounds = np.array([upper for upper, _ in buckets[:-1]])
+            values = metric_engine.histogram_quantile(q, bounds, counts)
+            rows.append(np.where(missing, np.nan, values))
+        values = np.array(rows, dtype=np.float64).reshape(len(labels), self.steps.size)
+        return Matrix(labels, self.steps, values)
+
+
+def evaluate(expr, data: QueryData, start_ms: int, end_ms: int, step_ms: int) -> Tuple[str, List[dict]]:
+    """Evaluate ``expr`` at every step in [start_ms, end_ms].
+
+    Returns the result type (``vector`` or ``scalar``) and its series as
+    ``[{labels, timestamps, values}]``, skipping steps without a value.
+    """
+    steps = metric_engine.step_times(start_ms, end_ms, step_ms)
+    value = _Evaluator(data, steps).eval(expr)
+    if isinstance(value, Scalar):
+        return "scalar", Matrix([{}], steps, value.values[None, :]).to_dicts()
+    return "vector", value.to_dicts()
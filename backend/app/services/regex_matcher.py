@@ -0,0 +1,89 @@
+"""
+User-supplied regular expressions, evaluated out of process.
+
+Python's ``re`` backtracks without a time limit and holds the GIL while it
+does, so a catastrophic pattern would stall the event loop and every thread.
+``RegexMatcher`` sends the strings and the patterns to a child process and
+kills it when a pattern takes longer than its timeout; the next call starts a
+new one. Live tail filters and catalog selectors share ``regex_matcher``.
+"""
+
+import multiprocessing
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Compiled patterns kept by the matcher process
+MATCHER_CACHE_SIZE = 256
+
+
+def _match_worker(conn):
+    """Matcher process loop: ("batch", strings) sets the strings, ("match", pattern, indexes) filters them."""
+    compiled: Dict[str, Callable] = {}
+    strings: List[str] = []
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request[0] == "batch":
+            strings = request[1]
+            continue
+        _, pattern, indexes = request
+        search = compiled.get(pattern)
+        if search is None:
+            if len(compiled) >= MATCHER_CACHE_SIZE:
+                compiled.clear()
+            search = compiled[pattern] = re.compile(pattern).search
+        conn.send([i for i in indexes if search(strings[i] or "") is not None])
+
+
+class RegexMatcher:
+    """Regexes evaluated in a child process, killed and restarted when a pattern times out."""
+
+    def __init__(self):
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        context = multiprocessing.get_context("spawn")
+        self._conn, child = context.Pipe()
+        self._process = context.Process(target=_match_worker, args=(child,), name="regex-matcher", daemon=True)
+        self._process.start()
+        child.close()
+
+    def _stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+            self._process = self._conn = None
+
+    def match(
+        self, strings: List[str], jobs: Sequence[Tuple[str, List[int]]], timeout: float
+    ) -> List[Optional[List[int]]]:
+        """Indexes each (pattern, candidate indexes) job ``search``-es, None for a pattern that timed out. Blocking."""
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                self._stop()
+                self._start()
+            results = []
+            self._conn.send(("batch", strings))
+            for pattern, indexes in jobs:
+                self._conn.send(("match", pattern, indexes))
+                if self._conn.poll(timeout):
+                    results.append(self._conn.recv())
+                    continue
+                results.append(None)
+                self._stop()
+                self._start()
+                self._conn.send(("batch", strings))
+            return results
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+
+regex_matcher = RegexMatcher()
@@ -0,0 +1,289 @@
+"""
+Span assembly for tail-based sampling.
+
+Ingested spans are buffered per trace id until the trace looks complete: its
+root span has arrived and no span came in for ``TRACE_ASSEMBLY_IDLE_SECONDS``,
+or it has been buffered for ``TRACE_ASSEMBLY_MAX_SECONDS`` whatever its state.
+Complete traces are summarized into a ``traces`` row, run through the
+platform's sampling policy, and only the kept ones are written, their spans
+packed into ``traces.span_data`` (see ``span_codec``). Past
+``TRACE_ASSEMBLY_MAX_SPANS`` buffered spans the oldest traces are decided
+early rather than growing the buffer. Kept traces are written in one
+statement; when it fails they are written one by one, so a trace the database
+rejects fails alone. Each failed trace is retried on the following flushes, up
+to ``TRACE_ASSEMBLY_WRITE_ATTEMPTS`` times, before being dropped. A trace that
+cannot be summarized is dropped at once. Well-known attributes copied to the
+``traces`` row (HTTP method, route, status code, user) are skipped when their
+value has the wrong type.
+
+The buffer is per process: spans of one trace must reach the same worker
+(route on the trace id at the load balancer) or each worker decides on a
+fragment. Fragments still agree on the probabilistic part of the decision,
+which hashes the trace id.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import structlog
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import telemetry
+from app.config import settings
+from app.database import background_session
+from app.models import Trace
+from app.services import span_codec
+from app.services.catalog import catalog
+from app.services.trace_sampling import decide, policies, spans_sampled, traces_sampled
+
+logger = structlog.get_logger()
+
+trace_write_failures = telemetry.counter(
+    "observatory_trace_write_failures_total",
+    "Kept traces whose write failed, by whether they will be retried or were dropped.",
+    ("outcome",),
+)
+
+
+class PendingTrace:
+    __slots__ = ("spans", "first_seen", "last_seen", "has_root")
+
+    def __init__(self, now: float):
+        self.spans: List[dict] = []
+        self.first_seen = now
+        self.last_seen = now
+        self.has_root = False
+
+
+class SpanAssembler:
+    """Spans buffered per trace id, in arrival order of the traces."""
+
+    def __init__(self):
+        self.pending: Dict[str, PendingTrace] = {}
+        self.span_count = 0
+        self.retry: List[Tuple[dict, List[dict], int]] = []  # kept (summary, spans, failed writes)
+        self._lock = asyncio.Lock()
+
+    def add(self, spans: Iterable[dict]) -> int:
+        now = time.monotonic()
+        added = 0
+        for span in spans:
+            trace = self.pending.get(span["trace_id"])
+            if trace is None:
+                trace = self.pending[span["trace_id"]] = PendingTrace(now)
+            trace.spans.append(span)
+            trace.last_seen = now
+            trace.has_root = trace.has_root or not span.get("parent_span_id")
+            added += 1
+        self.span_count += added
+        return added
+
+    def ready(self, force: bool = False) -> List[List[dict]]:
+        """Remove and return the spans of every trace due for a decision."""
+        now = time.monotonic()
+        idle, max_age = settings.TRACE_ASSEMBLY_IDLE_SECONDS, settings.TRACE_ASSEMBLY_MAX_SECONDS
+        overflow = self.span_count - settings.TRACE_ASSEMBLY_MAX_SPANS
+        due = []
+        # Dicts keep insertion order, so overflow evicts the oldest traces first
+        for trace_id, trace in self.pending.items():
+            if (
+                force
+                or overflow > 0
+                or now - trace.first_seen >= max_age
+                or (trace.has_root and now - trace.last_seen >= idle)
+            ):
+                due.append(trace_id)
+                overflow -= len(trace.spans)
+        traces = [self.pending.pop(trace_id).spans for trace_id in due]
+        self.span_count -= sum(len(spans) for spans in traces)
+        return traces
+
+    async def flush(self, force: bool = False) -> int:
+        """Decide on complete traces and write the kept ones; returns traces written."""
+        async with self._lock:
+            traces = self.ready(force)
+            retry, self.retry = self.retry, []
+            if not traces and not retry:
+                return 0
+            try:
+                async with background_session() as db:
+                    await policies.refresh(db)
+            except Exception:
+                # Nothing was decided: buffer the traces again
+                self.retry = retry
+                for spans in traces:
+                    self.add(spans)
+                raise
+            kept = retry + [(summary, spans, 0) for summary, spans in self._decide(traces)]
+            return await self._write(kept) if kept else 0
+
+    def _decide(self, traces: List[List[dict]]) -> List[Tuple[dict, List[dict]]]:
+        """Summaries and spans of the traces the sampling policies keep."""
+        kept = []
+        for spans in traces:
+            try:
+                summary = summarize(spans)
+            except Exception as e:
+                traces_sampled.inc(decision="dropped", reason="invalid")
+                spans_sampled.inc(len(spans), decision="dropped")
+                logger.warning(
+                    "Dropped trace that could not be summarized", trace_id=spans[0]["trace_id"], error=str(e)
+                )
+                continue
+            reason = decide(summary, policies.get(summary["platform_id"]))
+            decision = "kept" if reason else "dropped"
+            traces_sampled.inc(decision=decision, reason=reason or "sampled_out")
+            spans_sampled.inc(len(spans), decision=decision)
+            if reason:
+                kept.append((summary, spans))
+        return kept
+
+    async def _write(self, kept: List[Tuple[dict, List[dict], int]]) -> int:
+        """Write kept traces together, or one by one if that fails. Returns how many were written."""
+        try:
+            async with background_session() as db:
+                await write(db, [(summary, spans) for summary, spans, _ in kept])
+                await db.commit()
+            return len(kept)
+        except Exception as e:
+            if len(kept) == 1:
+                self._requeue(kept, e)
+                return 0
+            logger.warning("Failed to write trace batch, writing traces one by one", traces=len(kept), error=str(e))
+
+        written = 0
+        for trace in kept:
+            summary, spans, _ = trace
+            try:
+                async with background_session() as db:
+                    await write(db, [(summary, spans)])
+                    await db.commit()
+                written += 1
+            except Exception as e:
+                self._requeue([trace], e)
+        return written
+
+    def _requeue(self, failed: List[Tuple[dict, List[dict], int]], error: Exception):
+        """Hold on to kept traces whose write failed for another attempt, or drop them past the limit."""
+        for summary, spans, failures in failed:
+            if failures + 1 < settings.TRACE_ASSEMBLY_WRITE_ATTEMPTS:
+                self.retry.append((summary, spans, failures + 1))
+                trace_write_failures.inc(outcome="retried")
+                logger.warning("Failed to write trace", trace_id=summary["trace_id"], error=str(error))
+            else:
+                trace_write_failures.inc(outcome="dropped")
+                logger.error(
+                    "Dropped trace after failed writes",
+                    trace_id=summary["trace_id"], attempts=failures + 1, error=str(error),
+                )
+
+
+assembler = SpanAssembler()
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _millis(start: datetime, end: Optional[datetime]) -> Optional[int]:
+    return int((end - start).total_seconds() * 1000) if end is not None else None
+
+
+def _first(attributes: dict, coerce, *keys: str):
+    """First of ``keys`` whose value ``coerce`` accepts, coerced; None when none does."""
+    for key in keys:
+        value = coerce(attributes.get(key))
+        if value is not None:
+            return value
+    return None
+
+
+def _text(limit: int):
+    """Coercion to a string column: strings truncated to ``limit``, numbers formatted, anything else rejected."""
+
+    def coerce(value) -> Optional[str]:
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            value = str(value)
+        return value[:limit] if isinstance(value, str) and value else None
+
+    return coerce
+
+
+def _status_code(value) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    return value if isinstance(value, int) and 100 <= value <= 599 else None
+
+
+def summarize(spans: List[dict]) -> dict:
+    """``traces`` row for the spans of one trace."""
+    for span in spans:
+        span["start_time"] = _utc(span["start_time"])
+        span["end_time"] = _utc(span["end_time"]) if span.get("end_time") else None
+        span["duration_ms"] = _millis(span["start_time"], span["end_time"])
+
+    span_ids = {span["span_id"] for span in spans}
+    roots = [span for span in spans if span.get("parent_span_id") not in span_ids]
+    root = min(roots or spans, key=lambda span: span["start_time"])
+    start = min(span["start_time"] for span in spans)
+    end = max((span["end_time"] for span in spans if span["end_time"]), default=None)
+
+    errors = [span for span in spans if span["status"] == "error"]
+    if root["status"] in ("error", "timeout"):
+        status = root["status"]
+    elif any(span["status"] == "timeout" for span in spans):
+        status = "timeout"
+    else:
+        status = "error" if errors else "ok"
+
+    attributes = root.get("attributes") or {}
+    platform_id = root.get("platform_id") or next(
+        (span["platform_id"] for span in spans if span.get("platform_id")), None
+    )
+    services = {str(span["service_id"]) for span in spans if span.get("service_id")}
+
+    return {
+        "trace_id": root["trace_id"],
+        "platform_id": platform_id,
+        "root_service_id": root.get("service_id"),
+        "start_time": start,
+        "end_time": end,
+        "duration_ms": _millis(start, end) or 0,
+        "root_span_name": root["name"],
+        "services_involved": sorted(services),
+        "span_count": len(spans),
+        "status": status,
+        "has_error": bool(errors),
+        "error_message": next((span["status_message"] for span in errors if span.get("status_message")), None),
+        "http_method": _first(attributes, _text(10), "http.request.method", "http.method"),
+        "http_path": _first(attributes, _text(500), "http.route", "url.path", "http.target"),
+        "http_status_code": _first(attributes, _status_code, "http.response.status_code", "http.status_code"),
+        "user_id": _first(attributes, _text(255), "enduser.id", "user.id"),
+    }
+
+
+async def write(db: AsyncSession, traces: List[tuple]):
+    """Insert (summary, spans) pairs; a trace id already stored keeps its row."""
+    await catalog.resolve_rows(db, [summary for summary, _ in traces], service_key="root_service_id")
+    await db.execute(
+        pg_insert(Trace).on_conflict_do_nothing(index_elements=[Trace.trace_id]),
+        [{**summary, "span_data": span_codec.encode(spans)} for summary, spans in traces],
+    )
+
+
+async def run_flush_loop():
+    while True:
+        await asyncio.sleep(settings.TRACE_ASSEMBLY_FLUSH_SECONDS)
+        try:
+            await assembler.flush()
+        except Exception as e:
+            logger.error("Failed to flush assembled traces", error=str(e))
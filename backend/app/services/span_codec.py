@@ -0,0 +1,190 @@
+"""
+Compact span encoding: every span of a trace packed into one blob.
+
+The blob is a zlib-compressed orjson document. Spans are stored as positional
+arrays in start-time order, and the strings that repeat across a trace are
+interned into per-trace tables:
+
+    {"v": 1, "base": <start of the trace, epoch µs>,
+     "keys": [attribute keys], "names": [span names], "services": [service ids],
+     "spans": [[span_id, parent, name, service, start, duration, kind, status,
+                status_message, attributes, events, links], ...]}
+
+``parent`` is the parent's position in ``spans``. It is the raw parent id when
+the parent is not part of the trace, and null for roots. ``start`` and
+``duration`` are microseconds: ``start`` from ``base``, and ``duration`` -1
+when the span never ended. ``attributes`` alternates key positions and
+values. Empty ``events`` and ``links`` are stored as null.
+"""
+
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Span
+
+FORMAT_VERSION = 1
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class _Interner:
+    def __init__(self):
+        self.values: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def id(self, value: str) -> int:
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+def _micros(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def encode(spans: Sequence[dict]) -> bytes:
+    """Pack span dicts (``spans`` columns) into a blob."""
+    ordered = sorted(spans, key=lambda span: span["start_time"])
+    position = {span["span_id"]: i for i, span in enumerate(ordered)}
+    base = min(_micros(span["start_time"]) for span in ordered)
+    keys, names, services = _Interner(), _Interner(), _Interner()
+
+    rows = []
+    for span in ordered:
+        parent = span.get("parent_span_id")
+        start = _micros(span["start_time"])
+        attributes = []
+        for key, value in (span.get("attributes") or {}).items():
+            attributes += (keys.id(key), value)
+        rows.append([
+            span["span_id"],
+            position.get(parent, parent) if parent else None,
+            names.id(span["name"]),
+            services.id(str(span["service_id"])) if span.get("service_id") else None,
+            start - base,
+            _micros(span["end_time"]) - start if span.get("end_time") else -1,
+            span.get("kind"),
+            span.get("status"),
+            span.get("status_message"),
+            attributes,
+            span.get("events") or None,
+            span.get("links") or None,
+        ])
+
+    document = {
+        "v": FORMAT_VERSION,
+        "base": base,
+        "keys": keys.values,
+        "names": names.values,
+        "services": services.values,
+        "spans": rows,
+    }
+    return zlib.compress(orjson.dumps(document), 6)
+
+
+def decode(blob: bytes) -> List[dict]:
+    """Span dicts, in start-time order, from a blob."""
+    document = orjson.loads(zlib.decompress(blob))
+    if document["v"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported span encoding version {document['v']}")
+    base = EPOCH + timedelta(microseconds=document["base"])
+    keys, names, services = document["keys"], document["names"], document["services"]
+    rows = document["spans"]
+    micros = timedelta(microseconds=1)
+
+    spans = []
+    append = spans.append
+    for span_id, parent, name, service, start, duration, kind, status, message, attributes, events, links in rows:
+        start_time = base + start * micros
+        ended = duration >= 0
+        append({
+            "span_id": span_id,
+            "parent_span_id": rows[parent][0] if parent.__class__ is int else parent,
+            "service_id": services[service] if service is not None else None,
+            "start_time": start_time,
+            "end_time": start_time + duration * micros if ended else None,
+            "duration_ms": duration / 1000 if ended else None,
+            "name": names[name],
+            "kind": kind,
+            "status": status,
+            "status_message": message,
+            "attributes": dict(zip(map(keys.__getitem__, attributes[::2]), attributes[1::2])),
+            "events": events or (),
+            "links": links or (),
+        })
+    return spans
+
+
+# Columns of legacy ``spans`` rows, in the shape ``decode`` returns
+SPAN_COLUMNS = [
+    "span_id", "parent_span_id", "service_id", "start_time", "end_time", "duration_ms",
+    "name", "kind", "status", "status_message", "attributes", "events", "links",
+]
+
+
+async def load_spans(db: AsyncSession, trace_id: str, span_data: Optional[bytes]) -> List[dict]:
+    """Spans of a stored trace in start-time order, from its blob or its ``spans`` rows."""
+    if span_data is not None:
+        return decode(span_data)
+    # Stored before spans were packed per trace
+    result = await db.execute(
+        select(*(Span.__table__.c[name] for name in SPAN_COLUMNS))
+        .where(Span.trace_id == trace_id)
+        .order_by(Span.start_time)
+    )
+    return [dict(zip(SPAN_COLUMNS, row)) for row in result.all()]
+
+
+def build_tree(spans: List[dict]) -> List[dict]:
+    """Order spans depth-first, annotating ``depth`` and ``child_count``.
+
+    ``spans`` must be in start-time order, as ``decode`` returns them, so that
+    siblings come back in start-time order too. Spans whose parent is missing
+    from the trace are treated as roots, and so is one span of any parent
+    cycle, so every span comes back exactly once.
+    """
+    position = {span["span_id"]: i for i, span in enumerate(spans)}
+    children: Dict[int, List[int]] = {}
+    roots = []
+    for i, span in enumerate(spans):
+        parent: Optional[int] = position.get(span["parent_span_id"])
+        if parent is None or parent == i:
+            roots.append(i)
+        else:
+            children.setdefault(parent, []).append(i)
+
+    ordered = []
+    visited = bytearray(len(spans))
+    no_children: List[int] = []
+
+    def walk(start: int):
+        stack = [(start, 0)]
+        while stack:
+            i, depth = stack.pop()
+            if visited[i]:
+                continue
+            visited[i] = 1
+            span = spans[i]
+            below = children.get(i, no_children)
+            span["depth"] = depth
+            span["child_count"] = len(below)
+            ordered.append(span)
+            depth += 1
+            stack.extend([(child, depth) for child in reversed(below)])
+
+    for root in roots:
+        walk(root)
+    if len(ordered) < len(spans):
+        for i in range(len(spans)):
+            if not visited[i]:
+                walk(i)
+    return ordered
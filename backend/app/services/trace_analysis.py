@@ -0,0 +1,273 @@
+"""
+Trace analysis: where the time of a trace went.
+
+For every span it computes:
+
+- self time: its duration not covered by any child;
+- critical time: how much of it lies on the critical path;
+- overlap: child time that ran in parallel with other children.
+
+These are summed per service and per operation (service and span name), and
+the critical path is returned as time-ordered segments. Children are clipped
+to their parent first, so clock skew between hosts cannot make a child
+outlast its parent.
+
+The critical path is walked back from the end of the root span. At each step
+it descends into the child that finished last before the current point, and
+charges the gaps between children to the parent. Each span's children are
+sorted by end time once and consumed through a pointer, so the walk is
+linear in the number of spans apart from that sort.
+
+Stored traces never change, so analyses are cached per trace id. ``merge``
+combines the breakdowns of many traces of one endpoint into means per trace.
+"""
+
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Trace
+from app.services import span_codec
+
+# Analyses kept in memory per process
+ANALYSIS_CACHE_SIZE = 1000
+
+# Spans with the most self time kept in an analysis
+TOP_SPANS = 100
+
+_MICRO = timedelta(microseconds=1)
+
+
+def _ms(micros: float) -> float:
+    return round(micros / 1000, 3)
+
+
+def analyze(spans: List[dict]) -> dict:
+    """Critical path, self time and breakdowns for the spans of one trace."""
+    ordered = span_codec.build_tree(spans)  # parents before their children
+    n = len(ordered)
+    if n == 0:
+        return {
+            "span_count": 0, "duration_ms": 0.0, "critical_path_ms": 0.0, "overlap_ms": 0.0,
+            "average_concurrency": 0.0, "critical_path": [], "services": [], "operations": [], "top_spans": [],
+        }
+
+    base = min(span["start_time"] for span in ordered)
+    position = {span["span_id"]: i for i, span in enumerate(ordered)}
+    start = [0] * n
+    end = [0] * n
+    parent = [-1] * n
+    children: List[List[int]] = [[] for _ in range(n)]
+    for i, span in enumerate(ordered):
+        s = (span["start_time"] - base) // _MICRO
+        e = (span["end_time"] - base) // _MICRO if span["end_time"] else s
+        p = position.get(span["parent_span_id"], -1)
+        if 0 <= p < i:
+            s = min(max(s, start[p]), end[p])
+            e = min(max(e, s), end[p])
+            parent[i] = p
+            children[p].append(i)  # in start order, as build_tree visits siblings
+        else:
+            e = max(e, s)
+        start[i], end[i] = s, e
+
+    # Self time and overlap from the union of each span's child intervals
+    self_time = [0] * n
+    overlap = [0] * n
+    for i in range(n):
+        busy = covered = 0
+        run_start = run_end = None
+        for c in children[i]:
+            busy += end[c] - start[c]
+            if run_end is None or start[c] > run_end:
+                if run_end is not None:
+                    covered += run_end - run_start
+                run_start, run_end = start[c], end[c]
+            elif end[c] > run_end:
+                run_end = end[c]
+        if run_end is not None:
+            covered += run_end - run_start
+        self_time[i] = end[i] - start[i] - covered
+        overlap[i] = busy - covered
+
+    # Critical path from the longest root
+    roots = [i for i in range(n) if parent[i] < 0]
+    root = max(roots, key=lambda i: end[i] - start[i])
+    by_end: Dict[int, List[int]] = {}
+    pointer: Dict[int, int] = {}
+    critical = [0] * n
+    segments: List[Tuple[int, int, int]] = []
+    i, until = root, end[root]
+    while True:
+        kids = by_end.get(i)
+        if kids is None:
+            kids = by_end[i] = sorted(children[i], key=end.__getitem__)
+            pointer[i] = len(kids) - 1
+        p = pointer[i]
+        while p >= 0 and end[kids[p]] > until:
+            p -= 1
+        if p >= 0:
+            child = kids[p]
+            pointer[i] = p - 1
+            if end[child] < until:
+                segments.append((i, end[child], until))
+            i, until = child, end[child]
+            continue
+        pointer[i] = p
+        if start[i] < until:
+            segments.append((i, start[i], until))
+        if i == root:
+            break
+        i, until = parent[i], start[i]
+    segments.reverse()
+    for i, s, e in segments:
+        critical[i] += e - s
+
+    services: Dict[Optional[str], list] = {}
+    operations: Dict[Tuple[Optional[str], str], list] = {}
+    for i, span in enumerate(ordered):
+        service = str(span["service_id"]) if span["service_id"] else None
+        for totals in (services.setdefault(service, [0, 0, 0]),
+                       operations.setdefault((service, span["name"]), [0, 0, 0])):
+            totals[0] += 1
+            totals[1] += self_time[i]
+            totals[2] += critical[i]
+
+    wall = max(end) - min(start)
+    top = sorted(range(n), key=self_time.__getitem__, reverse=True)[:TOP_SPANS]
+    return {
+        "span_count": n,
+        "duration_ms": _ms(wall),
+        "critical_path_ms": _ms(sum(critical)),
+        "overlap_ms": _ms(sum(overlap)),
+        "average_concurrency": round(sum(self_time) / wall, 3) if wall else 1.0,
+        "critical_path": [
+            {
+                "span_id": ordered[i]["span_id"],
+                "name": ordered[i]["name"],
+                "service_id": ordered[i]["service_id"],
+                "start_offset_ms": _ms(s),
+                "duration_ms": _ms(e - s),
+            }
+            for i, s, e in segments
+        ],
+        "services": [
+            {"service_id": service, "span_count": count, "self_time_ms": _ms(own), "critical_time_ms": _ms(crit)}
+            for service, (count, own, crit) in sorted(services.items(), key=lambda item: -item[1][2])
+        ],
+        "operations": [
+            {
+                "service_id": service,
+                "name": name,
+                "span_count": count,
+                "self_time_ms": _ms(own),
+                "critical_time_ms": _ms(crit),
+            }
+            for (service, name), (count, own, crit) in sorted(operations.items(), key=lambda item: -item[1][2])
+        ],
+        "top_spans": [
+            {
+                "span_id": ordered[i]["span_id"],
+                "name": ordered[i]["name"],
+                "service_id": ordered[i]["service_id"],
+                "duration_ms": _ms(end[i] - start[i]),
+                "self_time_ms": _ms(self_time[i]),
+                "critical_time_ms": _ms(critical[i]),
+                "overlap_ms": _ms(overlap[i]),
+            }
+            for i in top
+        ],
+    }
+
+
+def _merge_rows(results: List[dict], field: str, key) -> List[dict]:
+    totals: Dict[tuple, dict] = {}
+    for analysis in results:
+        for row in analysis[field]:
+            merged = totals.get(key(row))
+            if merged is None:
+                merged = totals[key(row)] = {**row, "span_count": 0, "self_time_ms": 0.0,
+                                             "critical_time_ms": 0.0, "traces_on_critical_path": 0}
+            merged["span_count"] += row["span_count"]
+            merged["self_time_ms"] += row["self_time_ms"]
+            merged["critical_time_ms"] += row["critical_time_ms"]
+            merged["traces_on_critical_path"] += row["critical_time_ms"] > 0
+    count = len(results)
+    critical_total = sum(row["critical_time_ms"] for row in totals.values()) or 1.0
+    rows = []
+    for row in totals.values():
+        row["critical_path_share"] = round(row["critical_time_ms"] / critical_total, 4)
+        row["span_count"] = round(row["span_count"] / count, 2)
+        row["self_time_ms"] = round(row["self_time_ms"] / count, 3)
+        row["critical_time_ms"] = round(row["critical_time_ms"] / count, 3)
+        rows.append(row)
+    rows.sort(key=lambda row: row["critical_time_ms"], reverse=True)
+    return rows
+
+
+def merge(results: List[dict]) -> dict:
+    """Mean breakdowns per trace over several analyses of one endpoint."""
+    count = len(results)
+    if count == 0:
+        return {"traces": 0, "mean_duration_ms": 0.0, "mean_critical_path_ms": 0.0, "services": [], "operations": []}
+    return {
+        "traces": count,
+        "mean_duration_ms": round(sum(a["duration_ms"] for a in results) / count, 3),
+        "mean_critical_path_ms": round(sum(a["critical_path_ms"] for a in results) / count, 3),
+        "services": _merge_rows(results, "services", lambda row: (row["service_id"],)),
+        "operations": _merge_rows(results, "operations", lambda row: (row["service_id"], row["name"])),
+    }
+
+
+class AnalysisCache:
+    """LRU of trace analyses; stored traces are immutable, so entries never go stale."""
+
+    def __init__(self, size: int = ANALYSIS_CACHE_SIZE):
+        self.size = size
+        self.analyses: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get(self, trace_id: str) -> Optional[dict]:
+        analysis = self.analyses.get(trace_id)
+        if analysis is not None:
+            self.analyses.move_to_end(trace_id)
+        return analysis
+
+    def put(self, trace_id: str, analysis: dict):
+        self.analyses[trace_id] = analysis
+        self.analyses.move_to_end(trace_id)
+        while len(self.analyses) > self.size:
+            self.analyses.popitem(last=False)
+
+
+analyses = AnalysisCache()
+
+
+async def _analyze_stored(db: AsyncSession, trace_id: str, span_data: Optional[bytes]) -> dict:
+    analysis = analyze(await span_codec.load_spans(db, trace_id, span_data))
+    analyses.put(trace_id, analysis)
+    return analysis
+
+
+async def analysis_for(db: AsyncSession, trace_id: str) -> Optional[dict]:
+    """Cached analysis of a stored trace, or None when it does not exist."""
+    analysis = analyses.get(trace_id)
+    if analysis is not None:
+        return analysis
+    row = (await db.execute(select(Trace.span_data).where(Trace.trace_id == trace_id))).one_or_none()
+    if row is None:
+        return None
+    return await _analyze_stored(db, trace_id, row.span_data)
+
+
+async def analyses_for(db: AsyncSession, trace_ids: List[str]) -> List[dict]:
+    """Analyses of stored traces, loading only the blobs of those not cached."""
+    found = {trace_id: analyses.get(trace_id) for trace_id in trace_ids}
+    missing = [trace_id for trace_id, analysis in found.items() if analysis is None]
+    if missing:
+        rows = await db.execute(select(Trace.trace_id, Trace.span_data).where(Trace.trace_id.in_(missing)))
+        for trace_id, span_data in rows.all():
+            found[trace_id] = await _analyze_stored(db, trace_id, span_data)
+    return [analysis for analysis in found.values() if analysis is not None]
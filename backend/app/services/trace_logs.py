@@ -0,0 +1,87 @@
+"""
+Trace-to-logs correlation.
+
+Log lines carry the ``trace_id`` and ``span_id`` of the request that wrote
+them. ``correlate`` fetches a trace's spans and its log lines concurrently,
+each on its own read session, and attaches every line to its span. The logs
+scan is bounded by the trace's time range, padded for clock skew between
+hosts, so Postgres only reads that slice of ``logs`` and only archive chunks
+overlapping it are opened.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import read_session
+from app.models import LogEntry, Trace
+from app.services import span_codec
+from app.services.log_archive import search_archive
+from app.services.log_templates import template_store, render
+
+# Logs written this much before or after the trace's spans still belong to it
+LOG_WINDOW_PADDING = timedelta(seconds=5)
+
+# Most log lines returned for one trace
+MAX_LOGS = 10_000
+
+
+async def _spans(trace_id: str) -> List[dict]:
+    async with read_session() as db:
+        span_data = (await db.execute(
+            select(Trace.span_data).where(Trace.trace_id == trace_id)
+        )).scalar_one_or_none()
+        return await span_codec.load_spans(db, trace_id, span_data)
+
+
+async def _logs(trace_id: str, start: datetime, end: datetime) -> List[dict]:
+    async with read_session() as db:
+        result = await db.execute(
+            select(*LogEntry.__table__.c)
+            .where(
+                LogEntry.trace_id == trace_id,
+                LogEntry.timestamp >= start,
+                LogEntry.timestamp < end,
+            )
+            .order_by(LogEntry.timestamp)
+            .limit(MAX_LOGS)
+        )
+        rows = [dict(row._mapping) for row in result]
+        templates = await template_store.get_templates(
+            db, {row["template_id"] for row in rows if row["template_id"] is not None}
+        )
+    for row in rows:
+        template_id, params = row.pop("template_id"), row.pop("params")
+        if row["message"] is None and template_id is not None:
+            row["message"] = render(templates.get(template_id, ""), params)
+
+    rows += await run_in_threadpool(
+        search_archive, Path(settings.LOGS_ARCHIVE_DIR), start, end, MAX_LOGS, trace_id=trace_id
+    )
+    rows.sort(key=lambda row: row["timestamp"])
+    return rows[:MAX_LOGS]
+
+
+async def correlate(
+    trace_id: str, start_time: datetime, end_time: Optional[datetime]
+) -> Tuple[List[dict], List[dict]]:
+    """Spans of a trace depth-first, each with its ``logs``, and the lines matching no span."""
+    start = start_time - LOG_WINDOW_PADDING
+    end = (end_time or start_time) + LOG_WINDOW_PADDING
+    spans, logs = await asyncio.gather(_spans(trace_id), _logs(trace_id, start, end))
+
+    ordered = span_codec.build_tree(spans)
+    by_id = {}
+    for span in ordered:
+        span["logs"] = []
+        by_id[span["span_id"]] = span
+    unattached = []
+    for line in logs:
+        span = by_id.get(line["span_id"])
+        (span["logs"] if span is not None else unattached).append(line)
+    return ordered, unattached
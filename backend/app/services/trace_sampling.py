@@ -0,0 +1,106 @@
+"""
+Tail-based trace sampling.
+
+A trace is decided once the span assembler considers it complete, so the
+decision sees its real duration and status. Errored traces, timeouts and
+traces slower than the platform's latency target are always kept; the rest
+are kept with probability ``sample_rate``.
+
+Policies come from ``Platform.settings["trace_sampling"]``, for example::
+
+    {"sample_rate": 0.05, "keep_errors": true, "keep_slow": true, "latency_target_ms": 800}
+
+Missing keys fall back to ``TRACE_SAMPLE_RATE`` and the platform's
+``default_latency_target_ms``. The probabilistic part hashes the trace id, so
+workers that each hold part of a trace make the same call.
+"""
+
+import time
+from dataclasses import dataclass
+from hashlib import sha1
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import telemetry
+from app.config import settings
+from app.models import Platform
+
+traces_sampled = telemetry.counter(
+    "observatory_traces_sampled_total",
+    "Completed traces by tail-sampling decision and the reason for it.",
+    ("decision", "reason"),
+)
+spans_sampled = telemetry.counter(
+    "observatory_spans_sampled_total",
+    "Spans of completed traces by tail-sampling decision.",
+    ("decision",),
+)
+
+
+@dataclass(frozen=True)
+class SamplingPolicy:
+    sample_rate: float
+    keep_errors: bool = True
+    keep_slow: bool = True
+    latency_target_ms: Optional[float] = None
+
+    @classmethod
+    def default(cls) -> "SamplingPolicy":
+        return cls(settings.TRACE_SAMPLE_RATE, latency_target_ms=500.0)
+
+    @classmethod
+    def for_platform(cls, platform_settings: Optional[dict], latency_target_ms) -> "SamplingPolicy":
+        overrides = (platform_settings or {}).get("trace_sampling") or {}
+        target = overrides.get("latency_target_ms", latency_target_ms)
+        return cls(
+            sample_rate=float(overrides.get("sample_rate", settings.TRACE_SAMPLE_RATE)),
+            keep_errors=bool(overrides.get("keep_errors", True)),
+            keep_slow=bool(overrides.get("keep_slow", True)),
+            latency_target_ms=float(target) if target is not None else None,
+        )
+
+
+def _sampled(trace_id: str, rate: float) -> bool:
+    if rate >= 1:
+        return True
+    return int.from_bytes(sha1(trace_id.encode("utf-8")).digest()[:8], "big") < rate * 2**64
+
+
+def decide(trace: dict, policy: SamplingPolicy) -> Optional[str]:
+    """Reason to keep a summarized trace (a ``traces`` row), or None to drop it."""
+    if policy.keep_errors and trace["has_error"]:
+        return "error"
+    if policy.keep_errors and trace["status"] == "timeout":
+        return "timeout"
+    if policy.keep_slow and policy.latency_target_ms is not None and trace["duration_ms"] > policy.latency_target_ms:
+        return "slow"
+    if _sampled(trace["trace_id"], policy.sample_rate):
+        return "sampled"
+    return None
+
+
+class PolicyCache:
+    """Sampling policy per platform, reloaded every TRACE_POLICY_REFRESH_SECONDS."""
+
+    def __init__(self):
+        self.policies: Dict[str, SamplingPolicy] = {}
+        self._loaded_at: Optional[float] = None
+
+    async def refresh(self, db: AsyncSession, force: bool = False):
+        due = self._loaded_at is None or time.monotonic() - self._loaded_at >= settings.TRACE_POLICY_REFRESH_SECONDS
+        if not (due or force):
+            return
+        rows = (await db.execute(select(Platform.id, Platform.settings, Platform.default_latency_target_ms))).all()
+        self.policies = {
+            str(platform_id): SamplingPolicy.for_platform(platform_settings, target)
+            for platform_id, platform_settings, target in rows
+        }
+        self._loaded_at = time.monotonic()
+
+    def get(self, platform_id) -> SamplingPolicy:
+        return self.policies.get(str(platform_id)) or SamplingPolicy.default()
+
+
+policies = PolicyCache()
@@ -0,0 +1,52 @@
+"""
+Process-local counters for the API's own behaviour, exported at ``/metrics``
+in the Prometheus text format.
+
+Deliberately tiny: monotonic counters with a fixed set of low-cardinality
+labels, incremented from the event loop without locking.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            if key:
+                labels = ",".join(f'{name}="{_escape(v)}"' for name, v in zip(self.labelnames, key))
+                lines.append(f"{self.name}{{{labels}}} {value:g}")
+            else:
+                lines.append(f"{self.name} {value:g}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_registry: Dict[str, Counter] = {}
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    """Register a counter, or return the one already registered under ``name``."""
+    if name not in _registry:
+        _registry[name] = Counter(name, documentation, labelnames)
+    return _registry[name]
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
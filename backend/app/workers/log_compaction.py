@@ -0,0 +1,121 @@
+"""
+Log compaction job.
+
+Moves logs older than LOGS_HOT_DAYS out of Postgres into the columnar archive,
+one hour of data per transaction:
+
+    python -m app.workers.log_compaction [--older-than-days N]
+
+Each slice is removed with DELETE ... RETURNING and only committed after its
+chunk files are durably written, so a crash leaves the rows in Postgres. The
+chunks are written as pending files and published once the delete commits, so
+a failed commit never leaves the same rows both in Postgres and in a
+searchable chunk. Pending files left by a failed or interrupted slice are
+settled at the start of the next run: published if their rows are gone from
+Postgres, discarded if they are still there.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import structlog
+from sqlalchemy import select, delete, func
+
+from app.config import settings
+from app.database import background_session, close_db
+from app.models import LogEntry
+from app.services.log_archive import first_row_id, pending_chunks, publish_chunk, write_chunk
+from app.services.log_templates import template_store
+
+logger = structlog.get_logger()
+
+SLICE = timedelta(hours=1)
+
+
+async def recover_pending(directory: Path) -> int:
+    """Settle chunks left pending by an interrupted run. Returns how many were published."""
+    published = 0
+    for path in await asyncio.to_thread(pending_chunks, directory):
+        row_id = await asyncio.to_thread(first_row_id, path)
+        async with background_session() as db:
+            still_hot = await db.scalar(select(LogEntry.id).where(LogEntry.id == row_id))
+        # A slice's rows are deleted in one transaction, so one row tells whether it committed
+        if still_hot is None:
+            await asyncio.to_thread(publish_chunk, path)
+            published += 1
+        else:
+            path.unlink()
+        logger.info("Recovered pending log chunk", path=str(path), published=still_hot is None)
+    return published
+
+
+async def compact_logs(
+    older_than_days: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    chunk_rows: Optional[int] = None,
+) -> int:
+    """Archive logs older than the hot window. Returns the number of rows moved."""
+    older_than_days = settings.LOGS_HOT_DAYS if older_than_days is None else older_than_days
+    directory = Path(archive_dir or settings.LOGS_ARCHIVE_DIR)
+    chunk_rows = chunk_rows or settings.LOGS_ARCHIVE_CHUNK_ROWS
+
+    if directory.is_dir():
+        await recover_pending(directory)
+
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).replace(
+        minute=0, second=0, microsecond=0
+    )
+    async with background_session() as db:
+        oldest = await db.scalar(select(func.min(LogEntry.timestamp)))
+    if oldest is None or oldest >= cutoff:
+        return 0
+
+    columns = LogEntry.__table__.c
+    moved = 0
+    window_start = oldest.replace(minute=0, second=0, microsecond=0)
+    while window_start < cutoff:
+        window_end = min(window_start + SLICE, cutoff)
+        pending = []
+        async with background_session() as db:
+            async with db.begin():
+                result = await db.execute(
+                    delete(LogEntry)
+                    .where(LogEntry.timestamp >= window_start, LogEntry.timestamp < window_end)
+                    .returning(*columns)
+                )
+                rows = [dict(row._mapping) for row in result]
+                if rows:
+                    rows.sort(key=lambda row: row["timestamp"])
+                    templates = await template_store.get_templates(
+                        db, {row["template_id"] for row in rows if row["template_id"] is not None}
+                    )
+                    for offset in range(0, len(rows), chunk_rows):
+                        pending.append(await asyncio.to_thread(
+                            write_chunk, directory, rows[offset:offset + chunk_rows], templates, True
+                        ))
+        for path in pending:
+            await asyncio.to_thread(publish_chunk, path)
+        if rows:
+            moved += len(rows)
+            logger.info("Archived log slice", start=window_start.isoformat(), rows=len(rows))
+        window_start = window_end
+
+    return moved
+
+
+async def main(older_than_days: Optional[int]):
+    try:
+        moved = await compact_logs(older_than_days)
+        logger.info("Log compaction finished", rows=moved)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move cold logs into the columnar archive.")
+    parser.add_argument("--older-than-days", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.older_than_days))
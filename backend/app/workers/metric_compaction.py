@@ -0,0 +1,130 @@
+"""
+Metric compaction job.
+
+Moves raw samples older than METRICS_HOT_HOURS into Gorilla-compressed
+``metric_chunks``, one chunk per series per METRICS_CHUNK_SECONDS window:
+
+    python -m app.workers.metric_compaction [--older-than-hours N]
+
+Each (window, platform) slice is moved in its own transaction with
+DELETE ... RETURNING, so the hot and cold tiers never hold the same sample.
+The run then deletes exemplars older than EXEMPLARS_RETENTION_DAYS.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import structlog
+from sqlalchemy import select, delete, insert, func
+
+from app.config import settings
+from app.database import background_session, close_db
+from app.models import Metric, MetricChunk, Platform
+from app.services import exemplars, gorilla
+from app.services.metric_store import EPOCH, canonical_labels, series_hash, to_millis
+
+logger = structlog.get_logger()
+
+
+def _align(value: datetime, seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=(to_millis(value) // 1000) // seconds * seconds)
+
+
+async def _compact_slice(window_start: datetime, window_end: datetime, platform_id) -> int:
+    async with background_session() as db:
+        async with db.begin():
+            statement = delete(Metric).where(
+                Metric.timestamp >= window_start,
+                Metric.timestamp < window_end,
+                Metric.platform_id == platform_id if platform_id else Metric.platform_id.is_(None),
+            ).returning(
+                Metric.name,
+                Metric.metric_type,
+                Metric.platform_id,
+                Metric.service_id,
+                Metric.labels,
+                Metric.unit,
+                Metric.timestamp,
+                Metric.value,
+            )
+            rows = (await db.execute(statement)).all()
+            if not rows:
+                return 0
+
+            series = {}
+            for name, metric_type, platform, service, labels, unit, timestamp, value in rows:
+                key = (name, service, canonical_labels(labels))
+                if key not in series:
+                    series[key] = (name, metric_type, platform, service, labels or {}, unit, [])
+                series[key][-1].append((to_millis(timestamp), value))
+
+            chunks = []
+            for name, metric_type, platform, service, labels, unit, samples in series.values():
+                samples.sort()
+                chunks.append({
+                    "series_hash": series_hash(name, platform, service, labels),
+                    "name": name,
+                    "metric_type": metric_type,
+                    "platform_id": platform,
+                    "service_id": service,
+                    "labels": labels,
+                    "unit": unit,
+                    "start_time": window_start,
+                    "end_time": window_end,
+                    "sample_count": len(samples),
+                    "data": gorilla.encode([ts for ts, _ in samples], [value for _, value in samples]),
+                })
+            await db.execute(insert(MetricChunk), chunks)
+    return len(rows)
+
+
+async def compact_metrics(older_than_hours: Optional[int] = None, chunk_seconds: Optional[int] = None) -> int:
+    """Compact raw samples older than the hot window. Returns the number of samples moved."""
+    older_than_hours = settings.METRICS_HOT_HOURS if older_than_hours is None else older_than_hours
+    chunk_seconds = chunk_seconds or settings.METRICS_CHUNK_SECONDS
+
+    cutoff = _align(datetime.now(timezone.utc) - timedelta(hours=older_than_hours), chunk_seconds)
+    async with background_session() as db:
+        oldest = await db.scalar(select(func.min(Metric.timestamp)))
+        platform_ids = list((await db.execute(select(Platform.id))).scalars())
+    if oldest is None or oldest >= cutoff:
+        return 0
+
+    moved = 0
+    window_start = _align(oldest, chunk_seconds)
+    while window_start < cutoff:
+        window_end = window_start + timedelta(seconds=chunk_seconds)
+        window_moved = 0
+        for platform_id in platform_ids + [None]:
+            window_moved += await _compact_slice(window_start, window_end, platform_id)
+        if window_moved:
+            logger.info("Compacted metric window", start=window_start.isoformat(), samples=window_moved)
+        moved += window_moved
+        window_start = window_end
+
+    return moved
+
+
+async def prune_exemplars(retention_days: Optional[int] = None) -> int:
+    """Delete exemplars past their retention. Returns the number deleted."""
+    retention_days = settings.EXEMPLARS_RETENTION_DAYS if retention_days is None else retention_days
+    async with background_session() as db:
+        return await exemplars.prune(db, datetime.now(timezone.utc) - timedelta(days=retention_days))
+
+
+async def main(older_than_hours: Optional[int]):
+    try:
+        moved = await compact_metrics(older_than_hours)
+        pruned = await prune_exemplars()
+        logger.info("Metric compaction finished", samples=moved, exemplars_pruned=pruned)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact cold metric samples into Gorilla chunks.")
+    parser.add_argument("--older-than-hours", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.older_than_hours))
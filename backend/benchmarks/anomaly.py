@@ -0,0 +1,84 @@
+"""
+Throughput benchmark for the streaming anomaly detector.
+
+Feeds synthetic gauge samples for ``--series`` series in batches, in memory
+and on one core, and reports samples per second and the detector's memory.
+From ``backend/``:
+
+    python -m benchmarks.anomaly --series 1000000 --rounds 40
+
+The run exits with status 1 when throughput falls below ``--min-rate``.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.services.anomaly import AnomalyDetector
+
+SCRAPE_MS = 15_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming anomaly detector.")
+    parser.add_argument("--series", type=int, default=1_000_000)
+    parser.add_argument("--rounds", type=int, default=40, help="samples per series")
+    parser.add_argument("--batch", type=int, default=100_000)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--seasonality", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-rate", type=float, default=1_000_000.0, help="samples per second")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    detector = AnomalyDetector(capacity=args.series, warmup=args.warmup, seasonality=args.seasonality)
+    keys = rng.integers(0, 2**63 - 1, size=args.series, dtype=np.int64)
+    levels = rng.uniform(10, 1000, size=args.series)
+
+    samples = detections = 0
+    elapsed = 0.0
+    for round_index in range(args.rounds):
+        timestamp = round_index * SCRAPE_MS
+        values = levels * (1 + rng.normal(0, 0.02, size=args.series))
+        if round_index == args.rounds - 1:
+            values[rng.random(args.series) < 0.001] *= 3  # inject spikes in the last round
+        for start in range(0, args.series, args.batch):
+            batch = slice(start, start + args.batch)
+            batch_keys = keys[batch]
+            timestamps = np.full(batch_keys.size, timestamp, dtype=np.int64)
+            started = time.perf_counter()
+            found = detector.observe(batch_keys, timestamps, values[batch])
+            elapsed += time.perf_counter() - started
+            samples += batch_keys.size
+            detections += found.positions.size
+
+    rate = samples / elapsed if elapsed else 0.0
+    results = {
+        "series": len(detector),
+        "samples": samples,
+        "detections": detections,
+        "samples_per_second": round(rate),
+        "memory_mb": round(detector.nbytes / 2**20, 1),
+        "bytes_per_series": round(detector.nbytes / args.series, 1),
+    }
+    print(
+        f"{results['samples']} samples over {results['series']} series: "
+        f"{results['samples_per_second']:,} samples/s, {results['memory_mb']} MiB "
+        f"({results['bytes_per_series']} B/series), {results['detections']} detections"
+    )
+
+    if args.output:
+        args.output.write_text(json.dumps({"args": vars(args) | {"output": str(args.output)}, "results": results}, indent=2))
+
+    if rate < args.min_rate:
+        print(f"Below target: {rate:,.0f} samples/s < {args.min_rate:,.0f}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,542 @@
+"""
+Endpoint benchmarks for the INFRA Observatory API.
+
+Boots the FastAPI app in-process behind an ASGI client and drives every
+router against the database in DATABASE_URL. Load it with production-like
+data first (``scripts/seed.py --scale``), then from ``backend/``:
+
+    python -m benchmarks.endpoints --concurrency 32 --requests 2000
+    python -m benchmarks.endpoints --update-baseline
+
+Results are written to ``--output`` and compared against the committed
+``benchmarks/baseline.json``. The run exits with status 1 when any scenario
+answers with an unexpected status or regresses beyond ``--threshold``.
+Scenarios whose fixtures the dataset lacks (no traces or incidents yet) are
+skipped. The login scenario signs in as a benchmark user, created on first
+run.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+import httpx
+from sqlalchemy import event, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.auth import hash_password
+from app.config import settings
+from app.database import engine, read_engine, ingest_engine, background_engine
+from app.main import app
+from app.models import Platform, Service, User
+from app.schemas.platform import PlatformCreate
+from app.schemas.service import ServiceCreate
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+BENCHMARK_EMAIL = "benchmark@observatory.local"
+BENCHMARK_PASSWORD = "benchmark-password"
+
+# Longest wait for a tailed line before the request counts as an error
+TAIL_TIMEOUT_SECONDS = 10.0
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Callable[[dict], str]
+    params: Callable[[dict], dict] = lambda fixtures: {}
+    body: Optional[Callable[[dict], Any]] = None
+    ok_status: tuple = (200,)
+    requires: tuple = ()  # fixtures that must be present, else the scenario is skipped
+    # Sends the request itself instead of the client, for responses the client cannot buffer
+    call: Optional[Callable[[httpx.AsyncClient, str, dict], Awaitable[httpx.Response]]] = None
+
+
+SCENARIOS: List[Scenario] = [
+    # Health
+    Scenario("health", "GET", lambda fx: "/health"),
+    Scenario("health_ready", "GET", lambda fx: "/health/ready"),
+    # Auth
+    Scenario(
+        "auth_login", "POST", lambda fx: "/auth/login",
+        body=lambda fx: {"email": BENCHMARK_EMAIL, "password": BENCHMARK_PASSWORD},
+    ),
+    # Overview
+    Scenario("overview", "GET", lambda fx: "/overview"),
+    Scenario("overview_health_score", "GET", lambda fx: "/overview/health-score"),
+    Scenario("overview_stats", "GET", lambda fx: "/overview/stats"),
+    # Platforms
+    Scenario("platforms_list", "GET", lambda fx: "/platforms"),
+    Scenario("platform_get", "GET", lambda fx: f"/platforms/{fx['platform_code']}"),
+    Scenario("platform_services", "GET", lambda fx: f"/platforms/{fx['platform_code']}/services"),
+    Scenario(
+        "platforms_bulk_upsert", "POST", lambda fx: "/platforms/bulk",
+        body=lambda fx: {"items": fx["platforms"]}, requires=("platforms",),
+    ),
+    # Services
+    Scenario("services_list", "GET", lambda fx: "/services", lambda fx: {"limit": 500}),
+    Scenario(
+        "services_list_by_platform", "GET", lambda fx: "/services",
+        lambda fx: {"platform_id": fx["platform_id"], "limit": 500},
+    ),
+    Scenario("service_get", "GET", lambda fx: f"/services/{fx['service_id']}"),
+    Scenario(
+        "services_bulk_upsert", "POST", lambda fx: "/services/bulk",
+        body=lambda fx: {"items": fx["services"]}, requires=("services",),
+    ),
+    # Logs
+    Scenario("logs_ingest", "POST", lambda fx: "/logs/ingest", body=lambda fx: log_batch(fx), ok_status=(202,)),
+    Scenario("logs_patterns", "GET", lambda fx: "/logs/patterns", lambda fx: {"minutes": 60}),
+    Scenario("logs_search_hot", "GET", lambda fx: "/logs/search", lambda fx: {"service_id": fx["service_id"]}),
+    Scenario(
+        "logs_search_cold", "GET", lambda fx: "/logs/search",
+        lambda fx: {"start": "2000-01-01T00:00:00Z", "level": "error", "q": "timeout"},
+    ),
+    Scenario("logs_tail", "GET", lambda fx: "/logs/tail", call=lambda client, url, fx: tail_round_trip(client, url, fx)),
+    # Metrics
+    Scenario(
+        "metrics_ingest", "POST", lambda fx: "/metrics/ingest", body=lambda fx: metric_batch(fx), ok_status=(202,)
+    ),
+    Scenario(
+        "metrics_query_raw", "GET", lambda fx: "/metrics/query_range",
+        lambda fx: {"name": "process_resident_memory_bytes", "service_id": fx["service_id"]},
+    ),
+    Scenario(
+        "metrics_query_sum_rate", "GET", lambda fx: "/metrics/query_range",
+        lambda fx: {"name": "http_requests_total", "function": "rate", "aggregation": "sum", "by": "service_id"},
+    ),
+    Scenario(
+        "metrics_p99_by_platform_30d", "GET", lambda fx: "/metrics/histogram_quantile",
+        lambda fx: {"name": "http_request_duration_ms", "by": "platform_id", "start": days_ago(30)},
+    ),
+    Scenario(
+        "metrics_promql_sum_rate", "GET", lambda fx: "/metrics/query",
+        lambda fx: {
+            "query": "sum by (service_id) (rate(http_requests_total[5m]))", "start": days_ago(1), "step": 300,
+        },
+    ),
+    Scenario("metrics_cardinality", "GET", lambda fx: "/metrics/cardinality", lambda fx: {"limit": 50}),
+    # Traces
+    Scenario("traces_ingest", "POST", lambda fx: "/traces/ingest", body=lambda fx: span_batch(fx), ok_status=(202,)),
+    Scenario("trace_get", "GET", lambda fx: f"/traces/{fx['trace_id']}", requires=("trace_id",)),
+    Scenario("trace_logs", "GET", lambda fx: f"/traces/{fx['trace_id']}/logs", requires=("trace_id",)),
+    Scenario("trace_analysis", "GET", lambda fx: f"/traces/{fx['trace_id']}/analysis", requires=("trace_id",)),
+    Scenario(
+        "traces_endpoint_analysis", "GET", lambda fx: "/traces/analysis",
+        lambda fx: {"endpoint": fx["trace_endpoint"], "minutes": 10080}, requires=("trace_endpoint",),
+    ),
+    # Incidents
+    Scenario("incidents_list", "GET", lambda fx: "/incidents"),
+    Scenario("incident_get", "GET", lambda fx: f"/incidents/{fx['incident_id']}", requires=("incident_id",)),
+    Scenario(
+        "incident_timeline", "GET", lambda fx: f"/incidents/{fx['incident_id']}/timeline", requires=("incident_id",)
+    ),
+    Scenario(
+        "incident_timeline_append", "POST", lambda fx: f"/incidents/{fx['incident_id']}/timeline",
+        body=lambda fx: {"action": "benchmark", "note": "Appended by the endpoint benchmark"},
+        ok_status=(201,), requires=("incident_id",),
+    ),
+]
+
+
+def days_ago(days: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+
+LOG_MESSAGES = [
+    "request completed method=GET path=/api/v1/payments status={} duration={}ms",
+    "payment {} authorized amount={} currency=EUR",
+    "slow query took {} ms on table ledger attempt={}",
+    "upstream payments-api returned status {} after {} ms",
+]
+
+
+def log_batch(fixtures: dict, size: int = 200) -> dict:
+    now = datetime.utcnow().isoformat()
+    return {
+        "entries": [
+            {
+                "timestamp": now,
+                "platform_id": fixtures["platform_id"],
+                "service_id": fixtures["service_id"],
+                "level": "error" if i % 10 == 0 else "info",
+                "message": LOG_MESSAGES[i % len(LOG_MESSAGES)].format(i * 7 % 500, i),
+            }
+            for i in range(size)
+        ]
+    }
+
+
+HISTOGRAM_BOUNDS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+def metric_batch(fixtures: dict, size: int = 200) -> dict:
+    """Counters, gauges and histograms over a fixed label set, a few with exemplars."""
+    now = datetime.utcnow().isoformat()
+    series = {"platform_id": fixtures["platform_id"], "service_id": fixtures["service_id"]}
+    samples, histograms = [], []
+    for i in range(size):
+        labels = {"method": ("GET", "POST")[i % 2], "status": ("200", "404", "500")[i % 3], "instance": str(i % 20)}
+        samples.append({
+            **series, "name": "http_requests_total", "metric_type": "counter",
+            "timestamp": now, "value": float(i * 13), "labels": labels,
+        })
+        samples.append({
+            **series, "name": "process_resident_memory_bytes",
+            "timestamp": now, "value": float(200_000_000 + i * 4096), "labels": {"instance": labels["instance"]},
+        })
+        if i % 4 == 0:
+            histograms.append({
+                **series, "name": "http_request_duration_ms", "timestamp": now, "labels": labels,
+                "bounds": HISTOGRAM_BOUNDS, "counts": [(i + j) % 7 for j in range(len(HISTOGRAM_BOUNDS) + 1)],
+                "sum": float(i * 31),
+                "exemplars": [{"trace_id": uuid.uuid4().hex, "value": float(i % 900)}] if i % 20 == 0 else [],
+            })
+    return {"samples": samples, "histograms": histograms}
+
+
+SPAN_NAMES = ["GET /api/v1/payments", "SELECT ledger", "POST /authorize", "publish payment.settled"]
+
+
+def span_batch(fixtures: dict, traces: int = 20, spans_per_trace: int = 10) -> dict:
+    """Complete traces with fresh ids, so each request buffers new work for the assembler."""
+    start = datetime.utcnow()
+    spans = []
+    for t in range(traces):
+        trace_id = uuid.uuid4().hex
+        for s in range(spans_per_trace):
+            offset = timedelta(milliseconds=s * 3)
+            spans.append({
+                "trace_id": trace_id,
+                "span_id": f"{s:016x}",
+                "parent_span_id": f"{s - 1:016x}" if s else None,
+                "platform_id": fixtures["platform_id"],
+                "service_id": fixtures["service_id"],
+                "start_time": (start + offset).isoformat(),
+                "end_time": (start + offset + timedelta(milliseconds=40 - s * 3)).isoformat(),
+                "name": SPAN_NAMES[s % len(SPAN_NAMES)],
+                "kind": "server" if s == 0 else "client",
+                "status": "error" if t % 10 == 0 and s == spans_per_trace - 1 else "ok",
+                "attributes": {"http.status_code": 200, "attempt": s},
+            })
+    return {"spans": spans}
+
+
+async def tail_round_trip(client: httpx.AsyncClient, url: str, fixtures: dict) -> httpx.Response:
+    """Open a live tail, ingest one line it matches and wait for that line on the stream.
+
+    The ASGI client buffers whole responses and a tail never ends, so the app is
+    driven directly and the stream is disconnected once the line arrives.
+    """
+    token = uuid.uuid4().hex
+    delivered = asyncio.Event()
+    requested = False
+    status = None
+    ingest: Optional[asyncio.Task] = None
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await delivered.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, ingest
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            if status == 200:  # subscribed
+                batch = log_batch(fixtures, size=1)
+                batch["entries"][0]["message"] = f"benchmark tail probe {token}"
+                ingest = asyncio.create_task(client.post(settings.API_PREFIX + "/logs/ingest", json=batch))
+        elif message["type"] == "http.response.body" and token.encode() in message.get("body", b""):
+            delivered.set()
+
+    path = url.encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": url,
+        "raw_path": path,
+        "root_path": "",
+        "query_string": urlencode({"q": token}).encode(),
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    try:
+        await asyncio.wait_for(app(scope, receive, send), TAIL_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        status = 504
+    if ingest is not None:
+        ingested = await ingest
+        if ingested.status_code != 202:
+            return ingested
+    return httpx.Response(status or 500)
+
+
+@dataclass
+class QueryCounter:
+    """Counts statements sent to the database by the app's engines."""
+
+    count: int = 0
+    engines: list = field(default_factory=list)
+
+    def attach(self, *engines):
+        for async_engine in engines:
+            event.listen(async_engine.sync_engine, "before_cursor_execute", self._on_execute)
+            self.engines.append(async_engine)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+def _upsert_items(rows, fields) -> List[dict]:
+    """Inventory rows as bulk upsert items; NULL columns fall back to the schema defaults."""
+    items = []
+    for row in rows:
+        item = {name: value for name, value in zip(fields, row) if value is not None}
+        if "platform_id" in item:
+            item["platform_id"] = str(item["platform_id"])
+        items.append(item)
+    return items
+
+
+async def load_fixtures() -> dict:
+    """Pick ids from the loaded dataset for parameterised routes, and create the benchmark user."""
+    async with engine.connect() as conn:
+        row = (await conn.execute(text(
+            "SELECT p.id, p.code, s.id FROM platforms p JOIN services s ON s.platform_id = p.id "
+            "ORDER BY p.code, s.slug LIMIT 1"
+        ))).first()
+        if row is None:
+            raise SystemExit("No platforms/services found. Seed the database first (scripts/seed.py --scale).")
+        trace = (await conn.execute(text(
+            "SELECT trace_id, root_span_name FROM traces ORDER BY start_time DESC LIMIT 1"
+        ))).first()
+        incident_id = (await conn.execute(text(
+            "SELECT id FROM incidents ORDER BY started_at DESC LIMIT 1"
+        ))).scalar()
+
+        # Upserting the current inventory leaves it unchanged
+        platform_fields = list(PlatformCreate.model_fields)
+        platforms = (await conn.execute(
+            select(*(Platform.__table__.c[name] for name in platform_fields)).where(Platform.is_active.is_(True))
+        )).all()
+        service_fields = list(ServiceCreate.model_fields)
+        services = (await conn.execute(
+            select(*(Service.__table__.c[name] for name in service_fields)).where(Service.platform_id == row[0])
+        )).all()
+
+    hashed = await hash_password(BENCHMARK_PASSWORD)
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(User)
+            .values(email=BENCHMARK_EMAIL, hashed_password=hashed, name="Benchmark", role="viewer")
+            .on_conflict_do_update(index_elements=[User.email], set_={"hashed_password": hashed, "is_active": True})
+        )
+
+    return {
+        "platform_id": str(row[0]),
+        "platform_code": row[1],
+        "service_id": str(row[2]),
+        "trace_id": trace[0] if trace else None,
+        "trace_endpoint": trace[1] if trace else None,
+        "incident_id": str(incident_id) if incident_id else None,
+        "platforms": _upsert_items(platforms, platform_fields),
+        "services": _upsert_items(services, service_fields),
+    }
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    fixtures: dict,
+    counter: QueryCounter,
+    requests: int,
+    concurrency: int,
+    warmup: int,
+) -> Dict[str, Any]:
+    url = settings.API_PREFIX + scenario.path(fixtures)
+    params = scenario.params(fixtures)
+
+    async def send():
+        if scenario.call:
+            return await scenario.call(client, url, fixtures)
+        body = scenario.body(fixtures) if scenario.body else None
+        return await client.request(scenario.method, url, params=params, json=body)
+
+    for _ in range(warmup):
+        await send()
+
+    # Measure statements for a single request in isolation
+    before = counter.count
+    probe = await send()
+    queries_per_request = counter.count - before
+    latencies: List[float] = []
+    errors = 0
+    if probe.status_code not in scenario.ok_status:
+        print(f"  ! {scenario.name}: {probe.status_code} {probe.text[:200]}", file=sys.stderr)
+        errors += 1
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await send()
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code not in scenario.ok_status:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "queries_per_request": queries_per_request,
+    }
+
+
+def failures(results: dict) -> List[str]:
+    """Return a description of every scenario with requests answered by an unexpected status."""
+    return [
+        f"{name}.errors: {stats['errors']} of {stats['requests']} requests"
+        for name, stats in results["scenarios"].items()
+        if stats["errors"]
+    ]
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Return a description of every metric that regressed beyond the threshold."""
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        current = results["scenarios"].get(name)
+        if current is None:
+            continue
+        if current["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}.errors: {base.get('errors', 0)} -> {current['errors']}")
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[metric] and current[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{name}.{metric}: {base[metric]} -> {current[metric]}")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}.throughput_rps: {base['throughput_rps']} -> {current['throughput_rps']}")
+        if current["queries_per_request"] > base["queries_per_request"]:
+            regressions.append(
+                f"{name}.queries_per_request: {base['queries_per_request']} -> {current['queries_per_request']}"
+            )
+    return regressions
+
+
+async def run(args) -> dict:
+    # A single benchmark client would be throttled like any other
+    settings.RATE_LIMIT_ENABLED = False
+    counter = QueryCounter()
+    counter.attach(*{engine, read_engine, ingest_engine, background_engine})
+
+    selected = [s for s in SCENARIOS if not args.only or s.name in args.only]
+    results = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "scenarios": {},
+    }
+
+    async with app.router.lifespan_context(app):
+        fixtures = await load_fixtures()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for scenario in selected:
+                missing = [key for key in scenario.requires if not fixtures.get(key)]
+                if missing:
+                    print(f"{scenario.name:32} skipped: no {', '.join(missing)} in the dataset")
+                    continue
+                stats = await run_scenario(
+                    client, scenario, fixtures, counter, args.requests, args.concurrency, args.warmup
+                )
+                results["scenarios"][scenario.name] = stats
+                print(
+                    f"{scenario.name:32} p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+                    f"p99={stats['p99_ms']:>9.2f}ms {stats['throughput_rps']:>9.1f} req/s "
+                    f"queries={stats['queries_per_request']} errors={stats['errors']}"
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark INFRA Observatory API endpoints.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--only", nargs="+", help="run only these scenarios")
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true", help="write results to the baseline file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    failed = failures(results)
+    if failed:
+        print(f"{len(failed)} scenario(s) answered with errors:")
+        for failure in failed:
+            print(f"  {failure}")
+        sys.exit(1)
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline updated at {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; record one with --update-baseline.")
+        return
+
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
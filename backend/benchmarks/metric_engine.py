@@ -0,0 +1,121 @@
+"""
+Micro-benchmark for the vectorized metric engine.
+
+Evaluates queries over synthetic counters in memory, without a database, so
+the numbers isolate the engine itself. From ``backend/``:
+
+    python -m benchmarks.metric_engine --series 10000 --services 50
+
+The run exits with status 1 when ``sum by (service_id) (rate(...[5m]))``
+takes longer than ``--budget-ms`` at the median.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from app.services import metric_engine as engine
+
+MINUTE_MS = 60_000
+
+
+def synthetic_counters(series: int, services: int, hours: float, scrape_seconds: int, seed: int) -> engine.SeriesSet:
+    """Monotonic counters with jittered scrapes and occasional resets."""
+    rng = np.random.default_rng(seed)
+    samples = int(hours * 3600 / scrape_seconds)
+    scrape_ms = scrape_seconds * 1000
+    base = np.arange(samples, dtype=np.int64) * scrape_ms
+
+    timestamps = base[None, :] + rng.integers(0, scrape_ms // 10, size=(series, samples))
+    increments = rng.gamma(2.0, 5.0, size=(series, samples))
+    values = np.cumsum(increments, axis=1)
+    resets = rng.random(series) < 0.05
+    reset_at = rng.integers(1, samples, size=series)
+    for row in np.flatnonzero(resets):
+        values[row, reset_at[row]:] -= values[row, reset_at[row] - 1]
+
+    labels = [
+        {
+            "__name__": "http_requests_total",
+            "service_id": f"service-{i % services}",
+            "route": f"/api/v1/r{i // services % 20}",
+            "status": ("200", "404", "500")[i % 3],
+            "instance": str(i),
+        }
+        for i in range(series)
+    ]
+    offsets = np.arange(series + 1, dtype=np.int64) * samples
+    return engine.SeriesSet(labels, timestamps.ravel(), values.ravel(), offsets)
+
+
+def time_case(fn: Callable, repeat: int) -> Dict[str, float]:
+    fn()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "min_ms": round(timings[0], 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "max_ms": round(timings[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized metric engine.")
+    parser.add_argument("--series", type=int, default=10_000)
+    parser.add_argument("--services", type=int, default=50)
+    parser.add_argument("--hours", type=float, default=1.0, help="query range")
+    parser.add_argument("--scrape-seconds", type=int, default=15)
+    parser.add_argument("--step-seconds", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="median budget for sum by rate")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    data = synthetic_counters(args.series, args.services, args.hours, args.scrape_seconds, args.seed)
+    end = int(args.hours * 3600 * 1000)
+    steps = engine.step_times(5 * MINUTE_MS, end, args.step_seconds * 1000)
+    window = 5 * MINUTE_MS
+
+    cases: Dict[str, Callable] = {
+        "rate": lambda: engine.rate(data, steps, window),
+        "increase": lambda: engine.increase(data, steps, window),
+        "avg_over_time": lambda: engine.avg_over_time(data, steps, window),
+        "max_over_time": lambda: engine.max_over_time(data, steps, window),
+        "sum_by_service_rate": lambda: engine.aggregate(engine.rate(data, steps, window), "sum", by=["service_id"]),
+        "avg_by_service_rate": lambda: engine.aggregate(engine.rate(data, steps, window), "avg", by=["service_id"]),
+        "p99_by_service_rate": lambda: engine.aggregate(
+            engine.rate(data, steps, window), "quantile", by=["service_id"], param=0.99
+        ),
+    }
+
+    print(f"{len(data)} series, {data.values.size} samples, {steps.size} steps")
+    results: Dict[str, Dict[str, float]] = {}
+    for name, fn in cases.items():
+        results[name] = stats = time_case(fn, args.repeat)
+        print(f"{name:24} p50={stats['p50_ms']:>9.2f}ms min={stats['min_ms']:>9.2f}ms max={stats['max_ms']:>9.2f}ms")
+
+    if args.output:
+        args.output.write_text(json.dumps({"args": vars(args) | {"output": str(args.output)}, "cases": results}, indent=2))
+
+    failures: List[str] = []
+    if results["sum_by_service_rate"]["p50_ms"] > args.budget_ms:
+        failures.append(f"sum_by_service_rate p50 {results['sum_by_service_rate']['p50_ms']}ms > {args.budget_ms}ms")
+    if failures:
+        print("Over budget:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
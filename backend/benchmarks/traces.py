@@ -0,0 +1,99 @@
+"""
+Benchmark for opening large traces from their packed spans.
+
+Builds a synthetic batch-job trace of ``--spans`` spans (a root fanning out to
+workers, each with a few nested calls), packs it, then times decoding the blob
+plus building the span tree, in memory and on one core. From ``backend/``:
+
+    python -m benchmarks.traces --spans 10000
+
+The run exits with status 1 when the median open time exceeds ``--max-ms``.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import orjson
+
+from app.services import span_codec
+
+
+def synthetic_trace(count: int, rng: random.Random) -> list:
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    spans = [{
+        "span_id": "0" * 16, "parent_span_id": None, "service_id": None,
+        "start_time": start, "end_time": start + timedelta(minutes=10),
+        "name": "batch.run", "kind": "internal", "status": "ok", "status_message": None,
+        "attributes": {"job.name": "nightly-export", "job.shard_count": count // 10},
+        "events": [], "links": [],
+    }]
+    parents = [spans[0]["span_id"]]
+    for i in range(1, count):
+        parent = parents[0] if i % 10 == 1 else rng.choice(parents[-10:])
+        begin = start + timedelta(milliseconds=rng.randint(0, 590_000))
+        span_id = f"{i:016x}"
+        spans.append({
+            "span_id": span_id, "parent_span_id": parent, "service_id": None,
+            "start_time": begin, "end_time": begin + timedelta(milliseconds=rng.randint(1, 10_000)),
+            "name": rng.choice(["shard.process", "db.query", "s3.put", "http.request"]),
+            "kind": "client", "status": "error" if rng.random() < 0.01 else "ok", "status_message": None,
+            "attributes": {"db.system": "postgresql", "shard.id": i // 10, "net.peer.name": "db-primary"},
+            "events": [], "links": [],
+        })
+        parents.append(span_id)
+    return spans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark opening packed traces.")
+    parser.add_argument("--spans", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-ms", type=float, default=200.0, help="median decode + tree time")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    spans = synthetic_trace(args.spans, random.Random(args.seed))
+    started = time.perf_counter()
+    blob = span_codec.encode(spans)
+    encode_ms = (time.perf_counter() - started) * 1000
+    json_bytes = len(orjson.dumps(spans))
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        tree = span_codec.build_tree(span_codec.decode(blob))
+        timings.append((time.perf_counter() - started) * 1000)
+    assert len(tree) == args.spans
+
+    results = {
+        "spans": args.spans,
+        "blob_bytes": len(blob),
+        "json_bytes": json_bytes,
+        "bytes_per_span": round(len(blob) / args.spans, 1),
+        "encode_ms": round(encode_ms, 1),
+        "open_ms_median": round(statistics.median(timings), 1),
+        "open_ms_max": round(max(timings), 1),
+    }
+    print(
+        f"{results['spans']} spans: {results['blob_bytes']:,} B packed ({results['bytes_per_span']} B/span, "
+        f"{results['json_bytes']:,} B as JSON), encode {results['encode_ms']} ms, "
+        f"open {results['open_ms_median']} ms median / {results['open_ms_max']} ms max"
+    )
+
+    if args.output:
+        args.output.write_text(json.dumps({"args": vars(args) | {"output": str(args.output)}, "results": results}, indent=2))
+
+    if results["open_ms_median"] > args.max_ms:
+        print(f"Above target: {results['open_ms_median']} ms > {args.max_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import pytest
+
+from app.services import gorilla
+
+
+def _edges():
+    for _, _, bits in gorilla._DOD_BUCKETS:
+        limit = 1 << (bits - 1)
+        yield from (-limit - 1, -limit, -limit + 1, limit - 1, limit, limit + 1)
+
+
+@pytest.mark.parametrize("dod", sorted(set(_edges())))
+def test_timestamps_round_trip_at_bucket_edges(dod):
+    # The second delta differs from the first by exactly ``dod``; the rest are regular
+    timestamps = [1_700_000_000_000, 1_700_000_010_000]
+    for delta in (10_000 + dod, 10_000, 10_000):
+        timestamps.append(timestamps[-1] + delta)
+    values = [float(i) for i in range(len(timestamps))]
+
+    decoded_ts, decoded_values = gorilla.decode(gorilla.encode(timestamps, values), len(timestamps))
+
+    assert decoded_ts.tolist() == timestamps
+    assert decoded_values.tolist() == values
+
+
+@pytest.mark.parametrize("timestamps", [[0, 1000, 2064, 3064], [0, 10, 2068, 30]])
+def test_timestamps_round_trip_after_edge_value(timestamps):
+    decoded_ts, _ = gorilla.decode(gorilla.encode(timestamps, [1.0] * 4), 4)
+
+    assert decoded_ts.tolist() == timestamps